@@ -9,8 +9,16 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=[
-        'Django>=3.2',
+        'Django>=4.1',
     ],
+    extras_require={
+        # Faster JSON encoding and brotli compression for streamed GeoJSON
+        'fast': ['orjson', 'brotli'],
+        # Coin matrices, coin statistics and hotspot analysis
+        'analysis': ['numpy', 'scipy'],
+        # Parquet exports
+        'parquet': ['pyarrow'],
+    },
     classifiers=[
         'Framework :: Django',
         'Programming Language :: Python :: 3',
@@ -1,12 +1,16 @@
 from django import forms
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.http import StreamingHttpResponse
 import nested_admin
 from .models import (
     SurveyQuestionOption, ScenarioQuestionOption, PlanningUnitQuestionOption, 
     Survey, Scenario, SurveyQuestion, ScenarioQuestion, PlanningUnitQuestion, 
-    SurveyResponse, SurveyLayerGroup, SurveyLayerOrder, PlanningUnitFamily,
+    SurveyResponse, SurveyLayerGroup, SurveyLayerOrder, PlanningUnitFamily, annotate_response_progress,
+    clone_survey,
 )
+from .exports import export_survey_responses
 from .forms import PlanningUnitFamilyForm, SurveyLayerOrderForm
+from .geojson import buffer_chunks
 
 class SurveyQuestionOptionsInline(nested_admin.NestedTabularInline):
     model = SurveyQuestionOption
@@ -71,25 +75,144 @@ class SurveyForm(forms.ModelForm):
             'groups': admin.widgets.FilteredSelectMultiple('Groups', is_stacked=False),
         }
 
+def make_export_responses_action(format, layout, description):
+    def export_responses(modeladmin, request, queryset):
+        if queryset.count() != 1:
+            modeladmin.message_user(request, 'Select a single survey to export.', level=messages.ERROR)
+            return None
+        survey = queryset.first()
+        content_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(
+            buffer_chunks(export_survey_responses(survey, format=format, layout=layout)),
+            content_type='{}; charset=utf-8'.format(content_type)
+        )
+        response['Content-Disposition'] = 'attachment; filename="survey_{}_responses_{}.{}"'.format(survey.pk, layout, format)
+        return response
+
+    export_responses.__name__ = 'export_responses_{}_{}'.format(layout, format)
+    export_responses.short_description = description
+    return export_responses
+
+def clone_surveys(modeladmin, request, queryset):
+    for survey in queryset:
+        clone_survey(survey)
+    modeladmin.message_user(request, 'Cloned {} survey(s).'.format(len(queryset)), level=messages.SUCCESS)
+
+clone_surveys.short_description = 'Clone selected surveys (without responses)'
+
 class SurveyAdmin(nested_admin.NestedModelAdmin):
     list_display = ('title', 'description', 'created_at', 'updated_at')
     search_fields = ('name', 'description')
     ordering = ('-created_at',)
     inlines = [LayerGroupsInline, SurveyQuestionsInline, ScenarioInline]
     form = SurveyForm
+    actions = [
+        make_export_responses_action('csv', 'long', 'Export responses as CSV (one row per answer)'),
+        make_export_responses_action('csv', 'wide', 'Export responses as CSV (one row per respondent)'),
+        make_export_responses_action('jsonl', 'long', 'Export responses as JSON Lines'),
+        clone_surveys,
+    ]
+
+class ResponseCompletedListFilter(admin.SimpleListFilter):
+    title = 'completed'
+    parameter_name = 'completed'
+
+    def lookups(self, request, model_admin):
+        return (('yes', 'Yes'), ('no', 'No'))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(is_complete=True)
+        if self.value() == 'no':
+            return queryset.filter(is_complete=False)
+        return queryset
+
+class ResponseAreasSelectedListFilter(admin.SimpleListFilter):
+    title = 'areas selected'
+    parameter_name = 'areas_selected'
+
+    def lookups(self, request, model_admin):
+        return (('none', 'None'), ('any', 'At least one'))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'none':
+            return queryset.filter(areas_selected=0)
+        if self.value() == 'any':
+            return queryset.filter(areas_selected__gt=0)
+        return queryset
+
+class ResponseScenarioListFilter(admin.SimpleListFilter):
+    # Choosing a scenario also narrows the progress columns to it (see SurveyResponseAdmin.get_queryset)
+    title = 'scenario'
+    parameter_name = 'scenario'
+
+    def lookups(self, request, model_admin):
+        scenarios = Scenario.objects.select_related('survey').order_by('survey__title', 'order', 'pk')
+        return [(scenario.pk, '{}: {}'.format(scenario.survey.title, scenario.name)) for scenario in scenarios]
+
+    def queryset(self, request, queryset):
+        scenario_id = get_progress_scenario_id(request)
+        if scenario_id is not None:
+            return queryset.filter(survey__scenarios_survey=scenario_id)
+        return queryset
+
+def get_progress_scenario_id(request):
+    try:
+        return int(request.GET.get(ResponseScenarioListFilter.parameter_name, ''))
+    except ValueError:
+        return None
+
+class SurveyResponseAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'survey', 'submitted_at', 'updated_at', 'is_complete', 'areas_selected', 'coins_used')
+    list_select_related = ('user', 'survey')
+    list_filter = (
+        'survey', ResponseScenarioListFilter, ResponseCompletedListFilter, ResponseAreasSelectedListFilter,
+        'submitted_at',
+    )
+    search_fields = ('user__username', 'user__email', 'survey__title')
+    ordering = ('-updated_at',)
+    raw_id_fields = ('user',)
+
+    def get_queryset(self, request):
+        # Completion and totals come from the list query itself rather than per-row lookups
+        return annotate_response_progress(super().get_queryset(request), get_progress_scenario_id(request))
+
+    @admin.display(description='Completed', boolean=True, ordering='is_complete')
+    def is_complete(self, obj):
+        return obj.is_complete
+
+    @admin.display(description='Areas selected', ordering='areas_selected')
+    def areas_selected(self, obj):
+        return obj.areas_selected
+
+    @admin.display(description='Coins used', ordering='coins_used')
+    def coins_used(self, obj):
+        return obj.coins_used
 
 class PlanningUnitFamilyAdmin(admin.ModelAdmin):
-    list_display = ('name', 'description')
+    list_display = ('name', 'description', 'planning_unit_count', 'vertex_count', 'import_version', 'last_import_duration')
     search_fields = ('name', 'description')
     form = PlanningUnitFamilyForm
+    stats_fields = ('extent_bounds', 'vertex_count', 'import_version', 'last_import_duration', 'stats_updated_at')
 
     def get_fields(self, request, obj=None):
         if obj:
-            fields = ('name', 'description', 'planning_units_count')
+            fields = ('name', 'description', 'planning_units_count') + self.stats_fields
         else:
             fields = ('name', 'description', 'planning_units')
         return fields
 
+    def get_readonly_fields(self, request, obj=None):
+        if obj:
+            return self.stats_fields
+        return ()
+
+    @admin.display(description='Extent')
+    def extent_bounds(self, obj):
+        if obj.extent is None:
+            return '-'
+        return '({:.2f}, {:.2f}) to ({:.2f}, {:.2f})'.format(*obj.extent.extent)
+
     def save_model(self, request, obj, form, change):
         if not obj.pk:
             # this gets saved during the clean method because we need to detect if/when there is an issue running the import script
@@ -109,6 +232,6 @@ class PlanningUnitFamilyAdmin(admin.ModelAdmin):
 # admin.site.register(Survey)
 # admin.site.register(QuestionSurveyAssociation)
 admin.site.register(PlanningUnitFamily, PlanningUnitFamilyAdmin)
-admin.site.register(SurveyResponse)
+admin.site.register(SurveyResponse, SurveyResponseAdmin)
 
 admin.site.register(Survey, SurveyAdmin)
@@ -0,0 +1,230 @@
+"""
+Portable survey definition bundles: a survey's scenarios, questions, options
+and layer groups as one JSON document, referring to layers and planning unit
+families by name so the bundle can be loaded into another deployment. The
+planning units themselves can be included as base64-encoded WKB. Access
+groups and responses are not part of a bundle.
+"""
+import base64
+import time
+from datetime import timedelta
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.db.models.functions import AsWKB
+from django.contrib.gis.geos import GEOSGeometry
+from django.db import transaction
+from django.utils import timezone
+from layers.models import Layer
+
+from .models import (
+    PlanningUnit, PlanningUnitFamily, PlanningUnitQuestion, PlanningUnitQuestionOption, Scenario,
+    ScenarioQuestion, ScenarioQuestionOption, Survey, SurveyLayerGroup, SurveyLayerOrder, SurveyQuestion,
+    SurveyQuestionOption, bulk_create_rows,
+)
+
+BUNDLE_FORMAT = 'mp-survey-bundle'
+BUNDLE_VERSION = 1
+BUNDLE_CHUNK_SIZE = 2000
+
+# Bundle key, model and the lookup from its rows to the survey
+BUNDLE_TABLES = [
+    ('scenarios', Scenario, 'survey'),
+    ('survey_questions', SurveyQuestion, 'survey'),
+    ('scenario_questions', ScenarioQuestion, 'scenario__survey'),
+    ('planning_unit_questions', PlanningUnitQuestion, 'scenario__survey'),
+    ('survey_question_options', SurveyQuestionOption, 'question__survey'),
+    ('scenario_question_options', ScenarioQuestionOption, 'question__scenario__survey'),
+    ('planning_unit_question_options', PlanningUnitQuestionOption, 'question__scenario__survey'),
+    ('layer_groups', SurveyLayerGroup, 'survey'),
+    ('layer_orders', SurveyLayerOrder, 'layer_group__survey'),
+]
+
+class BundleError(Exception):
+    """Raised when a bundle cannot be loaded into this deployment."""
+
+def get_bundle_fields(model):
+    # Timestamps are set afresh where the bundle is loaded
+    return [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key and not getattr(field, 'auto_now', False) and not getattr(field, 'auto_now_add', False)
+    ]
+
+def encode_value(field, value):
+    if value is not None and isinstance(field, GeometryField):
+        return base64.b64encode(bytes(value.ewkb)).decode('ascii')
+    return value
+
+def decode_value(field, value):
+    if value is None:
+        return None
+    if isinstance(field, GeometryField):
+        return GEOSGeometry(memoryview(base64.b64decode(value)))
+    return field.to_python(value)
+
+def get_bundle_rows(model, queryset):
+    fields = get_bundle_fields(model)
+    return [
+        dict(
+            {field.attname: encode_value(field, row[field.attname]) for field in fields},
+            pk=row['pk']
+        )
+        for row in queryset.order_by('pk').values('pk', *[field.attname for field in fields])
+    ]
+
+def decode_rows(model, rows):
+    fields = {field.attname: field for field in get_bundle_fields(model)}
+    return [
+        dict(
+            {name: decode_value(fields[name], value) for name, value in row.items() if name in fields},
+            pk=row['pk']
+        )
+        for row in rows
+    ]
+
+def export_survey_bundle(survey, include_geometries=False):
+    """
+    Return the survey's definition as a JSON-serialisable bundle. Layers and
+    planning unit families are referenced by name; with include_geometries
+    the families' planning units are added as base64 WKB.
+    """
+    bundle = {
+        'format': BUNDLE_FORMAT,
+        'version': BUNDLE_VERSION,
+        'exported_at': timezone.now(),
+        'survey': get_bundle_rows(Survey, Survey.objects.filter(pk=survey.pk))[0],
+    }
+    for key, model, survey_field in BUNDLE_TABLES:
+        bundle[key] = get_bundle_rows(model, model.objects.filter(**{survey_field: survey}))
+
+    layer_ids = {row['layer_id'] for row in bundle['layer_orders']}
+    bundle['layers'] = [
+        {'pk': layer.pk, 'name': layer.name, 'slug_name': layer.slug_name}
+        for layer in Layer.all_objects.filter(pk__in=layer_ids).order_by('pk')
+    ]
+
+    bundle['planning_unit_families'] = []
+    family_ids = {row['pu_family_id'] for row in bundle['scenarios'] if row['pu_family_id'] is not None}
+    srid = PlanningUnit._meta.get_field('geometry').srid
+    for family in PlanningUnitFamily.objects.filter(pk__in=family_ids).order_by('pk'):
+        family_bundle = {
+            'pk': family.pk,
+            'name': family.name,
+            'description': family.description,
+            'remote_raster': family.remote_raster,
+        }
+        if include_geometries:
+            geometries = PlanningUnit.objects.filter(family=family).order_by('pk').annotate(
+                wkb=AsWKB('geometry')
+            ).values_list('wkb', flat=True)
+            family_bundle['srid'] = srid
+            family_bundle['planning_units'] = [
+                base64.b64encode(bytes(wkb)).decode('ascii') if wkb is not None else None
+                for wkb in geometries.iterator(chunk_size=BUNDLE_CHUNK_SIZE)
+            ]
+        bundle['planning_unit_families'].append(family_bundle)
+    return bundle
+
+def import_family(family_bundle):
+    """Create a planning unit family and its units from a bundle, with bulk inserts."""
+    started_at = time.monotonic()
+    family = PlanningUnitFamily.objects.create(
+        name=family_bundle['name'],
+        description=family_bundle['description'],
+        remote_raster=family_bundle['remote_raster']
+    )
+    units = PlanningUnit.objects.bulk_create([
+        PlanningUnit(geometry=GEOSGeometry(memoryview(base64.b64decode(wkb)), srid=family_bundle['srid']) if wkb else None)
+        for wkb in family_bundle['planning_units']
+    ], batch_size=BUNDLE_CHUNK_SIZE)
+    through = PlanningUnit.family.through
+    through.objects.bulk_create([
+        through(planningunit_id=unit.pk, planningunitfamily_id=family.pk) for unit in units
+    ], batch_size=BUNDLE_CHUNK_SIZE)
+    family.refresh_stats(import_duration=timedelta(seconds=time.monotonic() - started_at))
+    return family
+
+def resolve_families(bundle, skip_missing):
+    """
+    Map the bundle's family IDs to families here: an existing family with
+    the same name, or one created from the bundle's planning units.
+    """
+    family_ids = {}
+    missing = []
+    for family_bundle in bundle['planning_unit_families']:
+        family = PlanningUnitFamily.objects.filter(name=family_bundle['name']).order_by('pk').first()
+        if family is None and 'planning_units' in family_bundle:
+            family = import_family(family_bundle)
+        if family is None:
+            missing.append(family_bundle['name'])
+            continue
+        family_ids[family_bundle['pk']] = family.pk
+    if missing and not skip_missing:
+        raise BundleError('Planning unit families not found: {}'.format(', '.join(missing)))
+    return family_ids
+
+def resolve_layers(bundle, skip_missing):
+    """Map the bundle's layer IDs to the layers here with the same name."""
+    names = {layer['name'] for layer in bundle['layers']}
+    layer_ids_by_name = {}
+    # Where names repeat, the oldest layer wins
+    for pk, name in Layer.all_objects.filter(name__in=names).order_by('-pk').values_list('pk', 'name'):
+        layer_ids_by_name[name] = pk
+    missing = sorted(names - set(layer_ids_by_name))
+    if missing and not skip_missing:
+        raise BundleError('Layers not found: {}'.format(', '.join(missing)))
+    return {
+        layer['pk']: layer_ids_by_name[layer['name']]
+        for layer in bundle['layers'] if layer['name'] in layer_ids_by_name
+    }
+
+def import_survey_bundle(bundle, title=None, skip_missing=False):
+    """
+    Create a survey from a bundle in one transaction, with one bulk INSERT
+    per table and the bundle's IDs remapped to the new rows. Raises
+    BundleError if a layer or family cannot be found, unless skip_missing
+    is set, in which case those references are dropped. Returns the survey.
+    """
+    if bundle.get('format') != BUNDLE_FORMAT:
+        raise BundleError('Not a survey bundle.')
+    if bundle.get('version') != BUNDLE_VERSION:
+        raise BundleError('Unsupported survey bundle version: {}'.format(bundle.get('version')))
+
+    with transaction.atomic():
+        family_ids = resolve_families(bundle, skip_missing)
+        layer_ids = resolve_layers(bundle, skip_missing)
+
+        values = {'title': title} if title is not None else {}
+        survey_ids = bulk_create_rows(Survey, decode_rows(Survey, [bundle['survey']]), values=values)
+        scenarios = decode_rows(Scenario, bundle['scenarios'])
+        for scenario in scenarios:
+            if scenario['pu_family_id'] not in family_ids:
+                scenario['pu_family_id'] = None
+        scenario_ids = bulk_create_rows(Scenario, scenarios, {'survey_id': survey_ids, 'pu_family_id': family_ids})
+
+        question_ids = {
+            SurveyQuestion: bulk_create_rows(
+                SurveyQuestion, decode_rows(SurveyQuestion, bundle['survey_questions']), {'survey_id': survey_ids}
+            ),
+            ScenarioQuestion: bulk_create_rows(
+                ScenarioQuestion, decode_rows(ScenarioQuestion, bundle['scenario_questions']), {'scenario_id': scenario_ids}
+            ),
+            PlanningUnitQuestion: bulk_create_rows(
+                PlanningUnitQuestion, decode_rows(PlanningUnitQuestion, bundle['planning_unit_questions']),
+                {'scenario_id': scenario_ids}
+            ),
+        }
+        for key, model, question_model in [
+            ('survey_question_options', SurveyQuestionOption, SurveyQuestion),
+            ('scenario_question_options', ScenarioQuestionOption, ScenarioQuestion),
+            ('planning_unit_question_options', PlanningUnitQuestionOption, PlanningUnitQuestion),
+        ]:
+            bulk_create_rows(model, decode_rows(model, bundle[key]), {'question_id': question_ids[question_model]})
+
+        layer_group_ids = bulk_create_rows(
+            SurveyLayerGroup, decode_rows(SurveyLayerGroup, bundle['layer_groups']), {'survey_id': survey_ids}
+        )
+        bulk_create_rows(
+            SurveyLayerOrder,
+            [row for row in decode_rows(SurveyLayerOrder, bundle['layer_orders']) if row['layer_id'] in layer_ids],
+            {'layer_group_id': layer_group_ids, 'layer_id': layer_ids}
+        )
+    return Survey.objects.get(pk=survey_ids[bundle['survey']['pk']])
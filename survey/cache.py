@@ -0,0 +1,70 @@
+"""
+Cache keys for the survey views and the helpers that invalidate them. Kept
+apart from the views so the signal receivers can clear entries without
+importing the view layer.
+"""
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+SURVEY_SCHEMA_CACHE_TIMEOUT = getattr(settings, 'SURVEY_SCHEMA_CACHE_TIMEOUT', 60*60)
+SURVEY_LAYER_GROUPS_CACHE_TIMEOUT = getattr(settings, 'SURVEY_LAYER_GROUPS_CACHE_TIMEOUT', 60*60*24)
+SURVEY_ACCESS_CACHE_TIMEOUT = getattr(settings, 'SURVEY_ACCESS_CACHE_TIMEOUT', 60*15)
+
+def get_survey_schema(survey):
+    # The schema version changes whenever the survey is edited, so stale entries simply expire
+    cache_key = 'survey_schema_{}_{}'.format(survey.pk, survey.get_schema_version())
+    return cache.get_or_set(cache_key, survey.get_schema, SURVEY_SCHEMA_CACHE_TIMEOUT)
+
+def get_response_access_cache_key(user_id, response_id):
+    return 'survey_access_{}_{}'.format(user_id, response_id)
+
+def get_user_access_version_key(user_id):
+    return 'survey_access_user_version_{}'.format(user_id)
+
+def get_survey_access_version_key(survey_id):
+    return 'survey_access_survey_version_{}'.format(survey_id)
+
+def get_access_versions(user_id, survey_id):
+    """
+    Return the current (user, survey) versions an access record was built
+    against. A record whose versions no longer match is rebuilt.
+    """
+    keys = [get_user_access_version_key(user_id), get_survey_access_version_key(survey_id)]
+    versions = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return tuple(versions[key] for key in keys)
+
+def clear_user_access_cache(user_ids):
+    # Membership changes: drop the users' access records for every survey
+    cache.set_many({get_user_access_version_key(user_id): uuid.uuid4().hex for user_id in user_ids}, None)
+
+def clear_survey_access_cache(survey_ids):
+    # Survey, scenario and group edits: drop every user's access records for the surveys
+    cache.set_many({get_survey_access_version_key(survey_id): uuid.uuid4().hex for survey_id in survey_ids}, None)
+
+def clear_response_access_cache(user_id, response_id):
+    cache.delete(get_response_access_cache_key(user_id, response_id))
+
+def get_survey_layer_groups_version_key(survey_id):
+    return 'survey_layer_groups_version_{}'.format(survey_id)
+
+def get_survey_layer_groups_version(survey_id):
+    """
+    When the survey's layer picker last changed. Losing the entry only
+    starts a newer version, so cached copies are never served stale.
+    """
+    return cache.get_or_set(get_survey_layer_groups_version_key(survey_id), timezone.now, None)
+
+def get_survey_layer_groups_cache_key(survey_id):
+    version = get_survey_layer_groups_version(survey_id)
+    return 'survey_layer_groups_{}_{}'.format(survey_id, int(version.timestamp() * 1000000))
+
+def clear_survey_layer_groups_cache(survey_ids):
+    # A new version moves the cached layer picker and the survey ETags on
+    now = timezone.now()
+    cache.set_many({get_survey_layer_groups_version_key(survey_id): now for survey_id in survey_ids}, None)
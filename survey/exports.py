@@ -0,0 +1,238 @@
+"""
+Streaming exports of a survey's responses to CSV or JSON Lines. Answers are
+read with server-side cursors in response order, so memory use stays flat no
+matter how many answer rows a survey has.
+"""
+import csv
+from itertools import groupby
+from operator import itemgetter
+from django.db.models import Count, Sum
+
+from .geojson import dumps
+from .models import (
+    CoinAssignment, PlanningUnitAnswer, ScenarioAnswer, SurveyAnswer, SurveyResponse,
+    get_compact_answer_value,
+)
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_LAYOUTS = ('long', 'wide')
+EXPORT_CHUNK_SIZE = 2000
+
+LONG_COLUMNS = [
+    'response_id', 'user_id', 'username', 'submitted_at', 'answer_type', 'scenario_id',
+    'planning_unit_id', 'question_id', 'field_name', 'text_answer', 'numeric_answer',
+    'other_text_answer', 'selected_option_ids', 'selected_option_texts', 'coins_assigned',
+]
+WIDE_RESPONSE_COLUMNS = ['response_id', 'user_id', 'username', 'submitted_at', 'updated_at']
+ANSWER_FIELDS = ('text_answer', 'numeric_answer', 'selected_options', 'other_text_answer')
+
+class Echo:
+    """File-like object whose write() returns the line, for streaming csv.writer output."""
+    def write(self, value):
+        return value
+
+class ResponseRows:
+    """
+    Walk rows ordered by response ID (their first value) in step with the
+    responses, handing back each response's rows in turn.
+    """
+    def __init__(self, rows):
+        self.groups = groupby(rows, key=itemgetter(0))
+        self.current = next(self.groups, None)
+
+    def pop(self, response_id):
+        while self.current is not None and self.current[0] < response_id:
+            self.current = next(self.groups, None)
+        if self.current is None or self.current[0] != response_id:
+            return []
+        rows = list(self.current[1])
+        self.current = next(self.groups, None)
+        return rows
+
+def get_option_values(selected_options):
+    selected_options = selected_options or []
+    return (
+        [option['option_id'] for option in selected_options],
+        [option['text'] for option in selected_options]
+    )
+
+def iter_long_rows(survey, schema, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield one dict per answer or coin assignment in the survey."""
+    field_names = {('survey', question['id']): question['field_name'] for question in schema['questions']}
+    for scenario in schema['scenarios']:
+        for question in scenario['questions']:
+            field_names[('scenario', question['id'])] = question['field_name']
+        for question in scenario['planning_unit_questions']:
+            field_names[('planning_unit', question['id'])] = question['field_name']
+
+    response_fields = ('response_id', 'response__user_id', 'response__user__username', 'response__submitted_at')
+    answer_tables = [
+        ('survey', SurveyAnswer.objects.filter(response__survey=survey), ()),
+        ('scenario', ScenarioAnswer.objects.filter(response__survey=survey), ('question__scenario_id',)),
+        ('planning_unit', PlanningUnitAnswer.objects.filter(response__survey=survey), ('question__scenario_id', 'planning_unit_id')),
+    ]
+    for answer_type, answers, location_fields in answer_tables:
+        rows = answers.order_by('response_id', 'pk').values_list(
+            *response_fields, 'question_id', *ANSWER_FIELDS, *location_fields
+        )
+        for values in rows.iterator(chunk_size=chunk_size):
+            response_id, user_id, username, submitted_at, question_id, text_answer, numeric_answer, selected_options, other_text_answer = values[:9]
+            scenario_id, unit_id = (values[9:] + (None, None))[:2]
+            option_ids, option_texts = get_option_values(selected_options)
+            yield {
+                'response_id': response_id,
+                'user_id': user_id,
+                'username': username,
+                'submitted_at': submitted_at,
+                'answer_type': answer_type,
+                'scenario_id': scenario_id,
+                'planning_unit_id': unit_id,
+                'question_id': question_id,
+                'field_name': field_names.get((answer_type, question_id)),
+                'text_answer': text_answer,
+                'numeric_answer': numeric_answer,
+                'other_text_answer': other_text_answer,
+                'selected_option_ids': option_ids,
+                'selected_option_texts': option_texts,
+                'coins_assigned': None,
+            }
+
+    coins = CoinAssignment.objects.filter(response__survey=survey).order_by('response_id', 'pk').values_list(
+        *response_fields, 'scenario_id', 'planning_unit_id', 'coins_assigned'
+    )
+    for response_id, user_id, username, submitted_at, scenario_id, unit_id, coins_assigned in coins.iterator(chunk_size=chunk_size):
+        yield {
+            'response_id': response_id,
+            'user_id': user_id,
+            'username': username,
+            'submitted_at': submitted_at,
+            'answer_type': 'coins',
+            'scenario_id': scenario_id,
+            'planning_unit_id': unit_id,
+            'question_id': None,
+            'field_name': None,
+            'text_answer': None,
+            'numeric_answer': None,
+            'other_text_answer': None,
+            'selected_option_ids': [],
+            'selected_option_texts': [],
+            'coins_assigned': coins_assigned,
+        }
+
+def get_question_columns(question):
+    # Each option of a choice question becomes its own 0/1 column
+    if question['choices'] is not None:
+        return [
+            ('{}_option_{}'.format(question['field_name'], option_id), question, option_id)
+            for option_id, text in question['choices']
+        ]
+    return [(question['field_name'], question, None)]
+
+def get_wide_columns(schema):
+    """
+    Return the wide layout's columns as (name, question schema, option ID)
+    tuples; per-scenario totals use the question slot for their kind.
+    """
+    columns = [(name, None, None) for name in WIDE_RESPONSE_COLUMNS]
+    for question in schema['questions']:
+        columns += get_question_columns(question)
+    for scenario in schema['scenarios']:
+        for question in scenario['questions']:
+            columns += get_question_columns(question)
+        columns.append(('scenario_{}_areas_selected'.format(scenario['id']), 'areas_selected', scenario['id']))
+        columns.append(('scenario_{}_coins_assigned'.format(scenario['id']), 'coins_assigned', scenario['id']))
+    return columns
+
+def iter_wide_rows(survey, schema, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield one dict per respondent with their survey and scenario answers and
+    per-scenario coin totals. Per-unit answers are only in the long layout.
+    """
+    columns = get_wide_columns(schema)
+    questions = {question['id']: question for question in schema['questions']}
+    scenario_questions = {
+        question['id']: question for scenario in schema['scenarios'] for question in scenario['questions']
+    }
+
+    responses = SurveyResponse.objects.filter(survey=survey).order_by('pk').values_list(
+        'pk', 'user_id', 'user__username', 'submitted_at', 'updated_at'
+    )
+    survey_answers = ResponseRows(
+        SurveyAnswer.objects.filter(response__survey=survey).order_by('response_id', 'pk').values_list(
+            'response_id', 'question_id', *ANSWER_FIELDS
+        ).iterator(chunk_size=chunk_size)
+    )
+    scenario_answers = ResponseRows(
+        ScenarioAnswer.objects.filter(response__survey=survey).order_by('response_id', 'pk').values_list(
+            'response_id', 'question_id', *ANSWER_FIELDS
+        ).iterator(chunk_size=chunk_size)
+    )
+    coin_totals = ResponseRows(
+        CoinAssignment.objects.filter(response__survey=survey).values_list('response_id', 'scenario_id').annotate(
+            areas_selected=Count('pk'),
+            coins_assigned=Sum('coins_assigned')
+        ).order_by('response_id', 'scenario_id').iterator(chunk_size=chunk_size)
+    )
+
+    for response in responses.iterator(chunk_size=chunk_size):
+        response_id = response[0]
+        values = {}
+        for answers, answer_questions in ((survey_answers, questions), (scenario_answers, scenario_questions)):
+            for _, question_id, text_answer, numeric_answer, selected_options, other_text_answer in answers.pop(response_id):
+                question = answer_questions.get(question_id)
+                if question is not None:
+                    values[question['field_name']] = get_compact_answer_value(
+                        question['question_type'], text_answer, numeric_answer, selected_options, other_text_answer
+                    )
+        totals = {
+            scenario_id: {'areas_selected': areas_selected, 'coins_assigned': coins_assigned}
+            for _, scenario_id, areas_selected, coins_assigned in coin_totals.pop(response_id)
+        }
+
+        row = dict(zip(WIDE_RESPONSE_COLUMNS, response))
+        for name, question, key in columns[len(WIDE_RESPONSE_COLUMNS):]:
+            if question in ('areas_selected', 'coins_assigned'):
+                row[name] = totals.get(key, {}).get(question, 0)
+            elif key is not None:
+                selected = values.get(question['field_name'])
+                row[name] = None if selected is None else int(key in selected)
+            else:
+                row[name] = values.get(question['field_name'])
+        yield row
+
+def get_export_columns(schema, layout):
+    if layout == 'wide':
+        return [name for name, question, key in get_wide_columns(schema)]
+    return list(LONG_COLUMNS)
+
+def iter_csv_lines(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([
+            ';'.join(str(item) for item in value) if isinstance(value, list) else value
+            for value in (row[column] for column in columns)
+        ])
+
+def iter_jsonl_lines(rows):
+    for row in rows:
+        yield dumps(row) + '\n'
+
+def export_survey_responses(survey, format='csv', layout='long', chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the survey's responses as lines of CSV or JSON Lines text, either
+    one row per answer ('long') or one row per respondent ('wide').
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError('Unknown export format: {}'.format(format))
+    if layout not in EXPORT_LAYOUTS:
+        raise ValueError('Unknown export layout: {}'.format(layout))
+
+    schema = survey.get_schema()
+    if layout == 'wide':
+        rows = iter_wide_rows(survey, schema, chunk_size)
+    else:
+        rows = iter_long_rows(survey, schema, chunk_size)
+    if format == 'jsonl':
+        return iter_jsonl_lines(rows)
+    return iter_csv_lines(get_export_columns(schema, layout), rows)
@@ -1,6 +1,7 @@
 from dal import autocomplete
 from django import forms
-from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
 from django.forms import ModelForm, Form
 from tempfile import NamedTemporaryFile
 from django.core.management import call_command
@@ -10,7 +11,9 @@ from .models import (
     SurveyResponse, SurveyQuestion, SurveyAnswer, SurveyQuestionOption,
     PlanningUnitQuestion, ScenarioAnswer, ScenarioQuestionOption, 
     PlanningUnitAnswer, PlanningUnitQuestionOption, CoinAssignment, 
-    PlanningUnit, PlanningUnitFamily, SurveyLayerOrder,
+    PlanningUnitFamily, SurveyLayerOrder,
+    get_invalid_planning_unit_ids, parse_planning_unit_ids, upsert_planning_unit_answers,
+    upsert_coin_assignments,
 )
 
 def populate_question_fields(instance, question, field_name, initial_answer=None):
@@ -89,32 +92,48 @@ def populate_question_fields(instance, question, field_name, initial_answer=None
             
     # return fields
 
-def save_related_answer(question, answer, answer_value, choiceModel):
+def get_related_answer_values(question, answer_value, choiceModel):
+    """
+    Translate a cleaned form value into the Answer field values it should be
+    stored as, without saving anything.
+    """
+    values = {}
     # Handle different data types
     if question.question_type == 'text':
-        answer.text_answer = answer_value
+        values['text_answer'] = answer_value
     elif question.question_type == 'number':
-        answer.numeric_answer = int(answer_value)
-        answer.text_answer = str(answer_value)
+        values['numeric_answer'] = int(answer_value)
+        values['text_answer'] = str(answer_value)
     elif question.question_type == 'single_choice':
         # answer_value is the option_id
         answer_choice = choiceModel.objects.filter(id=answer_value, question=question).first()
         if answer_choice:
-            answer.selected_options = [{"option_id": answer_choice.id, "text": answer_choice.text}]
-            answer.text_answer = answer_choice.text
+            values['selected_options'] = [{"option_id": answer_choice.id, "text": answer_choice.text}]
+            values['selected_option_ids'] = [answer_choice.id]
+            values['text_answer'] = answer_choice.text
     elif question.question_type == 'multiple_choice':
         # answer_value is a list of option_ids
-        answer.selected_options = []
-        for option_id in answer_value:
-            answer_choice = choiceModel.objects.filter(id=int(option_id), question=question).first()
-            if answer_choice:
-                answer.selected_options.append({"option_id": answer_choice.id, "text": answer_choice.text})
+        option_ids = [int(option_id) for option_id in answer_value]
+        answer_choices = {
+            choice.id: choice for choice in choiceModel.objects.filter(id__in=option_ids, question=question)
+        }
+        values['selected_options'] = [
+            {"option_id": answer_choices[option_id].id, "text": answer_choices[option_id].text}
+            for option_id in option_ids if option_id in answer_choices
+        ]
+        values['selected_option_ids'] = [option['option_id'] for option in values['selected_options']]
     # elif question.question_type == 'boolean':
     #     answer_value = str(answer_value)
     # elif question.question_type == 'date':
     #     if answer_value:
     #         answer_value = answer_value.isoformat()
 
+    return values
+
+def save_related_answer(question, answer, answer_value, choiceModel):
+    for field_name, value in get_related_answer_values(question, answer_value, choiceModel).items():
+        setattr(answer, field_name, value)
+
     answer.save()
 
 class SurveyResponseForm(ModelForm):
@@ -154,7 +173,8 @@ class SurveyResponseForm(ModelForm):
             field_name = f'question_{question.id}'
             if field_name in self.cleaned_data:
                 answer_value = self.cleaned_data[field_name]
-                answer, created = SurveyAnswer.objects.get_or_create(
+                # Saved once by save_related_answer, so the question summary is refreshed once
+                answer = SurveyAnswer.objects.filter(response=survey_response, question=question).first() or SurveyAnswer(
                     response=survey_response,
                     question=question,
                 )
@@ -202,7 +222,8 @@ class ScenarioForm(Form):
             field_name = f'scenario_{scenario.id}_question_{question.id}'
             if field_name in self.cleaned_data:
                 answer_value = self.cleaned_data[field_name]
-                answer, created = ScenarioAnswer.objects.get_or_create(
+                # Saved once by save_related_answer, so the question summary is refreshed once
+                answer = ScenarioAnswer.objects.filter(response=response, question=question).first() or ScenarioAnswer(
                     response=response,
                     question=question,
                 )
@@ -225,10 +246,15 @@ class PlanningUnitForm(Form):
         response = kwargs.pop('response', None)
         unit_id = kwargs.pop('unit_id', None)
         super().__init__(*args, **kwargs)
+        self.scenario = scenario
+        self.response = response
+        self.planning_unit_ids = None
+        self.available_coins = None
         
         if scenario:
             if scenario.is_weighted:
                 available_coins = response.scenario_status(scenario.id)['coins_available']
+                self.available_coins = available_coins
                 allocated_coins = 0
                 if unit_id is not None:
                     existing_assignment = CoinAssignment.objects.filter(
@@ -241,7 +267,7 @@ class PlanningUnitForm(Form):
                 self.fields['scenario_{}_coin_assignment'.format(scenario.id)] = forms.IntegerField(
                     label='Assign Coins (Available: {})'.format(available_coins),
                     min_value=0,
-                    max_value=available_coins+allocated_coins,
+                    # The limit depends on how many units are selected, so clean() checks it
                     initial=allocated_coins
                 )
 
@@ -262,41 +288,74 @@ class PlanningUnitForm(Form):
 
                 populate_question_fields(self, question, field_name, initial_answer)
 
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.scenario is None:
+            return cleaned_data
+
+        pu_field_name = f'scenario_{self.scenario.id}_planning_unit_ids'
+        if pu_field_name not in cleaned_data:
+            return cleaned_data
+        try:
+            unit_ids = parse_planning_unit_ids(cleaned_data[pu_field_name])
+        except ValueError:
+            self.add_error(pu_field_name, 'Planning unit IDs must be a comma-separated list of integers.')
+            return cleaned_data
+        if len(unit_ids) == 0:
+            self.add_error(pu_field_name, 'At least one planning unit must be selected.')
+            return cleaned_data
+
+        # Validate every selected unit against the scenario's family in a single query
+        missing_ids = get_invalid_planning_unit_ids(self.scenario, unit_ids)
+        if missing_ids:
+            self.add_error(pu_field_name, 'Planning units not found in this scenario: {}'.format(
+                ', '.join(str(unit_id) for unit_id in missing_ids)
+            ))
+            return cleaned_data
+
+        # The coin value is given to every selected unit, replacing what those units held
+        coin_field_name = f'scenario_{self.scenario.id}_coin_assignment'
+        coins = cleaned_data.get(coin_field_name)
+        if coins is not None and self.available_coins is not None:
+            reassigned_coins = CoinAssignment.objects.filter(
+                response=self.response,
+                scenario=self.scenario,
+                planning_unit_id__in=unit_ids
+            ).aggregate(total=Sum('coins_assigned'))['total'] or 0
+            if coins * len(unit_ids) > self.available_coins + reassigned_coins:
+                self.add_error(coin_field_name, '{} coins for each of {} planning units exceeds the {} coins available.'.format(
+                    coins, len(unit_ids), self.available_coins + reassigned_coins
+                ))
+                return cleaned_data
+
+        self.planning_unit_ids = unit_ids
+        return cleaned_data
+
     def save_answers(self, response, scenario):
         """
-        Save the form data as PlanningUnitAnswer objects
+        Save the form data as PlanningUnitAnswer objects and CoinAssignments
+        for every selected planning unit, in bulk.
         """
         # Save planning unit questions
         pu_questions = PlanningUnitQuestion.objects.filter(scenario=scenario)
 
         pu_field_name = f'scenario_{scenario.id}_planning_unit_ids'
-        selected_planning_units = [PlanningUnit.objects.get(pk=x) for x in self.cleaned_data[pu_field_name].split(',')]
-        
-        for question in pu_questions:
-            field_name = f'scenario_{scenario.id}_pu_question_{question.id}'
-            if field_name in self.cleaned_data:
-                answer_value = self.cleaned_data[field_name]
+        unit_ids = self.planning_unit_ids
+        if unit_ids is None:
+            unit_ids = parse_planning_unit_ids(self.cleaned_data[pu_field_name])
 
-                for pu in selected_planning_units:
-                    answer, created = PlanningUnitAnswer.objects.get_or_create(
-                        response=response,
-                        question=question,
-                        planning_unit=pu
-                    )
+        with transaction.atomic():
+            for question in pu_questions:
+                field_name = f'scenario_{scenario.id}_pu_question_{question.id}'
+                if field_name in self.cleaned_data:
+                    answer_value = self.cleaned_data[field_name]
+                    answer_values = get_related_answer_values(question, answer_value, PlanningUnitQuestionOption)
+                    upsert_planning_unit_answers(response, question, unit_ids, answer_values)
 
-                    save_related_answer(question, answer, answer_value, PlanningUnitQuestionOption)
-        # Update/Create CoinAssignments
-        for pu in selected_planning_units:
+            # Update/Create CoinAssignments
             coin_field_name = f'scenario_{scenario.id}_coin_assignment'
             if coin_field_name in self.cleaned_data:
-                coins_assigned = self.cleaned_data[coin_field_name]
-                coin_assignment, created = CoinAssignment.objects.get_or_create(
-                    response=response,
-                    scenario=scenario,
-                    planning_unit=pu
-                )
-                coin_assignment.coins_assigned = coins_assigned
-                coin_assignment.save()
+                upsert_coin_assignments(response, scenario, unit_ids, self.cleaned_data[coin_field_name])
 
         return response
     
@@ -320,7 +379,8 @@ class PlanningUnitFamilyForm(ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.instance.pk:
-            planning_unit_count = self.instance.planning_units_family.count()
+            # Stored at import time, so rendering the form does not scan the units
+            planning_unit_count = self.instance.planning_unit_count
             self.fields['planning_units_count'] = forms.CharField(
                 label='Planning Units Count',
                 required=False,
@@ -353,15 +413,15 @@ class PlanningUnitFamilyForm(ModelForm):
 class SurveyLayerOrderForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        ordered_layers = cache.get('all_layers_qs')
-        if not ordered_layers:
-            ordered_layers = Layer.all_objects.all().order_by('name')
-            cache.set('all_layers_qs', ordered_layers, 60*60)  # Cache for 1 hour
-        self.fields['layer'].queryset = ordered_layers
+        # Only the selected layer is rendered; other layers are searched through the autocomplete view
+        if self.is_bound:
+            self.fields['layer'].queryset = Layer.all_objects.all()
+        elif self.instance.layer_id is not None:
+            self.fields['layer'].queryset = Layer.all_objects.filter(pk=self.instance.layer_id)
 
     layer = forms.ModelChoiceField(
-        queryset=None,
-        widget=autocomplete.ModelSelect2()
+        queryset=Layer.all_objects.none(),
+        widget=autocomplete.ModelSelect2(url='survey:layer_autocomplete')
     )
 
     class Meta:
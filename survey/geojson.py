@@ -0,0 +1,96 @@
+"""
+Helpers for streaming GeoJSON feature collections whose geometries have
+already been serialised by the database (ST_AsGeoJSON), so they are spliced
+into the output as-is instead of being parsed and re-encoded in Python.
+"""
+import json
+import re
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+re_accepts_brotli = re.compile(r'\bbr\b')
+re_accepts_gzip = re.compile(r'\bgzip\b')
+
+def dumps(obj):
+    """Serialise obj to a JSON string, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(obj, cls=DjangoJSONEncoder)
+
+def get_feature(geometry_json, properties):
+    return '{{"type": "Feature", "geometry": {}, "properties": {}}}'.format(
+        geometry_json or 'null',
+        dumps(properties)
+    )
+
+def iter_feature_collection(payload, key, features):
+    """
+    Yield `payload` as a JSON object with a GeoJSON FeatureCollection of the
+    pre-serialised `features` strings under `key`.
+    """
+    payload_json = dumps(payload)
+    if payload_json == '{}':
+        yield '{{{}: {{"type": "FeatureCollection", "features": ['.format(dumps(key))
+    else:
+        yield '{}, {}: {{"type": "FeatureCollection", "features": ['.format(payload_json[:-1], dumps(key))
+    for index, feature in enumerate(features):
+        yield feature if index == 0 else ',' + feature
+    yield ']}}'
+
+def buffer_chunks(chunks, size=STREAM_CHUNK_SIZE):
+    # Per-feature chunks are tiny; group them so each write (and compressor call) is worthwhile
+    buffer = []
+    buffered = 0
+    for chunk in chunks:
+        chunk = chunk.encode('utf-8')
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield b''.join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield b''.join(buffer)
+
+def brotli_sequence(chunks):
+    compressor = brotli.Compressor()
+    for chunk in chunks:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+def feature_collection_response(request, payload, key, features, status=200):
+    """
+    Stream `payload` with a feature collection under `key`, compressed with
+    brotli or gzip when the client accepts it.
+    """
+    chunks = buffer_chunks(iter_feature_collection(payload, key, features))
+    accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    content_encoding = None
+    if brotli is not None and re_accepts_brotli.search(accept_encoding):
+        chunks = brotli_sequence(chunks)
+        content_encoding = 'br'
+    elif re_accepts_gzip.search(accept_encoding):
+        chunks = compress_sequence(chunks)
+        content_encoding = 'gzip'
+
+    response = StreamingHttpResponse(chunks, content_type='application/json', status=status)
+    if content_encoding is not None:
+        response['Content-Encoding'] = content_encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from survey.hotspots import refresh_scenario_hotspots
+from survey.models import Scenario
+
+
+class Command(BaseCommand):
+    help = (
+        "Computes Getis-Ord Gi* and local Moran's I of each planning unit's coin total over its family's "
+        "neighbour graph, and stores the z-scores and p-values for mapping."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenario",
+            type=int,
+            action="append",
+            dest="scenario_ids",
+            help="ID of a scenario to analyse. May be given more than once; defaults to every weighted scenario.",
+        )
+        parser.add_argument(
+            "--rebuild-graph",
+            action="store_true",
+            help="Recompute the neighbour graphs even if they are already stored, e.g. after re-importing a family.",
+        )
+
+    def handle(self, *args, **options):
+        if options["scenario_ids"]:
+            scenarios = Scenario.objects.filter(pk__in=options["scenario_ids"])
+        else:
+            scenarios = Scenario.objects.filter(is_weighted=True)
+
+        rebuilt_family_ids = set()
+        for scenario in scenarios.select_related("pu_family").order_by("pk"):
+            if scenario.pu_family_id is None:
+                self.stdout.write(
+                    self.style.WARNING("Skipped scenario '{}': it has no planning unit family.".format(scenario.name))
+                )
+                continue
+            # Scenarios sharing a family only need its graph rebuilt once
+            rebuild_graph = options["rebuild_graph"] and scenario.pu_family_id not in rebuilt_family_ids
+            try:
+                unit_count = refresh_scenario_hotspots(scenario, rebuild_graph=rebuild_graph)
+            except ImportError as e:
+                raise CommandError(str(e))
+            rebuilt_family_ids.add(scenario.pu_family_id)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    "Computed hotspots for scenario '{}' ({} planning units).".format(scenario.name, unit_count)
+                )
+            )
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from survey.models import Scenario
+from survey.stats import (
+    DEFAULT_BOOTSTRAP_SAMPLES, DEFAULT_CONFIDENCE, DEFAULT_PERCENTILE, refresh_scenario_statistics,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Computes coin statistics (per-unit mean, median, percentile, selection share, Gini and bootstrap "
+        "confidence intervals) for weighted scenarios and stores them in the statistics tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenario",
+            type=int,
+            action="append",
+            dest="scenario_ids",
+            help="ID of a scenario to compute. May be given more than once; defaults to every weighted scenario.",
+        )
+        parser.add_argument(
+            "--percentile",
+            type=float,
+            default=DEFAULT_PERCENTILE,
+            help="Percentile of coins to report for each planning unit.",
+        )
+        parser.add_argument(
+            "--bootstrap-samples",
+            type=int,
+            default=DEFAULT_BOOTSTRAP_SAMPLES,
+            help="Number of bootstrap resamples of respondents.",
+        )
+        parser.add_argument(
+            "--confidence",
+            type=float,
+            default=DEFAULT_CONFIDENCE,
+            help="Confidence level of the bootstrap intervals.",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Random seed of the bootstrap, so results can be reproduced.",
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options["percentile"] <= 100:
+            raise CommandError("--percentile must be between 0 and 100.")
+        if not 0 < options["confidence"] < 1:
+            raise CommandError("--confidence must be between 0 and 1.")
+        if options["bootstrap_samples"] < 1:
+            raise CommandError("--bootstrap-samples must be positive.")
+
+        if options["scenario_ids"]:
+            scenarios = Scenario.objects.filter(pk__in=options["scenario_ids"]).order_by("pk")
+        else:
+            scenarios = Scenario.objects.filter(is_weighted=True).order_by("pk")
+
+        for scenario in scenarios:
+            try:
+                statistics = refresh_scenario_statistics(
+                    scenario,
+                    percentile=options["percentile"],
+                    bootstrap_samples=options["bootstrap_samples"],
+                    confidence=options["confidence"],
+                    seed=options["seed"],
+                )
+            except ImportError as e:
+                raise CommandError(str(e))
+            self.stdout.write(
+                self.style.SUCCESS(
+                    "Computed statistics for scenario '{}' ({} respondents, {} planning units).".format(
+                        scenario.name, statistics["respondent_count"], statistics["planning_unit_count"]
+                    )
+                )
+            )
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from survey.matrix import COIN_MATRIX_CHUNK_SIZE, build_coin_matrix, save_coin_matrix
+from survey.models import Scenario
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports a scenario's coin assignments as a sparse respondent x planning unit CSR matrix, "
+        "either as a .npz file or as a directory of memory-mappable .npy arrays."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "scenario_id",
+            type=int,
+            help="ID of the scenario to export.",
+        )
+        parser.add_argument(
+            "output",
+            type=str,
+            help="Path ending in .npz for a single file, otherwise a directory of .npy arrays.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=COIN_MATRIX_CHUNK_SIZE,
+            help="Number of coin assignments fetched from the database at a time.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            scenario = Scenario.objects.get(pk=options["scenario_id"])
+        except Scenario.DoesNotExist:
+            raise CommandError("Scenario {} does not exist.".format(options["scenario_id"]))
+
+        try:
+            matrix = build_coin_matrix(scenario, chunk_size=options["chunk_size"])
+            save_coin_matrix(matrix, options["output"])
+        except ImportError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Exported a {} x {} coin matrix ({} assignments) for scenario '{}' to {}".format(
+                    matrix.shape[0], matrix.shape[1], len(matrix.data), scenario.name, options["output"]
+                )
+            )
+        )
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+import gzip
+import json
+
+from survey.bundles import export_survey_bundle
+from survey.models import Survey
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports a survey definition (scenarios, questions, options, layer groups and planning unit "
+        "family references) to a JSON bundle, gzip-compressed when the output ends in .gz."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "survey_id",
+            type=int,
+            help="ID of the survey to export.",
+        )
+        parser.add_argument(
+            "output",
+            type=str,
+            help="Path of the bundle to write, e.g. survey.json or survey.json.gz.",
+        )
+        parser.add_argument(
+            "--geometries",
+            action="store_true",
+            help="Include the planning units of the survey's families, so they can be created where the bundle is imported.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            survey = Survey.objects.get(pk=options["survey_id"])
+        except Survey.DoesNotExist:
+            raise CommandError("Survey {} does not exist.".format(options["survey_id"]))
+
+        bundle = export_survey_bundle(survey, include_geometries=options["geometries"])
+        open_bundle = gzip.open if options["output"].endswith(".gz") else open
+        with open_bundle(options["output"], "wt", encoding="utf-8") as output:
+            json.dump(bundle, output, cls=DjangoJSONEncoder)
+
+        self.stdout.write(self.style.SUCCESS("Exported survey '{}' to {}".format(survey.title, options["output"])))
@@ -0,0 +1,239 @@
+from django.contrib.gis.db.models.functions import AsWKB, Transform
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+import json
+import os
+import shutil
+
+from survey.models import (
+    CoinAssignment, PlanningUnit, PlanningUnitAnswer, ScenarioAnswer, Survey, SurveyAnswer,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    raise CommandError(
+        "pyarrow is required for this command. Please install it using: "
+        "pip install pyarrow"
+    )
+
+# GeoParquet metadata for the planning unit geometries, which are exported in WGS84
+GEOPARQUET_METADATA = {
+    "version": "1.0.0",
+    "primary_column": "geometry",
+    "columns": {
+        "geometry": {
+            "encoding": "WKB",
+            "geometry_types": ["MultiPolygon"],
+        }
+    },
+}
+
+ANSWER_COLUMNS = [
+    ("id", pa.int64()),
+    ("response_id", pa.int64()),
+    ("user_id", pa.int64()),
+    ("question_id", pa.int64()),
+    ("question_type", pa.string()),
+    ("text_answer", pa.string()),
+    ("numeric_answer", pa.float64()),
+    ("other_text_answer", pa.string()),
+    ("selected_option_ids", pa.list_(pa.int64())),
+    ("selected_option_texts", pa.list_(pa.string())),
+]
+ANSWER_FIELDS = [
+    "pk", "response_id", "response__user_id", "question_id", "question__question_type", "text_answer",
+    "numeric_answer", "other_text_answer", "selected_options",
+]
+
+
+def expand_answer_row(row):
+    # selected_options is stored as [{"option_id": ..., "text": ...}]; split it into typed lists
+    selected_options = row[8] or []
+    return row[:8] + (
+        [option["option_id"] for option in selected_options],
+        [option["text"] for option in selected_options],
+    ) + row[9:]
+
+def expand_planning_unit_row(row):
+    pk, family_ids, wkb = row
+    return (pk, family_ids or [], bytes(wkb) if wkb is not None else None)
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports survey answers, coin assignments and planning units to typed Parquet datasets, "
+        "partitioned by survey and scenario, for loading into pandas, DuckDB or Arrow."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "output_dir",
+            type=str,
+            help="Directory to write the datasets to.",
+        )
+        parser.add_argument(
+            "--survey",
+            type=int,
+            action="append",
+            dest="survey_ids",
+            help="ID of a survey to export. May be given more than once; defaults to every survey.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50000,
+            help="Number of rows fetched from the database and written per record batch.",
+        )
+        parser.add_argument(
+            "--overwrite",
+            action="store_true",
+            help="Replace datasets already in the output directory.",
+        )
+
+    def handle(self, *args, **options):
+        output_dir = options["output_dir"]
+        self.batch_size = options["batch_size"]
+
+        surveys = Survey.objects.order_by("pk")
+        if options["survey_ids"]:
+            surveys = surveys.filter(pk__in=options["survey_ids"])
+        surveys = list(surveys)
+        if not surveys:
+            raise CommandError("No surveys to export.")
+        self.survey_schemas = {survey.pk: survey.get_schema() for survey in surveys}
+        survey_ids = list(self.survey_schemas)
+
+        datasets = ["survey_answers", "scenario_answers", "planning_unit_answers", "coin_assignments", "planning_units"]
+        for dataset in datasets:
+            path = os.path.join(output_dir, dataset)
+            if os.path.exists(path):
+                if not options["overwrite"]:
+                    raise CommandError("{} already exists. Use --overwrite to replace it.".format(path))
+                shutil.rmtree(path)
+
+        self._write_dataset(
+            os.path.join(output_dir, "survey_answers"),
+            ANSWER_COLUMNS,
+            ["survey_id"],
+            SurveyAnswer.objects.filter(response__survey_id__in=survey_ids).order_by("response__survey_id", "pk").values_list(
+                "response__survey_id", *ANSWER_FIELDS
+            ),
+            expand_answer_row,
+        )
+        self._write_dataset(
+            os.path.join(output_dir, "scenario_answers"),
+            ANSWER_COLUMNS,
+            ["survey_id", "scenario_id"],
+            ScenarioAnswer.objects.filter(response__survey_id__in=survey_ids).order_by(
+                "response__survey_id", "question__scenario_id", "pk"
+            ).values_list("response__survey_id", "question__scenario_id", *ANSWER_FIELDS),
+            expand_answer_row,
+        )
+        self._write_dataset(
+            os.path.join(output_dir, "planning_unit_answers"),
+            ANSWER_COLUMNS + [("planning_unit_id", pa.int64())],
+            ["survey_id", "scenario_id"],
+            PlanningUnitAnswer.objects.filter(response__survey_id__in=survey_ids).order_by(
+                "response__survey_id", "question__scenario_id", "pk"
+            ).values_list("response__survey_id", "question__scenario_id", *ANSWER_FIELDS, "planning_unit_id"),
+            expand_answer_row,
+        )
+        self._write_dataset(
+            os.path.join(output_dir, "coin_assignments"),
+            [
+                ("id", pa.int64()),
+                ("response_id", pa.int64()),
+                ("user_id", pa.int64()),
+                ("planning_unit_id", pa.int64()),
+                ("coins_assigned", pa.int32()),
+            ],
+            ["survey_id", "scenario_id"],
+            CoinAssignment.objects.filter(response__survey_id__in=survey_ids).order_by(
+                "response__survey_id", "scenario_id", "pk"
+            ).values_list(
+                "response__survey_id", "scenario_id", "pk", "response_id", "response__user_id",
+                "planning_unit_id", "coins_assigned",
+            ),
+        )
+
+        planning_units = PlanningUnit.objects.all()
+        family_ids = set()
+        for schema in self.survey_schemas.values():
+            family_ids.update(scenario["pu_family_id"] for scenario in schema["scenarios"])
+        if None not in family_ids:
+            # Every scenario draws from a family, so only those families' units are needed
+            planning_units = planning_units.filter(
+                pk__in=PlanningUnit.objects.filter(family__pk__in=family_ids).values("pk")
+            )
+        self._write_dataset(
+            os.path.join(output_dir, "planning_units"),
+            [
+                ("id", pa.int64()),
+                ("family_ids", pa.list_(pa.int64())),
+                ("geometry", pa.binary()),
+            ],
+            [],
+            planning_units.annotate(
+                family_ids=ArrayAgg("family__pk", filter=Q(family__isnull=False), ordering="family__pk"),
+                wkb=AsWKB(Transform("geometry", 4326)),
+            ).order_by("pk").values_list("pk", "family_ids", "wkb"),
+            expand_planning_unit_row,
+            metadata={b"geo": json.dumps(GEOPARQUET_METADATA).encode("utf-8")},
+        )
+
+        self.stdout.write(self.style.SUCCESS("Exported {} survey(s) to {}".format(len(surveys), output_dir)))
+
+    def _get_schema(self, columns, partition, metadata=None):
+        metadata = dict(metadata or {})
+        if partition:
+            # Each survey's partition carries its question types and options
+            metadata[b"survey_schema"] = json.dumps(
+                self.survey_schemas[partition[0]], cls=DjangoJSONEncoder, sort_keys=True
+            ).encode("utf-8")
+        return pa.schema([pa.field(name, data_type) for name, data_type in columns], metadata=metadata)
+
+    def _write_batch(self, writer, schema, rows):
+        columns = list(zip(*rows))
+        arrays = [pa.array(values, type=field.type) for field, values in zip(schema, columns)]
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+
+    def _write_dataset(self, path, columns, partition_fields, rows, expand_row=tuple, metadata=None):
+        """
+        Write rows ordered by their leading partition values to a Hive-style
+        partitioned dataset (path/survey_id=1/scenario_id=2/part-0.parquet),
+        one record batch at a time straight from a server-side cursor.
+        """
+        partition_count = len(partition_fields)
+        writer = None
+        schema = None
+        partition = None
+        batch = []
+        for row in rows.iterator(chunk_size=self.batch_size):
+            row_partition = tuple(row[:partition_count])
+            if writer is None or row_partition != partition:
+                if writer is not None:
+                    if batch:
+                        self._write_batch(writer, schema, batch)
+                    writer.close()
+                partition = row_partition
+                batch = []
+                schema = self._get_schema(columns, partition, metadata)
+                partition_dir = os.path.join(
+                    path, *("{}={}".format(field, value) for field, value in zip(partition_fields, partition))
+                )
+                os.makedirs(partition_dir, exist_ok=True)
+                writer = pq.ParquetWriter(
+                    os.path.join(partition_dir, "part-0.parquet"), schema, compression="zstd"
+                )
+            batch.append(expand_row(row[partition_count:]))
+            if len(batch) >= self.batch_size:
+                self._write_batch(writer, schema, batch)
+                batch = []
+        if writer is not None:
+            if batch:
+                self._write_batch(writer, schema, batch)
+            writer.close()
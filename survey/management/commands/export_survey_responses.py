@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from survey.exports import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, EXPORT_LAYOUTS, export_survey_responses
+from survey.models import Survey
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams every response to a survey to CSV or JSON Lines, either one row per answer and coin "
+        "assignment (long) or one row per respondent (wide)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "survey_id",
+            type=int,
+            help="ID of the survey to export.",
+        )
+        parser.add_argument(
+            "--format",
+            choices=EXPORT_FORMATS,
+            default="csv",
+            help="Output format.",
+        )
+        parser.add_argument(
+            "--layout",
+            choices=EXPORT_LAYOUTS,
+            default="long",
+            help="One row per answer (long) or per respondent (wide). Per-unit answers are only in the long layout.",
+        )
+        parser.add_argument(
+            "--output",
+            type=str,
+            help="Path of the file to write. Defaults to standard output.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help="Number of rows fetched from the database at a time.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            survey = Survey.objects.get(pk=options["survey_id"])
+        except Survey.DoesNotExist:
+            raise CommandError("Survey {} does not exist.".format(options["survey_id"]))
+
+        lines = export_survey_responses(
+            survey, format=options["format"], layout=options["layout"], chunk_size=options["chunk_size"]
+        )
+        if options["output"]:
+            with open(options["output"], "w", newline="", encoding="utf-8") as output:
+                output.writelines(lines)
+            self.stdout.write(self.style.SUCCESS("Exported responses of '{}' to {}".format(survey.title, options["output"])))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
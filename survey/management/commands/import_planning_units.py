@@ -2,9 +2,11 @@ from django.conf import settings
 from django.contrib.gis.geos import GEOSGeometry, MultiPolygon
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
+from datetime import timedelta
 import os
 import shutil
 import tempfile
+import time
 import zipfile
 
 from survey.models import PlanningUnitFamily, PlanningUnit
@@ -45,6 +47,7 @@ class Command(BaseCommand):
             raise CommandError(f"Input file does not exist: {input_file}")
 
         # Handle zip files
+        started_at = time.monotonic()
         temp_dir = None
         original_input_file = (
             input_file  # Store original file path for family description
@@ -86,6 +89,7 @@ class Command(BaseCommand):
 
                 self.stdout.write(f"Importing {len(features)} planning units...")
                 created_count = self._import_planning_units(features, family)
+                family.refresh_stats(import_duration=timedelta(seconds=time.monotonic() - started_at))
 
                 self.stdout.write(
                     self.style.SUCCESS(
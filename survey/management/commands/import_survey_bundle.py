@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+import gzip
+import json
+import os
+
+from survey.bundles import BundleError, import_survey_bundle
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates a survey from a bundle written by export_survey_bundle, matching layers and planning "
+        "unit families by name."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "input_file",
+            type=str,
+            help="Path of the bundle (.json or .json.gz).",
+        )
+        parser.add_argument(
+            "--title",
+            type=str,
+            help="Title of the new survey. Defaults to the title in the bundle.",
+        )
+        parser.add_argument(
+            "--skip-missing",
+            action="store_true",
+            help="Drop references to layers and planning unit families that do not exist here instead of failing.",
+        )
+
+    def handle(self, *args, **options):
+        input_file = options["input_file"]
+        if not os.path.exists(input_file):
+            raise CommandError(f"Input file does not exist: {input_file}")
+
+        open_bundle = gzip.open if input_file.endswith(".gz") else open
+        try:
+            with open_bundle(input_file, "rt", encoding="utf-8") as bundle_file:
+                bundle = json.load(bundle_file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read bundle: {str(e)}")
+
+        try:
+            survey = import_survey_bundle(bundle, title=options["title"], skip_missing=options["skip_missing"])
+        except BundleError as e:
+            raise CommandError(f"Import failed: {str(e)}")
+
+        self.stdout.write(self.style.SUCCESS("Imported survey '{}' (ID {})".format(survey.title, survey.pk)))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from survey.models import Scenario, refresh_coin_density
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the materialised coin density of every planning unit from the coin assignments."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenario",
+            type=int,
+            action="append",
+            dest="scenario_ids",
+            help="ID of a scenario to rebuild. May be given more than once; defaults to every scenario.",
+        )
+
+    def handle(self, *args, **options):
+        scenarios = Scenario.objects.order_by("pk")
+        if options["scenario_ids"]:
+            scenarios = scenarios.filter(pk__in=options["scenario_ids"])
+            missing_ids = set(options["scenario_ids"]) - set(scenarios.values_list("pk", flat=True))
+            if missing_ids:
+                raise CommandError(
+                    "Scenario(s) not found: {}".format(", ".join(str(pk) for pk in sorted(missing_ids)))
+                )
+
+        for scenario in scenarios:
+            rows = refresh_coin_density(scenario.pk)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    "Rebuilt coin density for scenario '{}' ({} planning units).".format(scenario.name, rows)
+                )
+            )
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from survey.models import Survey, refresh_survey_question_summaries
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the precomputed answer summaries of every question from the answers."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--survey",
+            type=int,
+            action="append",
+            dest="survey_ids",
+            help="ID of a survey to rebuild. May be given more than once; defaults to every survey.",
+        )
+
+    def handle(self, *args, **options):
+        surveys = Survey.objects.order_by("pk")
+        if options["survey_ids"]:
+            surveys = surveys.filter(pk__in=options["survey_ids"])
+            missing_ids = set(options["survey_ids"]) - set(surveys.values_list("pk", flat=True))
+            if missing_ids:
+                raise CommandError(
+                    "Survey(s) not found: {}".format(", ".join(str(pk) for pk in sorted(missing_ids)))
+                )
+
+        for survey in surveys:
+            rows = refresh_survey_question_summaries(survey)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    "Rebuilt question summaries for survey '{}' ({} rows).".format(survey.title, rows)
+                )
+            )
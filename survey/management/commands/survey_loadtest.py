@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+import time
+import urllib.error
+import urllib.request
+
+
+class Command(BaseCommand):
+    help = (
+        "Fires concurrent GET requests at one or more survey endpoints (e.g. the map-click "
+        "get_area_by_point lookup served by a WSGI and an ASGI server) and reports throughput and latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "urls",
+            nargs="+",
+            type=str,
+            help="Full URLs to request, e.g. http://localhost:8000/survey/scenario/1/get_area_by_point/?x=...&y=...",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=1000,
+            help="Total number of requests to send to each URL.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=100,
+            help="Number of requests in flight at once.",
+        )
+        parser.add_argument(
+            "--session-id",
+            type=str,
+            help="Value of a logged in sessionid cookie, required for endpoints behind login.",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=30,
+            help="Per-request timeout in seconds.",
+        )
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be positive.")
+
+        headers = {}
+        if options["session_id"]:
+            headers["Cookie"] = "sessionid={}".format(options["session_id"])
+
+        for url in options["urls"]:
+            self.stdout.write(self._run(url, headers, options))
+
+    def _request(self, url, headers, timeout):
+        request = urllib.request.Request(url, headers=headers)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except (urllib.error.URLError, OSError):
+            status = None
+        return status, time.perf_counter() - start
+
+    def _run(self, url, headers, options):
+        total = options["requests"]
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            start = time.perf_counter()
+            results = list(executor.map(
+                lambda _: self._request(url, headers, options["timeout"]), range(total)
+            ))
+            elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for status, latency in results)
+        errors = sum(1 for status, latency in results if status is None or status >= 500)
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        return (
+            "{url}\n"
+            "  {total} requests, concurrency {concurrency}, {errors} errors\n"
+            "  {rps:.1f} req/s, latency p50 {p50:.1f}ms, p95 {p95:.1f}ms, p99 {p99:.1f}ms".format(
+                url=url,
+                total=total,
+                concurrency=options["concurrency"],
+                errors=errors,
+                rps=total / elapsed if elapsed else 0,
+                p50=percentile(0.5),
+                p95=percentile(0.95),
+                p99=percentile(0.99),
+            )
+        )
@@ -0,0 +1,140 @@
+"""
+Coin assignments of a scenario as a sparse respondent x planning unit matrix
+in CSR form, built in one ordered scan of the coin assignments and saved
+either as a SciPy-compatible .npz file or as a directory of .npy arrays that
+load memory-mapped, without copying.
+"""
+from array import array
+from collections import namedtuple
+import json
+import os
+
+from .models import CoinAssignment, PlanningUnit
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+COIN_MATRIX_CHUNK_SIZE = 10000
+COIN_MATRIX_ARRAYS = ('data', 'indices', 'indptr', 'response_ids', 'planning_unit_ids')
+
+class CoinMatrix(namedtuple('CoinMatrix', ['scenario_id', 'shape'] + list(COIN_MATRIX_ARRAYS))):
+    """
+    CSR arrays of a scenario's coin assignments: row i holds the coins of
+    response response_ids[i], column j is planning unit planning_unit_ids[j].
+    """
+    __slots__ = ()
+
+    def to_scipy(self):
+        """Wrap the arrays in a scipy.sparse.csr_matrix without copying them."""
+        if sparse is None:
+            raise ImportError('scipy is required to build a sparse matrix. Please install it using: pip install scipy')
+        return sparse.csr_matrix((self.data, self.indices, self.indptr), shape=self.shape, copy=False)
+
+def require_numpy():
+    if np is None:
+        raise ImportError('numpy is required for coin matrices. Please install it using: pip install numpy')
+
+def as_numpy(values, dtype):
+    # Views the typed array's buffer rather than copying it
+    if not values:
+        return np.empty(0, dtype=dtype)
+    return np.frombuffer(values, dtype=dtype)
+
+def build_coin_matrix(scenario, chunk_size=COIN_MATRIX_CHUNK_SIZE):
+    """
+    Build the CoinMatrix of a scenario. Columns are every planning unit of the
+    scenario's family (plus any other unit with coins); rows are the responses
+    with at least one coin assignment, in ID order.
+    """
+    require_numpy()
+    response_ids = array('q')
+    unit_ids = array('q')
+    coins = array('i')
+    indptr = array('q', [0])
+
+    assignments = CoinAssignment.objects.filter(scenario=scenario).order_by(
+        'response_id', 'planning_unit_id'
+    ).values_list('response_id', 'planning_unit_id', 'coins_assigned')
+    for response_id, unit_id, coins_assigned in assignments.iterator(chunk_size=chunk_size):
+        if not response_ids or response_ids[-1] != response_id:
+            if response_ids:
+                indptr.append(len(coins))
+            response_ids.append(response_id)
+        unit_ids.append(unit_id)
+        coins.append(coins_assigned)
+    if response_ids:
+        indptr.append(len(coins))
+
+    unit_ids = as_numpy(unit_ids, np.int64)
+    family_unit_ids = np.empty(0, dtype=np.int64)
+    if scenario.pu_family_id is not None:
+        family_unit_ids = np.fromiter(
+            PlanningUnit.objects.filter(family__pk=scenario.pu_family_id).order_by('pk').values_list('pk', flat=True).iterator(chunk_size=chunk_size),
+            dtype=np.int64
+        )
+    planning_unit_ids = np.union1d(family_unit_ids, unit_ids)
+    index_dtype = np.int32 if len(planning_unit_ids) < 2 ** 31 else np.int64
+
+    return CoinMatrix(
+        scenario_id=scenario.pk,
+        shape=(len(response_ids), len(planning_unit_ids)),
+        data=as_numpy(coins, np.int32),
+        indices=np.searchsorted(planning_unit_ids, unit_ids).astype(index_dtype),
+        indptr=as_numpy(indptr, np.int64),
+        response_ids=as_numpy(response_ids, np.int64),
+        planning_unit_ids=planning_unit_ids,
+    )
+
+def save_coin_matrix(matrix, path):
+    """
+    Save a CoinMatrix to `path`: a .npz file readable by both
+    load_coin_matrix and scipy.sparse.load_npz, or otherwise a directory of
+    .npy arrays plus metadata that loads memory-mapped.
+    """
+    require_numpy()
+    if path.endswith('.npz'):
+        np.savez(
+            path,
+            format=np.array(b'csr'),
+            shape=np.array(matrix.shape, dtype=np.int64),
+            scenario_id=np.array(matrix.scenario_id, dtype=np.int64),
+            **{name: getattr(matrix, name) for name in COIN_MATRIX_ARRAYS}
+        )
+        return
+    os.makedirs(path, exist_ok=True)
+    for name in COIN_MATRIX_ARRAYS:
+        np.save(os.path.join(path, '{}.npy'.format(name)), getattr(matrix, name))
+    with open(os.path.join(path, 'matrix.json'), 'w') as metadata:
+        json.dump({'format': 'csr', 'scenario_id': matrix.scenario_id, 'shape': list(matrix.shape)}, metadata)
+
+def load_coin_matrix(path, mmap=True):
+    """
+    Load a CoinMatrix saved by save_coin_matrix. Arrays of a directory are
+    memory-mapped read-only unless mmap is False; .npz files are read into
+    memory.
+    """
+    require_numpy()
+    if path.endswith('.npz'):
+        with np.load(path) as saved:
+            return CoinMatrix(
+                scenario_id=int(saved['scenario_id']),
+                shape=tuple(int(size) for size in saved['shape']),
+                **{name: saved[name] for name in COIN_MATRIX_ARRAYS}
+            )
+    with open(os.path.join(path, 'matrix.json')) as metadata:
+        metadata = json.load(metadata)
+    return CoinMatrix(
+        scenario_id=metadata['scenario_id'],
+        shape=tuple(metadata['shape']),
+        **{
+            name: np.load(os.path.join(path, '{}.npy'.format(name)), mmap_mode='r' if mmap else None)
+            for name in COIN_MATRIX_ARRAYS
+        }
+    )
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.23 on 2026-10-19 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0003_alter_scenario_selection_snapping_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncOperation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='Client-generated idempotency key of the operation.', max_length=255)),
+                ('operation', models.CharField(help_text='Type of the operation that was applied.', max_length=50)),
+                ('applied_at', models.DateTimeField(auto_now_add=True)),
+                ('response', models.ForeignKey(help_text='The survey response this operation was applied to.', on_delete=django.db.models.deletion.CASCADE, related_name='sync_operations_response', to='survey.surveyresponse')),
+            ],
+            options={
+                'verbose_name': 'Sync Operation',
+                'verbose_name_plural': 'Sync Operations',
+                'unique_together': {('response', 'key')},
+            },
+        ),
+    ]
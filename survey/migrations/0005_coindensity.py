@@ -0,0 +1,31 @@
+# Generated by Django 4.2.23 on 2026-10-19 10:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0004_syncoperation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoinDensity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_coins', models.IntegerField(default=0, help_text='Total coins assigned to this planning unit by all respondents.')),
+                ('respondent_count', models.IntegerField(default=0, help_text='Number of responses that selected this planning unit.')),
+                ('mean_coins', models.FloatField(default=0, help_text='Mean coins assigned by the responses that selected this planning unit.')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('planning_unit', models.ForeignKey(help_text='The planning unit the coins were assigned to.', on_delete=django.db.models.deletion.CASCADE, related_name='coin_densities_planning_unit', to='survey.planningunit')),
+                ('scenario', models.ForeignKey(help_text='The scenario the coins were assigned in.', on_delete=django.db.models.deletion.CASCADE, related_name='coin_densities_scenario', to='survey.scenario')),
+            ],
+            options={
+                'verbose_name': 'Coin Density',
+                'verbose_name_plural': 'Coin Densities',
+                'unique_together': {('scenario', 'planning_unit')},
+            },
+        ),
+    ]
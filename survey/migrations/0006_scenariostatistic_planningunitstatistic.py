@@ -0,0 +1,53 @@
+# Generated by Django 4.2.23 on 2026-10-19 11:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0005_coindensity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScenarioStatistic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('respondent_count', models.IntegerField(default=0, help_text='Number of responses that assigned coins in this scenario.')),
+                ('planning_unit_count', models.IntegerField(default=0, help_text='Number of planning units the statistics cover.')),
+                ('percentile', models.FloatField(help_text='Percentile of coins reported for each planning unit.')),
+                ('bootstrap_samples', models.IntegerField(help_text='Number of bootstrap resamples of respondents behind the confidence intervals.')),
+                ('confidence', models.FloatField(help_text='Confidence level of the bootstrap intervals.')),
+                ('unit_gini', models.FloatField(help_text='Gini coefficient of total coins across planning units.', null=True)),
+                ('mean_respondent_gini', models.FloatField(help_text="Mean Gini coefficient of each respondent's coins across the units they selected.", null=True)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('scenario', models.OneToOneField(help_text='The scenario these statistics describe.', on_delete=django.db.models.deletion.CASCADE, related_name='scenario_statistic_scenario', to='survey.scenario')),
+            ],
+            options={
+                'verbose_name': 'Scenario Statistic',
+                'verbose_name_plural': 'Scenario Statistics',
+            },
+        ),
+        migrations.CreateModel(
+            name='PlanningUnitStatistic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('selection_share', models.FloatField(help_text='Share of respondents that selected this planning unit.')),
+                ('mean_coins', models.FloatField(help_text='Mean coins assigned to this planning unit per respondent.')),
+                ('median_coins', models.FloatField(help_text='Median coins assigned to this planning unit per respondent.')),
+                ('percentile_coins', models.FloatField(help_text="Coins at the scenario statistic's percentile for this planning unit.")),
+                ('gini', models.FloatField(help_text='Gini coefficient of the coins respondents assigned to this planning unit.')),
+                ('mean_coins_ci_low', models.FloatField(help_text='Lower bound of the bootstrap confidence interval of the mean coins.')),
+                ('mean_coins_ci_high', models.FloatField(help_text='Upper bound of the bootstrap confidence interval of the mean coins.')),
+                ('planning_unit', models.ForeignKey(help_text='The planning unit these statistics describe.', on_delete=django.db.models.deletion.CASCADE, related_name='planning_unit_statistics_planning_unit', to='survey.planningunit')),
+                ('scenario', models.ForeignKey(help_text='The scenario these statistics describe.', on_delete=django.db.models.deletion.CASCADE, related_name='planning_unit_statistics_scenario', to='survey.scenario')),
+            ],
+            options={
+                'verbose_name': 'Planning Unit Statistic',
+                'verbose_name_plural': 'Planning Unit Statistics',
+                'unique_together': {('scenario', 'planning_unit')},
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.23 on 2026-10-19 12:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0006_scenariostatistic_planningunitstatistic'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanningUnitNeighbourGraph',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unit_count', models.IntegerField(default=0, help_text='Number of planning units in the graph.')),
+                ('edge_count', models.IntegerField(default=0, help_text='Number of pairs of neighbouring planning units.')),
+                ('graph', models.BinaryField(help_text='Compressed .npz of the planning_unit_ids, indptr and indices arrays.')),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('family', models.OneToOneField(help_text='The planning unit family this graph connects.', on_delete=django.db.models.deletion.CASCADE, related_name='neighbour_graph_family', to='survey.planningunitfamily')),
+            ],
+            options={
+                'verbose_name': 'Planning Unit Neighbour Graph',
+                'verbose_name_plural': 'Planning Unit Neighbour Graphs',
+            },
+        ),
+        migrations.CreateModel(
+            name='PlanningUnitHotspot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_coins', models.FloatField(help_text='Total coins assigned to this planning unit by all respondents.')),
+                ('gi_z_score', models.FloatField(help_text='Getis-Ord Gi* z-score; high positive values are hotspots, low negative values coldspots.')),
+                ('gi_p_value', models.FloatField(help_text='Two-sided p-value of the Gi* z-score.')),
+                ('moran_i', models.FloatField(help_text="Local Moran's I.")),
+                ('moran_z_score', models.FloatField(help_text="z-score of the local Moran's I under randomisation.")),
+                ('moran_p_value', models.FloatField(help_text="Two-sided p-value of the local Moran's I z-score.")),
+                ('moran_quadrant', models.CharField(blank=True, choices=[('HH', 'High-High'), ('LL', 'Low-Low'), ('HL', 'High-Low'), ('LH', 'Low-High')], help_text='Moran scatterplot quadrant of this planning unit and its neighbours.', max_length=2)),
+                ('planning_unit', models.ForeignKey(help_text='The planning unit these results describe.', on_delete=django.db.models.deletion.CASCADE, related_name='planning_unit_hotspots_planning_unit', to='survey.planningunit')),
+                ('scenario', models.ForeignKey(help_text='The scenario these results describe.', on_delete=django.db.models.deletion.CASCADE, related_name='planning_unit_hotspots_scenario', to='survey.scenario')),
+            ],
+            options={
+                'verbose_name': 'Planning Unit Hotspot',
+                'verbose_name_plural': 'Planning Unit Hotspots',
+                'unique_together': {('scenario', 'planning_unit')},
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.23 on 2026-10-19 12:40
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+BACKFILL_SQL = """
+    UPDATE {table} SET selected_option_ids = ARRAY(
+        SELECT (option.value->>'option_id')::integer
+        FROM jsonb_array_elements(selected_options) WITH ORDINALITY AS option(value, position)
+        ORDER BY option.position
+    )
+    WHERE jsonb_typeof(selected_options) = 'array'
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0007_planningunitneighbourgraph_planningunithotspot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planningunitanswer',
+            name='selected_option_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, help_text='IDs of the selected options, kept in step with selected_options for indexed counting.', size=None),
+        ),
+        migrations.AddField(
+            model_name='scenarioanswer',
+            name='selected_option_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, help_text='IDs of the selected options, kept in step with selected_options for indexed counting.', size=None),
+        ),
+        migrations.AddField(
+            model_name='surveyanswer',
+            name='selected_option_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, help_text='IDs of the selected options, kept in step with selected_options for indexed counting.', size=None),
+        ),
+        migrations.RunSQL(BACKFILL_SQL.format(table='survey_planningunitanswer'), migrations.RunSQL.noop),
+        migrations.RunSQL(BACKFILL_SQL.format(table='survey_scenarioanswer'), migrations.RunSQL.noop),
+        migrations.RunSQL(BACKFILL_SQL.format(table='survey_surveyanswer'), migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='planningunitanswer',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['selected_option_ids'], name='survey_puans_option_ids_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='scenarioanswer',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['selected_option_ids'], name='survey_scnans_option_ids_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='surveyanswer',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['selected_option_ids'], name='survey_svyans_option_ids_gin'),
+        ),
+    ]
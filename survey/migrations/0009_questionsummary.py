@@ -0,0 +1,44 @@
+# Generated by Django 4.2.23 on 2026-10-19 13:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0008_answer_selected_option_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answer_type', models.CharField(choices=[('survey', 'Survey'), ('scenario', 'Scenario'), ('planning_unit', 'Planning Unit')], help_text='Kind of question summarised, which determines the table question_id refers to.', max_length=20)),
+                ('question_id', models.IntegerField(help_text='ID of the survey, scenario or planning unit question summarised.')),
+                ('response_count', models.IntegerField(default=0, help_text='Number of responses that answered the question.')),
+                ('option_counts', models.JSONField(blank=True, default=dict, help_text='Number of responses that chose each option, keyed by option ID.')),
+                ('numeric_count', models.IntegerField(default=0, help_text='Number of numeric answers.')),
+                ('numeric_mean', models.FloatField(blank=True, help_text='Mean of the numeric answers.', null=True)),
+                ('numeric_min', models.FloatField(blank=True, help_text='Smallest numeric answer.', null=True)),
+                ('numeric_max', models.FloatField(blank=True, help_text='Largest numeric answer.', null=True)),
+                ('numeric_histogram', models.JSONField(blank=True, default=list, help_text='Equal-width bins between the smallest and largest numeric answers, as [{min, max, count}].')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('planning_unit', models.ForeignKey(blank=True, help_text='For planning unit questions, the planning unit summarised; empty for the question as a whole.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='question_summaries_planning_unit', to='survey.planningunit')),
+                ('survey', models.ForeignKey(help_text='The survey the question belongs to.', on_delete=django.db.models.deletion.CASCADE, related_name='question_summaries_survey', to='survey.survey')),
+            ],
+            options={
+                'verbose_name': 'Question Summary',
+                'verbose_name_plural': 'Question Summaries',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='questionsummary',
+            constraint=models.UniqueConstraint(fields=('answer_type', 'question_id', 'planning_unit'), name='survey_qsummary_unit_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='questionsummary',
+            constraint=models.UniqueConstraint(condition=models.Q(('planning_unit__isnull', True)), fields=('answer_type', 'question_id'), name='survey_qsummary_question_unique'),
+        ),
+    ]
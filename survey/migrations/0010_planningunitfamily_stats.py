@@ -0,0 +1,68 @@
+# Generated by Django 4.2.23 on 2026-10-19 14:05
+
+import django.contrib.gis.db.models.fields
+from django.contrib.gis.db.models import Extent
+from django.contrib.gis.db.models.functions import NumPoints
+from django.contrib.gis.geos import Polygon
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+
+def refresh_family_stats(apps, schema_editor):
+    PlanningUnit = apps.get_model('survey', 'PlanningUnit')
+    PlanningUnitFamily = apps.get_model('survey', 'PlanningUnitFamily')
+    for family in PlanningUnitFamily.objects.all():
+        stats = PlanningUnit.objects.filter(family=family).aggregate(
+            unit_count=Count('pk'),
+            extent=Extent('geometry'),
+            vertex_count=Sum(NumPoints('geometry'))
+        )
+        family.planning_unit_count = stats['unit_count']
+        if stats['extent']:
+            family.extent = Polygon.from_bbox(stats['extent'])
+            family.extent.srid = 4326
+        family.vertex_count = stats['vertex_count'] or 0
+        family.stats_updated_at = timezone.now()
+        family.save(update_fields=['planning_unit_count', 'extent', 'vertex_count', 'stats_updated_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0009_questionsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planningunitfamily',
+            name='planning_unit_count',
+            field=models.IntegerField(default=0, help_text='Number of planning units in this family, as of the last import.'),
+        ),
+        migrations.AddField(
+            model_name='planningunitfamily',
+            name='extent',
+            field=django.contrib.gis.db.models.fields.PolygonField(blank=True, help_text="Bounding box of the family's planning units, as of the last import.", null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='planningunitfamily',
+            name='vertex_count',
+            field=models.BigIntegerField(default=0, help_text="Total vertices of the family's planning unit geometries, as of the last import."),
+        ),
+        migrations.AddField(
+            model_name='planningunitfamily',
+            name='import_version',
+            field=models.PositiveIntegerField(default=0, help_text='Number of times planning units have been imported into this family.'),
+        ),
+        migrations.AddField(
+            model_name='planningunitfamily',
+            name='last_import_duration',
+            field=models.DurationField(blank=True, help_text='How long the last import of planning units took.', null=True),
+        ),
+        migrations.AddField(
+            model_name='planningunitfamily',
+            name='stats_updated_at',
+            field=models.DateTimeField(blank=True, help_text='When the stored planning unit statistics were last refreshed.', null=True),
+        ),
+        migrations.RunPython(refresh_family_stats, migrations.RunPython.noop),
+    ]
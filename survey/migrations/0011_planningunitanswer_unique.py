@@ -0,0 +1,33 @@
+# Generated by Django 4.2.23 on 2026-10-19 15:10
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def delete_duplicate_answers(apps, schema_editor):
+    # Keep the most recent answer for each response, question and planning unit
+    PlanningUnitAnswer = apps.get_model('survey', 'PlanningUnitAnswer')
+    duplicates = PlanningUnitAnswer.objects.values(
+        'response_id', 'question_id', 'planning_unit_id'
+    ).annotate(latest_id=Max('pk'), answer_count=models.Count('pk')).filter(answer_count__gt=1)
+    for duplicate in duplicates:
+        PlanningUnitAnswer.objects.filter(
+            response_id=duplicate['response_id'],
+            question_id=duplicate['question_id'],
+            planning_unit_id=duplicate['planning_unit_id']
+        ).exclude(pk=duplicate['latest_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0010_planningunitfamily_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_answers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='planningunitanswer',
+            constraint=models.UniqueConstraint(fields=('response', 'question', 'planning_unit'), name='survey_puans_unit_unique'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-19 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0011_planningunitanswer_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coinassignment',
+            index=models.Index(fields=['scenario', 'planning_unit'], name='survey_coins_scenario_unit'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.23 on 2026-10-19 16:05
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0012_coinassignment_scenario_unit_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='planningunitanswer',
+            name='survey_puans_option_ids_gin',
+        ),
+        migrations.RemoveIndex(
+            model_name='scenarioanswer',
+            name='survey_scnans_option_ids_gin',
+        ),
+        migrations.RemoveIndex(
+            model_name='surveyanswer',
+            name='survey_svyans_option_ids_gin',
+        ),
+        migrations.AlterField(
+            model_name='planningunitanswer',
+            name='selected_option_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, help_text='IDs of the selected options, kept in step with selected_options for counting in SQL.', size=None),
+        ),
+        migrations.AlterField(
+            model_name='scenarioanswer',
+            name='selected_option_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, help_text='IDs of the selected options, kept in step with selected_options for counting in SQL.', size=None),
+        ),
+        migrations.AlterField(
+            model_name='surveyanswer',
+            name='selected_option_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, help_text='IDs of the selected options, kept in step with selected_options for counting in SQL.', size=None),
+        ),
+    ]
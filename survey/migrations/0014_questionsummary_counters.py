@@ -0,0 +1,81 @@
+# Generated by Django 4.2.23 on 2026-10-19 17:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def move_counts_to_rows(apps, schema_editor):
+    QuestionSummary = apps.get_model('survey', 'QuestionSummary')
+    QuestionSummaryCount = apps.get_model('survey', 'QuestionSummaryCount')
+    counts = []
+    for summary in QuestionSummary.objects.iterator(chunk_size=2000):
+        summary.numeric_sum = (summary.numeric_mean or 0) * summary.numeric_count
+        if summary.numeric_histogram:
+            summary.histogram_low = summary.numeric_histogram[0]['min']
+            summary.histogram_high = summary.numeric_histogram[-1]['max']
+        summary.save(update_fields=['numeric_sum', 'histogram_low', 'histogram_high'])
+        counts.extend(
+            QuestionSummaryCount(summary_id=summary.pk, kind='option', key=int(option_id), count=count)
+            for option_id, count in summary.option_counts.items() if count
+        )
+        counts.extend(
+            QuestionSummaryCount(summary_id=summary.pk, kind='bin', key=bucket, count=histogram_bin['count'])
+            for bucket, histogram_bin in enumerate(summary.numeric_histogram, start=1) if histogram_bin['count']
+        )
+    QuestionSummaryCount.objects.bulk_create(counts, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0013_remove_answer_option_ids_gin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionSummaryCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('option', 'Option'), ('bin', 'Histogram Bin')], help_text='Whether the counter is of an option or of a histogram bin.', max_length=10)),
+                ('key', models.IntegerField(help_text='The option ID, or the histogram bin number counting from 1.')),
+                ('count', models.IntegerField(default=0, help_text='Number of responses choosing the option, or of numeric answers in the bin.')),
+                ('summary', models.ForeignKey(help_text='The question summary this counter belongs to.', on_delete=django.db.models.deletion.CASCADE, related_name='question_summary_counts_summary', to='survey.questionsummary')),
+            ],
+            options={
+                'verbose_name': 'Question Summary Count',
+                'verbose_name_plural': 'Question Summary Counts',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='questionsummarycount',
+            constraint=models.UniqueConstraint(fields=('summary', 'kind', 'key'), name='survey_qsumcount_key_unique'),
+        ),
+        migrations.AddField(
+            model_name='questionsummary',
+            name='numeric_sum',
+            field=models.FloatField(default=0, help_text='Sum of the numeric answers, from which the mean is derived.'),
+        ),
+        migrations.AddField(
+            model_name='questionsummary',
+            name='histogram_low',
+            field=models.FloatField(blank=True, help_text='Lower edge of the equal-width histogram bins. The bins only widen, when an answer falls outside them.', null=True),
+        ),
+        migrations.AddField(
+            model_name='questionsummary',
+            name='histogram_high',
+            field=models.FloatField(blank=True, help_text='Upper edge of the equal-width histogram bins.', null=True),
+        ),
+        migrations.RunPython(move_counts_to_rows, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='questionsummary',
+            name='option_counts',
+        ),
+        migrations.RemoveField(
+            model_name='questionsummary',
+            name='numeric_mean',
+        ),
+        migrations.RemoveField(
+            model_name='questionsummary',
+            name='numeric_histogram',
+        ),
+    ]
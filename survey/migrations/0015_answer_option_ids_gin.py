@@ -0,0 +1,42 @@
+# Generated by Django 4.2.23 on 2026-10-19 18:20
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('survey', '0014_questionsummary_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='planningunitanswer',
+            name='selected_option_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, help_text='IDs of the selected options, kept in step with selected_options for indexed counting.', size=None),
+        ),
+        migrations.AlterField(
+            model_name='scenarioanswer',
+            name='selected_option_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, help_text='IDs of the selected options, kept in step with selected_options for indexed counting.', size=None),
+        ),
+        migrations.AlterField(
+            model_name='surveyanswer',
+            name='selected_option_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, help_text='IDs of the selected options, kept in step with selected_options for indexed counting.', size=None),
+        ),
+        migrations.AddIndex(
+            model_name='planningunitanswer',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['selected_option_ids'], name='survey_puans_option_ids_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='scenarioanswer',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['selected_option_ids'], name='survey_scnans_option_ids_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='surveyanswer',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['selected_option_ids'], name='survey_svyans_option_ids_gin'),
+        ),
+    ]
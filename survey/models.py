@@ -1,7 +1,21 @@
-from django.db import models
-from django.contrib.gis.db.models import MultiPolygonField
-from django.contrib.gis.geos import GEOSGeometry
+from collections import Counter
+from django.db import connection, models, transaction
+from django.db.models import (
+    BooleanField, Case, Count, Exists, F, Max, Min, OuterRef, Prefetch, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.contrib.gis.db.models import Extent, MultiPolygonField, PolygonField
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.gis.db.models.functions import AsGeoJSON, NumPoints
+from django.contrib.gis.geos import GEOSGeometry, Polygon
 from django.conf import settings
+from django.utils import timezone
+
+from .cache import get_survey_schema
+
+# Bump when the structure of Survey.get_schema() changes
+SURVEY_SCHEMA_VERSION = 1
 
 class QuestionOption(models.Model):
     text = models.CharField(max_length=255)
@@ -98,6 +112,24 @@ def get_question_choices(question, options_model):
         return None
     return [(option.id, option.text) for option in options_model.objects.filter(question=question).order_by('order')]
 
+def get_question_schema(question, field_name, options):
+    """
+    Compile a question into the plain dict sent to clients that render the
+    question forms themselves. `options` should already be ordered.
+    """
+    return {
+        'id': question.id,
+        'field_name': field_name,
+        'text': question.text,
+        'order': question.order,
+        'question_type': question.question_type,
+        'is_required': question.is_required,
+        'help_text': question.help_text,
+        'choices': [
+            [option.id, option.text] for option in options
+        ] if question.question_type in ['single_choice', 'multiple_choice'] else None,
+    }
+
 class SurveyQuestion(Question):
     survey = models.ForeignKey(
         'Survey',
@@ -160,10 +192,62 @@ class PlanningUnitFamily(models.Model):
             null=True,
             help_text="URL to a remote raster layer for this planning unit family. Leave blank to use local vector layer."
         )
+        planning_unit_count = models.IntegerField(
+            default=0,
+            help_text="Number of planning units in this family, as of the last import."
+        )
+        extent = PolygonField(
+            srid=settings.SERVER_SRID,
+            blank=True,
+            null=True,
+            help_text="Bounding box of the family's planning units, as of the last import."
+        )
+        vertex_count = models.BigIntegerField(
+            default=0,
+            help_text="Total vertices of the family's planning unit geometries, as of the last import."
+        )
+        import_version = models.PositiveIntegerField(
+            default=0,
+            help_text="Number of times planning units have been imported into this family."
+        )
+        last_import_duration = models.DurationField(
+            blank=True,
+            null=True,
+            help_text="How long the last import of planning units took."
+        )
+        stats_updated_at = models.DateTimeField(
+            blank=True,
+            null=True,
+            help_text="When the stored planning unit statistics were last refreshed."
+        )
 
         def __str__(self):
             return self.name
 
+        def refresh_stats(self, import_duration=None):
+            """
+            Recompute the stored unit count, extent and vertex count with one
+            aggregate query. Pass import_duration after an import to record it
+            and bump the import version.
+            """
+            stats = PlanningUnit.objects.filter(family=self).aggregate(
+                unit_count=Count('pk'),
+                extent=Extent('geometry'),
+                vertex_count=Sum(NumPoints('geometry'))
+            )
+            self.planning_unit_count = stats['unit_count']
+            self.extent = Polygon.from_bbox(stats['extent']) if stats['extent'] else None
+            if self.extent is not None:
+                self.extent.srid = settings.SERVER_SRID
+            self.vertex_count = stats['vertex_count'] or 0
+            self.stats_updated_at = timezone.now()
+            update_fields = ['planning_unit_count', 'extent', 'vertex_count', 'stats_updated_at']
+            if import_duration is not None:
+                self.import_version += 1
+                self.last_import_duration = import_duration
+                update_fields += ['import_version', 'last_import_duration']
+            self.save(update_fields=update_fields)
+
         class Meta:
             verbose_name = "Planning Unit Family"
             verbose_name_plural = "Planning Unit Families"
@@ -229,6 +313,73 @@ class Survey(models.Model):
                     return None
         return None
 
+    def get_schema_version(self):
+        # Scenario, question and option changes bump updated_at too (see signals)
+        return '{}-{}'.format(SURVEY_SCHEMA_VERSION, int(self.updated_at.timestamp() * 1000000))
+
+    def get_schema(self):
+        """
+        Compile the survey, its scenarios and all of their questions into a
+        JSON-serialisable dict, using a fixed number of queries.
+        """
+        questions = self.survey_questions_survey.all().order_by('order').prefetch_related(
+            'survey_question_options_question'
+        )
+        scenarios = self.get_scenarios().prefetch_related(
+            Prefetch(
+                'scenario_questions_scenario',
+                queryset=ScenarioQuestion.objects.order_by('order').prefetch_related('scenario_question_options_question')
+            ),
+            Prefetch(
+                'planning_unit_questions_scenario',
+                queryset=PlanningUnitQuestion.objects.order_by('order').prefetch_related('planning_unit_question_options_question')
+            ),
+        )
+        return {
+            'id': self.id,
+            'title': self.title,
+            'description': self.description,
+            'schema_version': self.get_schema_version(),
+            'questions': [
+                get_question_schema(
+                    question,
+                    f'question_{question.id}',
+                    question.survey_question_options_question.all()
+                ) for question in questions
+            ],
+            'scenarios': [
+                {
+                    'id': scenario.id,
+                    'name': scenario.name,
+                    'description': scenario.description,
+                    'order': scenario.order,
+                    'pu_family_id': scenario.pu_family_id,
+                    'user_defined_pus': scenario.user_defined_pus,
+                    'selection_snapping': scenario.selection_snapping,
+                    'is_spatial': scenario.is_spatial,
+                    'is_weighted': scenario.is_weighted,
+                    'total_coins': scenario.total_coins,
+                    'require_all_coins': scenario.require_all_coins_used,
+                    'minimum_coins': scenario.min_coins_per_pu,
+                    'maximum_coins': scenario.max_coins_per_pu,
+                    'questions': [
+                        get_question_schema(
+                            question,
+                            f'scenario_{scenario.id}_question_{question.id}',
+                            question.scenario_question_options_question.all()
+                        ) for question in scenario.scenario_questions_scenario.all()
+                    ],
+                    'planning_unit_questions': [
+                        get_question_schema(
+                            question,
+                            f'scenario_{scenario.id}_pu_question_{question.id}',
+                            question.planning_unit_question_options_question.all()
+                        ) for question in scenario.planning_unit_questions_scenario.all()
+                    ],
+                } for scenario in scenarios
+            ],
+        }
+
     class Meta:
         verbose_name = "Survey"
         verbose_name_plural = "Surveys"
@@ -355,12 +506,14 @@ class Scenario(models.Model):
     #     help_text="Select planning unit questions to include in this scenario."
     # )
 
-    def get_planning_unit_by_coordinates(self, x_coord, y_coord):
+    def get_planning_units_by_coordinates(self, x_coord, y_coord):
         point_wkt = f'POINT({x_coord} {y_coord})'
         point = GEOSGeometry(point_wkt, srid=3857)
 
-        pus = PlanningUnit.objects.filter(family=self.pu_family, geometry__contains=point)
-        return pus.first() if pus.exists() else None
+        return PlanningUnit.objects.filter(family=self.pu_family, geometry__contains=point)
+
+    def get_planning_unit_by_coordinates(self, x_coord, y_coord):
+        return self.get_planning_units_by_coordinates(x_coord, y_coord).first()
 
     def __str__(self):
         return self.name
@@ -409,60 +562,94 @@ class SurveyResponse(models.Model):
                 return False
         return True
 
-    def scenario_status(self, scenario_id):
-        scenario = self.survey.get_scenarios().get(id=scenario_id)
-        scenario_status = {
-            'is_weighted': scenario.is_weighted,
-            'coins_required': scenario.require_all_coins_used,
-            'coins_assigned': 0,
-            'questions_completed': None,
-            'planning_unit_questions_completed': None,
-            'coins_completed': None,
-            'scenario_completed': False,
-        }
-        required_scenario_questions = scenario.scenario_questions_scenario.filter(is_required=True)
-        for question in required_scenario_questions:
-            if not self.scenarioanswer_response.filter(question=question).exists():
-                scenario_status['questions_completed'] = False
-        if scenario_status['questions_completed'] is None:
-            scenario_status['questions_completed'] = True
-        if scenario.is_spatial:
-            required_pu_questions = scenario.planning_unit_questions_scenario.filter(is_required=True)
-            selected_pu_ids = []
-            for pua in self.planningunitanswer_response.all():
-                if pua.planning_unit.id not in selected_pu_ids:
-                    selected_pu_ids.append(pua.planning_unit.id)
-            planning_units = PlanningUnit.objects.filter(pk__in=selected_pu_ids)
-            for pu in planning_units:
-                for question in required_pu_questions:
-                    if not self.planningunitanswer_response.filter(question=question, planning_unit=pu).exists():
-                        scenario_status['planning_unit_questions_completed'] = False
-            if scenario.is_weighted and scenario.require_all_coins_used:
-                scenario_status['coins_assigned'] = sum(
-                    ca.coins_assigned for ca in self.coin_assignments_response.filter(
-                        scenario=scenario
-                    )
-                )
-                if scenario_status['coins_assigned'] != scenario.total_coins:
-                    scenario_status['coins_completed'] =False
-        if scenario_status['planning_unit_questions_completed'] is None:
-            scenario_status['planning_unit_questions_completed'] = True
-        if scenario_status['coins_completed'] is None:
-            scenario_status['coins_completed'] = True
-        if (scenario_status['questions_completed'] and
-            scenario_status['planning_unit_questions_completed'] and
-            scenario_status['coins_completed']):
-            scenario_status['scenario_completed'] = True
-        scenario_status['coins_available'] = scenario.total_coins - scenario_status['coins_assigned']   
-        scenario_status['areas_selected'] = self.coin_assignments_response.filter(scenario=scenario).count()
-        return scenario_status
+    def scenario_status(self, scenario_id, schema=None, answers=None):
+        """
+        Completion status of one scenario. Pass `schema` and `answers` (from
+        Survey.get_schema() and get_answers()) to avoid re-reading them;
+        otherwise the cached schema and only this scenario's answers are read.
+        """
+        if schema is None:
+            schema = get_survey_schema(self.survey)
+        for scenario_schema in schema['scenarios']:
+            if scenario_schema['id'] == int(scenario_id):
+                if answers is None:
+                    answers = self.get_answers(scenario_id=scenario_schema['id'])
+                return get_scenario_status(scenario_schema, answers)
+        raise Scenario.DoesNotExist('Scenario not found in this survey.')
 
     
-    def scenarios_status(self):
+    def scenarios_status(self, schema=None, answers=None):
+        if schema is None:
+            schema = get_survey_schema(self.survey)
+        if answers is None:
+            answers = self.get_answers()
         scenario_status = {}
-        for scenario in self.survey.get_scenarios():
-            scenario_status[scenario.id] = self.scenario_status(scenario.id)
+        for scenario_schema in schema['scenarios']:
+            scenario_status[scenario_schema['id']] = get_scenario_status(scenario_schema, answers)
         return scenario_status
+
+    def get_selected_unit_ids(self, answers=None):
+        """
+        IDs of the planning units selected (answered or assigned coins) in
+        each scenario, keyed by scenario ID.
+        """
+        if answers is None:
+            answers = self.get_answers()
+        selected_unit_ids = {}
+        for scenario_id in set(answers['planning_units'].keys()) | set(answers['coins'].keys()):
+            selected_unit_ids[scenario_id] = sorted(
+                set(answers['planning_units'].get(scenario_id, {}).keys()) |
+                set(answers['coins'].get(scenario_id, {}).keys())
+            )
+        return selected_unit_ids
+
+    def get_selected_planning_units(self, scenario):
+        """
+        Planning units selected in a scenario (answered or assigned coins) as
+        (id, geojson, coins) rows, with geometries serialised by the database.
+        """
+        coin_assignments = CoinAssignment.objects.filter(response=self, scenario=scenario)
+        answers = PlanningUnitAnswer.objects.filter(response=self, question__scenario=scenario)
+        # Start from the response's own rows, so only the selected units' geometries are read
+        unit_ids = coin_assignments.values('planning_unit_id').union(answers.values('planning_unit_id'))
+        return PlanningUnit.objects.filter(pk__in=unit_ids).annotate(
+            geojson=AsGeoJSON('geometry'),
+            coins=Coalesce(Subquery(
+                coin_assignments.filter(planning_unit=OuterRef('pk')).values('coins_assigned')[:1]
+            ), 0),
+        ).order_by('pk').values_list('pk', 'geojson', 'coins')
+
+    def get_answers(self, scenario_id=None):
+        """
+        Return all answers and coin assignments of this response as a compact
+        payload keyed by IDs, to be paired with Survey.get_schema(). With
+        scenario_id, only that scenario's answers and coins are read and the
+        survey answers are left out.
+        """
+        answer_fields = ('question__question_type', 'text_answer', 'numeric_answer', 'selected_options', 'other_text_answer')
+        answers = {
+            'survey': {},
+            'scenarios': {},
+            'planning_units': {},
+            'coins': {},
+        }
+        scenario_answers = self.scenarioanswer_response.all()
+        unit_answers = self.planningunitanswer_response.all()
+        coin_assignments = self.coin_assignments_response.all()
+        if scenario_id is None:
+            for row in self.surveyanswer_response.values_list('question_id', *answer_fields):
+                answers['survey'][row[0]] = get_compact_answer_value(*row[1:])
+        else:
+            scenario_answers = scenario_answers.filter(question__scenario_id=scenario_id)
+            unit_answers = unit_answers.filter(question__scenario_id=scenario_id)
+            coin_assignments = coin_assignments.filter(scenario_id=scenario_id)
+        for row in scenario_answers.values_list('question__scenario_id', 'question_id', *answer_fields):
+            answers['scenarios'].setdefault(row[0], {})[row[1]] = get_compact_answer_value(*row[2:])
+        for row in unit_answers.values_list('question__scenario_id', 'planning_unit_id', 'question_id', *answer_fields):
+            answers['planning_units'].setdefault(row[0], {}).setdefault(row[1], {})[row[2]] = get_compact_answer_value(*row[3:])
+        for scenario_id, planning_unit_id, coins_assigned in coin_assignments.values_list('scenario_id', 'planning_unit_id', 'coins_assigned'):
+            answers['coins'].setdefault(scenario_id, {})[planning_unit_id] = coins_assigned
+        return answers
     
     # def response_status(self):
 
@@ -487,6 +674,63 @@ def get_answer_value(answer):
     else:
         return None
 
+def get_scenario_status(scenario_schema, answers):
+    """
+    Compute a scenario's completion status from its entry in
+    Survey.get_schema() and from SurveyResponse.get_answers(), without queries.
+    """
+    scenario_id = scenario_schema['id']
+    scenario_answers = answers['scenarios'].get(scenario_id, {})
+    unit_answers = answers['planning_units'].get(scenario_id, {})
+    unit_coins = answers['coins'].get(scenario_id, {})
+    scenario_status = {
+        'is_weighted': scenario_schema['is_weighted'],
+        'coins_required': scenario_schema['require_all_coins'],
+        'coins_assigned': 0,
+        'questions_completed': True,
+        'planning_unit_questions_completed': True,
+        'coins_completed': True,
+        'scenario_completed': False,
+    }
+    for question in scenario_schema['questions']:
+        if question['is_required'] and question['id'] not in scenario_answers:
+            scenario_status['questions_completed'] = False
+    if scenario_schema['is_spatial']:
+        required_pu_question_ids = [
+            question['id'] for question in scenario_schema['planning_unit_questions'] if question['is_required']
+        ]
+        # Every unit selected in this scenario (answered or given coins) must answer every
+        # required question. Units selected only in other scenarios are never shown this
+        # scenario's questions, so unlike the original per-response check they are not counted.
+        for unit_id in set(unit_answers.keys()) | set(unit_coins.keys()):
+            for question_id in required_pu_question_ids:
+                if question_id not in unit_answers.get(unit_id, {}):
+                    scenario_status['planning_unit_questions_completed'] = False
+        if scenario_schema['is_weighted'] and scenario_schema['require_all_coins']:
+            scenario_status['coins_assigned'] = sum(unit_coins.values())
+            if scenario_status['coins_assigned'] != scenario_schema['total_coins']:
+                scenario_status['coins_completed'] = False
+    if (scenario_status['questions_completed'] and
+        scenario_status['planning_unit_questions_completed'] and
+        scenario_status['coins_completed']):
+        scenario_status['scenario_completed'] = True
+    scenario_status['coins_available'] = scenario_schema['total_coins'] - scenario_status['coins_assigned']
+    scenario_status['areas_selected'] = len(unit_coins)
+    return scenario_status
+
+def get_compact_answer_value(question_type, text_answer, numeric_answer, selected_options, other_text_answer):
+    # Choice answers are reduced to their option IDs; the option text lives in the schema
+    if question_type == 'text' and text_answer is not None:
+        return text_answer
+    elif question_type == 'number' and numeric_answer is not None:
+        return numeric_answer
+    elif question_type in ['single_choice', 'multiple_choice'] and selected_options:
+        return [x['option_id'] for x in selected_options]
+    elif question_type == 'text' and other_text_answer:
+        return other_text_answer
+    else:
+        return None
+
 class Answer(models.Model):
     response = models.ForeignKey(
         SurveyResponse,
@@ -505,6 +749,12 @@ class Answer(models.Model):
         null=True,
         help_text="Selected options for multiple choice or single choice questions."
     )
+    selected_option_ids = ArrayField(
+        models.IntegerField(),
+        blank=True,
+        default=list,
+        help_text="IDs of the selected options, kept in step with selected_options for indexed counting."
+    )
     # selected_options = models.ManyToManyField(
     #     QuestionOption,
     #     blank=True,
@@ -542,6 +792,13 @@ class Answer(models.Model):
     def value(self):
         return get_answer_value(self)
 
+    def save(self, *args, **kwargs):
+        # Bulk writes set selected_option_ids themselves (see get_related_answer_values)
+        self.selected_option_ids = [option['option_id'] for option in self.selected_options or []]
+        # The signals moving the question summaries run inside this transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Answer to {self.question} in response {self.response.id}"
 
@@ -561,6 +818,9 @@ class SurveyAnswer(Answer):
     class Meta:
         verbose_name = "Survey Answer"
         verbose_name_plural = "Survey Answers"
+        indexes = [
+            GinIndex(fields=['selected_option_ids'], name='survey_svyans_option_ids_gin'),
+        ]
 
 class ScenarioAnswer(Answer):
     question = models.ForeignKey(
@@ -573,6 +833,9 @@ class ScenarioAnswer(Answer):
     class Meta:
         verbose_name = "Scenario Answer"
         verbose_name_plural = "Scenario Answers"
+        indexes = [
+            GinIndex(fields=['selected_option_ids'], name='survey_scnans_option_ids_gin'),
+        ]
 
 class PlanningUnitAnswer(Answer):
     question = models.ForeignKey(
@@ -595,6 +858,15 @@ class PlanningUnitAnswer(Answer):
     class Meta:
         verbose_name = "Planning Unit Answer"
         verbose_name_plural = "Planning Unit Answers"
+        indexes = [
+            GinIndex(fields=['selected_option_ids'], name='survey_puans_option_ids_gin'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['response', 'question', 'planning_unit'],
+                name='survey_puans_unit_unique'
+            ),
+        ]
 
 class CoinAssignment(models.Model):
     response = models.ForeignKey(
@@ -626,4 +898,1089 @@ class CoinAssignment(models.Model):
     class Meta:
         verbose_name = "Coin Assignment"
         verbose_name_plural = "Coin Assignments"
-        unique_together = ('response', 'scenario', 'planning_unit')
\ No newline at end of file
+        unique_together = ('response', 'scenario', 'planning_unit')
+        indexes = [
+            # The unique index leads with response; density refreshes look up by scenario and unit
+            models.Index(fields=['scenario', 'planning_unit'], name='survey_coins_scenario_unit'),
+        ]
+
+def parse_planning_unit_ids(unit_ids):
+    """
+    Parse a comma-separated string (or iterable) of planning unit IDs into
+    an ordered list of unique integers. Raises ValueError on bad input.
+    """
+    if isinstance(unit_ids, str):
+        unit_ids = [x for x in unit_ids.split(',') if x.strip()]
+    parsed_ids = []
+    for unit_id in unit_ids:
+        unit_id = int(unit_id)
+        if unit_id not in parsed_ids:
+            parsed_ids.append(unit_id)
+    return parsed_ids
+
+def upsert_planning_unit_answers(response, question, unit_ids, values):
+    """
+    Write the same answer values to many planning units with one bulk
+    INSERT ... ON CONFLICT DO UPDATE, so concurrent saves of the same units
+    cannot create duplicate answers or lose an update. The question
+    summaries are moved in the same transaction.
+    """
+    answers = [
+        PlanningUnitAnswer(response=response, question=question, planning_unit_id=unit_id, **values)
+        for unit_id in unit_ids
+    ]
+    with transaction.atomic():
+        before = get_answer_summary_states(PlanningUnitAnswer, response.pk, question.pk, lock=True)
+        answer_ids = {state[0]: answer_id for answer_id, state in before.items()}
+        after = dict(before)
+        for unit_id in unit_ids:
+            # New answers have no ID yet
+            answer_id = answer_ids.get(unit_id, ('new', unit_id))
+            _, option_ids, numeric_answer = before.get(answer_id, (unit_id, (), None))
+            if 'selected_option_ids' in values:
+                option_ids = tuple(values['selected_option_ids'])
+            if 'numeric_answer' in values:
+                numeric_answer = float(values['numeric_answer']) if values['numeric_answer'] is not None else None
+            after[answer_id] = (unit_id, option_ids, numeric_answer)
+
+        if values:
+            PlanningUnitAnswer.objects.bulk_create(
+                answers,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['response', 'question', 'planning_unit'],
+                update_fields=list(values)
+            )
+        else:
+            PlanningUnitAnswer.objects.bulk_create(answers, batch_size=500, ignore_conflicts=True)
+        update_question_summaries(PlanningUnitAnswer, question.pk, before, after)
+
+def upsert_coin_assignments(response, scenario, unit_ids, coins_assigned):
+    """
+    Assign the same number of coins to many planning units with one UPDATE for
+    the existing assignments and one bulk INSERT for the missing ones.
+    """
+    existing_assignments = CoinAssignment.objects.filter(
+        response=response,
+        scenario=scenario,
+        planning_unit_id__in=unit_ids
+    )
+    existing_assignments.update(coins_assigned=coins_assigned)
+    existing_ids = set(existing_assignments.values_list('planning_unit_id', flat=True))
+    CoinAssignment.objects.bulk_create([
+        CoinAssignment(response=response, scenario=scenario, planning_unit_id=unit_id, coins_assigned=coins_assigned)
+        for unit_id in unit_ids if unit_id not in existing_ids
+    ], batch_size=500, ignore_conflicts=True)
+    refresh_coin_density(scenario.pk, unit_ids)
+
+class SyncOperation(models.Model):
+    response = models.ForeignKey(
+        SurveyResponse,
+        on_delete=models.CASCADE,
+        related_name='sync_operations_response',
+        help_text="The survey response this operation was applied to."
+    )
+    key = models.CharField(
+        max_length=255,
+        help_text="Client-generated idempotency key of the operation."
+    )
+    operation = models.CharField(
+        max_length=50,
+        help_text="Type of the operation that was applied."
+    )
+    applied_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.operation} ({self.key}) in response {self.response_id}"
+
+    class Meta:
+        verbose_name = "Sync Operation"
+        verbose_name_plural = "Sync Operations"
+        unique_together = ('response', 'key')
+
+def get_invalid_planning_unit_ids(scenario, unit_ids):
+    """
+    Return the IDs in unit_ids that are not planning units of the scenario's
+    family, using a single query.
+    """
+    planning_units = PlanningUnit.objects.filter(pk__in=unit_ids)
+    if scenario.pu_family_id is not None:
+        planning_units = planning_units.filter(family__pk=scenario.pu_family_id)
+    found_ids = set(planning_units.values_list('pk', flat=True))
+    return [unit_id for unit_id in unit_ids if unit_id not in found_ids]
+
+def delete_selected_planning_units(response, scenario, unit_ids=None):
+    """
+    Remove planning units from a response's scenario (all of them when
+    unit_ids is None) with one set-based DELETE per table. Returns the number
+    of answers and coin assignments removed.
+    """
+    answers = PlanningUnitAnswer.objects.filter(response=response, question__scenario=scenario)
+    coin_assignments = CoinAssignment.objects.filter(response=response, scenario=scenario)
+    if unit_ids is not None:
+        answers = answers.filter(planning_unit_id__in=unit_ids)
+        coin_assignments = coin_assignments.filter(planning_unit_id__in=unit_ids)
+    # The answers' delete signals move the question summaries
+    answers_deleted, _ = answers.delete()
+    if unit_ids is None:
+        unit_ids = list(coin_assignments.values_list('planning_unit_id', flat=True))
+    coins_deleted, _ = coin_assignments.delete()
+    refresh_coin_density(scenario.pk, unit_ids)
+    return answers_deleted + coins_deleted
+
+def get_unanswered_unit_filter():
+    # Correlated three levels deep: response > required question > selected unit
+    return ~Exists(PlanningUnitAnswer.objects.filter(
+        response=OuterRef(OuterRef(OuterRef('pk'))),
+        question=OuterRef(OuterRef('pk')),
+        planning_unit=OuterRef('planning_unit')
+    ))
+
+def annotate_response_progress(responses, scenario_id=None):
+    """
+    Annotate a SurveyResponse queryset with coins_used, areas_selected and
+    is_complete (the same rules as SurveyResponse.completed) as correlated
+    subqueries, so a page of responses can be listed, filtered and sorted
+    on them in one query. With scenario_id they cover that scenario alone,
+    and is_complete is the scenario's completion.
+    """
+    scenario_filter = {} if scenario_id is None else {'scenario_id': scenario_id}
+    coins_used = CoinAssignment.objects.filter(response=OuterRef('pk'), **scenario_filter).order_by().values(
+        'response'
+    ).annotate(total=Sum('coins_assigned')).values('total')
+    areas_selected = CoinAssignment.objects.filter(response=OuterRef('pk'), **scenario_filter).order_by().values(
+        'response'
+    ).annotate(total=Count('pk')).values('total')
+
+    missing_survey_answers = SurveyQuestion.objects.filter(
+        survey=OuterRef('survey'), is_required=True
+    ).filter(~Exists(SurveyAnswer.objects.filter(response=OuterRef(OuterRef('pk')), question=OuterRef('pk'))))
+    missing_scenario_answers = ScenarioQuestion.objects.filter(
+        scenario__survey=OuterRef('survey'), is_required=True, **scenario_filter
+    ).filter(~Exists(ScenarioAnswer.objects.filter(response=OuterRef(OuterRef('pk')), question=OuterRef('pk'))))
+    # Every unit selected in a spatial scenario, by coins or by answers, must answer its required questions
+    missing_unit_answers = PlanningUnitQuestion.objects.filter(
+        scenario__survey=OuterRef('survey'), scenario__is_spatial=True, is_required=True, **scenario_filter
+    ).filter(
+        Exists(CoinAssignment.objects.filter(
+            response=OuterRef(OuterRef('pk')), scenario=OuterRef('scenario')
+        ).filter(get_unanswered_unit_filter())) |
+        Exists(PlanningUnitAnswer.objects.filter(
+            response=OuterRef(OuterRef('pk')), question__scenario=OuterRef('scenario')
+        ).filter(get_unanswered_unit_filter()))
+    )
+    scenario_coins = CoinAssignment.objects.filter(
+        response=OuterRef(OuterRef('pk')), scenario=OuterRef('pk')
+    ).order_by().values('scenario').annotate(total=Sum('coins_assigned')).values('total')
+    missing_coins = Scenario.objects.filter(
+        survey=OuterRef('survey'), is_spatial=True, is_weighted=True, require_all_coins_used=True
+    ).annotate(coins=Coalesce(Subquery(scenario_coins), 0)).exclude(coins=F('total_coins'))
+    if scenario_id is not None:
+        missing_coins = missing_coins.filter(pk=scenario_id)
+
+    complete = Q(~Exists(missing_scenario_answers)) & Q(~Exists(missing_unit_answers)) & Q(~Exists(missing_coins))
+    if scenario_id is None:
+        complete &= Q(~Exists(missing_survey_answers))
+
+    return responses.annotate(
+        coins_used=Coalesce(Subquery(coins_used), 0),
+        areas_selected=Coalesce(Subquery(areas_selected), 0),
+        is_complete=Case(
+            When(complete, then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField()
+        )
+    )
+
+class CoinDensity(models.Model):
+    """
+    Aggregate of the coins all respondents assigned to a planning unit in a
+    scenario, kept up to date as coin assignments change.
+    """
+    scenario = models.ForeignKey(
+        Scenario,
+        on_delete=models.CASCADE,
+        related_name='coin_densities_scenario',
+        help_text="The scenario the coins were assigned in."
+    )
+    planning_unit = models.ForeignKey(
+        PlanningUnit,
+        on_delete=models.CASCADE,
+        related_name='coin_densities_planning_unit',
+        help_text="The planning unit the coins were assigned to."
+    )
+    total_coins = models.IntegerField(
+        default=0,
+        help_text="Total coins assigned to this planning unit by all respondents."
+    )
+    respondent_count = models.IntegerField(
+        default=0,
+        help_text="Number of responses that selected this planning unit."
+    )
+    mean_coins = models.FloatField(
+        default=0,
+        help_text="Mean coins assigned by the responses that selected this planning unit."
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.total_coins} coins to PU {self.planning_unit_id} in scenario {self.scenario_id}"
+
+    class Meta:
+        verbose_name = "Coin Density"
+        verbose_name_plural = "Coin Densities"
+        unique_together = ('scenario', 'planning_unit')
+
+def refresh_coin_density(scenario_id, unit_ids=None):
+    """
+    Recompute the coin density of the given planning units in a scenario (all
+    of them when unit_ids is None) from their coin assignments, with one
+    grouped query and one bulk upsert. Returns the number of rows written.
+    """
+    assignments = CoinAssignment.objects.filter(scenario_id=scenario_id)
+    densities = CoinDensity.objects.filter(scenario_id=scenario_id)
+    with transaction.atomic():
+        if unit_ids is None:
+            unit_ids = set(assignments.values_list('planning_unit_id', flat=True).distinct())
+            unit_ids.update(densities.values_list('planning_unit_id', flat=True))
+        else:
+            assignments = assignments.filter(planning_unit_id__in=unit_ids)
+            densities = densities.filter(planning_unit_id__in=unit_ids)
+        unit_ids = sorted(set(unit_ids))
+        if not unit_ids:
+            return 0
+        # Make sure every row exists and lock them all, in a fixed order, before reading the
+        # totals: a concurrent refresh of the same units then waits for this one to commit
+        # and its totals query sees this transaction's coins.
+        CoinDensity.objects.bulk_create([
+            CoinDensity(scenario_id=scenario_id, planning_unit_id=unit_id) for unit_id in unit_ids
+        ], batch_size=2000, ignore_conflicts=True)
+        list(densities.select_for_update().order_by('planning_unit_id').values_list('pk', flat=True))
+        totals = list(assignments.values_list('planning_unit_id').annotate(
+            total_coins=Sum('coins_assigned'),
+            respondent_count=Count('response_id')
+        ).order_by('planning_unit_id'))
+        CoinDensity.objects.bulk_create([
+            CoinDensity(
+                scenario_id=scenario_id,
+                planning_unit_id=planning_unit_id,
+                total_coins=total_coins,
+                respondent_count=respondent_count,
+                mean_coins=total_coins / respondent_count
+            )
+            for planning_unit_id, total_coins, respondent_count in totals
+        ], batch_size=2000, update_conflicts=True, unique_fields=['scenario', 'planning_unit'],
+            update_fields=['total_coins', 'respondent_count', 'mean_coins', 'updated_at'])
+        densities.exclude(planning_unit_id__in=[row[0] for row in totals]).delete()
+    return len(totals)
+
+def get_coin_density_tile(scenario_id, z, x, y):
+    """
+    Render the scenario's coin density as a Mapbox vector tile (layer
+    'coin_density') in PostGIS. Requires PostGIS 3.0 or later.
+    """
+    srid = PlanningUnit._meta.get_field('geometry').srid
+    sql = """
+        WITH bounds AS (
+            SELECT ST_TileEnvelope(%s, %s, %s) AS geom
+        ), tile AS (
+            SELECT
+                ST_AsMVTGeom(ST_Transform(pu.geometry, 3857), bounds.geom) AS geom,
+                density.planning_unit_id,
+                density.total_coins,
+                density.respondent_count,
+                density.mean_coins
+            FROM {density_table} density
+            JOIN {unit_table} pu ON pu.id = density.planning_unit_id
+            CROSS JOIN bounds
+            WHERE density.scenario_id = %s
+                AND pu.geometry && ST_Transform(bounds.geom, {srid})
+        )
+        SELECT ST_AsMVT(tile.*, 'coin_density', 4096, 'geom') FROM tile
+    """.format(
+        density_table=connection.ops.quote_name(CoinDensity._meta.db_table),
+        unit_table=connection.ops.quote_name(PlanningUnit._meta.db_table),
+        srid=int(srid)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [z, x, y, scenario_id])
+        tile = cursor.fetchone()[0]
+    return bytes(tile) if tile is not None else b''
+
+class ScenarioStatistic(models.Model):
+    """
+    Scenario-wide results of the last statistics run over a scenario's coin
+    matrix (see survey.stats).
+    """
+    scenario = models.OneToOneField(
+        Scenario,
+        on_delete=models.CASCADE,
+        related_name='scenario_statistic_scenario',
+        help_text="The scenario these statistics describe."
+    )
+    respondent_count = models.IntegerField(
+        default=0,
+        help_text="Number of responses that assigned coins in this scenario."
+    )
+    planning_unit_count = models.IntegerField(
+        default=0,
+        help_text="Number of planning units the statistics cover."
+    )
+    percentile = models.FloatField(
+        help_text="Percentile of coins reported for each planning unit."
+    )
+    bootstrap_samples = models.IntegerField(
+        help_text="Number of bootstrap resamples of respondents behind the confidence intervals."
+    )
+    confidence = models.FloatField(
+        help_text="Confidence level of the bootstrap intervals."
+    )
+    unit_gini = models.FloatField(
+        null=True,
+        help_text="Gini coefficient of total coins across planning units."
+    )
+    mean_respondent_gini = models.FloatField(
+        null=True,
+        help_text="Mean Gini coefficient of each respondent's coins across the units they selected."
+    )
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Statistics for scenario {self.scenario_id}"
+
+    class Meta:
+        verbose_name = "Scenario Statistic"
+        verbose_name_plural = "Scenario Statistics"
+
+class PlanningUnitStatistic(models.Model):
+    """
+    Per-unit results of the last statistics run over a scenario's coin
+    matrix. Respondents who did not select a unit count as assigning it 0 coins.
+    """
+    scenario = models.ForeignKey(
+        Scenario,
+        on_delete=models.CASCADE,
+        related_name='planning_unit_statistics_scenario',
+        help_text="The scenario these statistics describe."
+    )
+    planning_unit = models.ForeignKey(
+        PlanningUnit,
+        on_delete=models.CASCADE,
+        related_name='planning_unit_statistics_planning_unit',
+        help_text="The planning unit these statistics describe."
+    )
+    selection_share = models.FloatField(
+        help_text="Share of respondents that selected this planning unit."
+    )
+    mean_coins = models.FloatField(
+        help_text="Mean coins assigned to this planning unit per respondent."
+    )
+    median_coins = models.FloatField(
+        help_text="Median coins assigned to this planning unit per respondent."
+    )
+    percentile_coins = models.FloatField(
+        help_text="Coins at the scenario statistic's percentile for this planning unit."
+    )
+    gini = models.FloatField(
+        help_text="Gini coefficient of the coins respondents assigned to this planning unit."
+    )
+    mean_coins_ci_low = models.FloatField(
+        help_text="Lower bound of the bootstrap confidence interval of the mean coins."
+    )
+    mean_coins_ci_high = models.FloatField(
+        help_text="Upper bound of the bootstrap confidence interval of the mean coins."
+    )
+
+    def __str__(self):
+        return f"Statistics for PU {self.planning_unit_id} in scenario {self.scenario_id}"
+
+    class Meta:
+        verbose_name = "Planning Unit Statistic"
+        verbose_name_plural = "Planning Unit Statistics"
+        unique_together = ('scenario', 'planning_unit')
+
+class PlanningUnitNeighbourGraph(models.Model):
+    """
+    Contiguity graph of a planning unit family's units (units whose
+    geometries touch or overlap), stored as compressed CSR arrays for the
+    hotspot analysis (see survey.hotspots).
+    """
+    family = models.OneToOneField(
+        PlanningUnitFamily,
+        on_delete=models.CASCADE,
+        related_name='neighbour_graph_family',
+        help_text="The planning unit family this graph connects."
+    )
+    unit_count = models.IntegerField(
+        default=0,
+        help_text="Number of planning units in the graph."
+    )
+    edge_count = models.IntegerField(
+        default=0,
+        help_text="Number of pairs of neighbouring planning units."
+    )
+    graph = models.BinaryField(
+        help_text="Compressed .npz of the planning_unit_ids, indptr and indices arrays."
+    )
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Neighbour graph of family {self.family_id}"
+
+    class Meta:
+        verbose_name = "Planning Unit Neighbour Graph"
+        verbose_name_plural = "Planning Unit Neighbour Graphs"
+
+class PlanningUnitHotspot(models.Model):
+    """
+    Getis-Ord Gi* and local Moran's I of a planning unit's total coins in a
+    scenario, from the last hotspot analysis.
+    """
+    QUADRANT_CHOICES = [
+        ('HH', 'High-High'),
+        ('LL', 'Low-Low'),
+        ('HL', 'High-Low'),
+        ('LH', 'Low-High'),
+    ]
+    scenario = models.ForeignKey(
+        Scenario,
+        on_delete=models.CASCADE,
+        related_name='planning_unit_hotspots_scenario',
+        help_text="The scenario these results describe."
+    )
+    planning_unit = models.ForeignKey(
+        PlanningUnit,
+        on_delete=models.CASCADE,
+        related_name='planning_unit_hotspots_planning_unit',
+        help_text="The planning unit these results describe."
+    )
+    total_coins = models.FloatField(
+        help_text="Total coins assigned to this planning unit by all respondents."
+    )
+    gi_z_score = models.FloatField(
+        help_text="Getis-Ord Gi* z-score; high positive values are hotspots, low negative values coldspots."
+    )
+    gi_p_value = models.FloatField(
+        help_text="Two-sided p-value of the Gi* z-score."
+    )
+    moran_i = models.FloatField(
+        help_text="Local Moran's I."
+    )
+    moran_z_score = models.FloatField(
+        help_text="z-score of the local Moran's I under randomisation."
+    )
+    moran_p_value = models.FloatField(
+        help_text="Two-sided p-value of the local Moran's I z-score."
+    )
+    moran_quadrant = models.CharField(
+        max_length=2,
+        choices=QUADRANT_CHOICES,
+        blank=True,
+        help_text="Moran scatterplot quadrant of this planning unit and its neighbours."
+    )
+
+    def __str__(self):
+        return f"Hotspot results for PU {self.planning_unit_id} in scenario {self.scenario_id}"
+
+    class Meta:
+        verbose_name = "Planning Unit Hotspot"
+        verbose_name_plural = "Planning Unit Hotspots"
+        unique_together = ('scenario', 'planning_unit')
+
+def get_survey_option_counts(survey, option_ids=None):
+    """
+    Return how many respondents chose each option of the survey's choice
+    questions, as {'survey'|'scenario'|'planning_unit': {question_id:
+    {option_id: respondents}}}, with one grouped query per answer table over
+    the selected_option_ids arrays. Given option_ids, only those options are
+    counted, and the GIN index finds the answers that chose any of them.
+    """
+    response_table = connection.ops.quote_name(SurveyResponse._meta.db_table)
+    option_filter = ''
+    params = [survey.pk]
+    if option_ids is not None:
+        option_ids = list(option_ids)
+        option_filter = 'AND answer.selected_option_ids && %s::integer[] AND option_id = ANY(%s)'
+        params += [option_ids, option_ids]
+    option_counts = {}
+    for answer_type, answer_model in [
+        ('survey', SurveyAnswer),
+        ('scenario', ScenarioAnswer),
+        ('planning_unit', PlanningUnitAnswer),
+    ]:
+        sql = """
+            SELECT answer.question_id, option_id, COUNT(DISTINCT answer.response_id)
+            FROM {answer_table} answer
+            JOIN {response_table} response ON response.id = answer.response_id
+            CROSS JOIN LATERAL unnest(answer.selected_option_ids) AS option_id
+            WHERE response.survey_id = %s {option_filter}
+            GROUP BY answer.question_id, option_id
+        """.format(
+            answer_table=connection.ops.quote_name(answer_model._meta.db_table),
+            response_table=response_table,
+            option_filter=option_filter
+        )
+        counts = {}
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            for question_id, option_id, respondents in cursor.fetchall():
+                counts.setdefault(question_id, {})[option_id] = respondents
+        option_counts[answer_type] = counts
+    return option_counts
+
+QUESTION_HISTOGRAM_BINS = 10
+
+class QuestionSummary(models.Model):
+    """
+    Running answer counters of a question, or of a planning unit question at
+    one planning unit, moved by the difference each answer write makes so the
+    results pages read one row per question instead of scanning the answers.
+    Option counts and histogram bins are kept as QuestionSummaryCount rows.
+    """
+    ANSWER_TYPE_CHOICES = [
+        ('survey', 'Survey'),
+        ('scenario', 'Scenario'),
+        ('planning_unit', 'Planning Unit'),
+    ]
+    survey = models.ForeignKey(
+        Survey,
+        on_delete=models.CASCADE,
+        related_name='question_summaries_survey',
+        help_text="The survey the question belongs to."
+    )
+    answer_type = models.CharField(
+        max_length=20,
+        choices=ANSWER_TYPE_CHOICES,
+        help_text="Kind of question summarised, which determines the table question_id refers to."
+    )
+    question_id = models.IntegerField(
+        help_text="ID of the survey, scenario or planning unit question summarised."
+    )
+    planning_unit = models.ForeignKey(
+        PlanningUnit,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='question_summaries_planning_unit',
+        help_text="For planning unit questions, the planning unit summarised; empty for the question as a whole."
+    )
+    response_count = models.IntegerField(
+        default=0,
+        help_text="Number of responses that answered the question."
+    )
+    numeric_count = models.IntegerField(
+        default=0,
+        help_text="Number of numeric answers."
+    )
+    numeric_sum = models.FloatField(
+        default=0,
+        help_text="Sum of the numeric answers, from which the mean is derived."
+    )
+    numeric_min = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Smallest numeric answer."
+    )
+    numeric_max = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Largest numeric answer."
+    )
+    histogram_low = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Lower edge of the equal-width histogram bins. The bins only widen, when an answer falls outside them."
+    )
+    histogram_high = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Upper edge of the equal-width histogram bins."
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        if self.planning_unit_id is not None:
+            return f"Summary of {self.answer_type} question {self.question_id} at PU {self.planning_unit_id}"
+        return f"Summary of {self.answer_type} question {self.question_id}"
+
+    class Meta:
+        verbose_name = "Question Summary"
+        verbose_name_plural = "Question Summaries"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['answer_type', 'question_id', 'planning_unit'],
+                name='survey_qsummary_unit_unique'
+            ),
+            models.UniqueConstraint(
+                fields=['answer_type', 'question_id'],
+                condition=Q(planning_unit__isnull=True),
+                name='survey_qsummary_question_unique'
+            ),
+        ]
+
+class QuestionSummaryCount(models.Model):
+    """
+    One counter of a question summary: the responses that chose an option,
+    or the numeric answers in a histogram bin. Counters that reach zero are
+    removed.
+    """
+    KIND_CHOICES = [
+        ('option', 'Option'),
+        ('bin', 'Histogram Bin'),
+    ]
+    summary = models.ForeignKey(
+        QuestionSummary,
+        on_delete=models.CASCADE,
+        related_name='question_summary_counts_summary',
+        help_text="The question summary this counter belongs to."
+    )
+    kind = models.CharField(
+        max_length=10,
+        choices=KIND_CHOICES,
+        help_text="Whether the counter is of an option or of a histogram bin."
+    )
+    key = models.IntegerField(
+        help_text="The option ID, or the histogram bin number counting from 1."
+    )
+    count = models.IntegerField(
+        default=0,
+        help_text="Number of responses choosing the option, or of numeric answers in the bin."
+    )
+
+    def __str__(self):
+        return f"{self.kind} {self.key} of summary {self.summary_id}: {self.count}"
+
+    class Meta:
+        verbose_name = "Question Summary Count"
+        verbose_name_plural = "Question Summary Counts"
+        constraints = [
+            models.UniqueConstraint(fields=['summary', 'kind', 'key'], name='survey_qsumcount_key_unique'),
+        ]
+
+QUESTION_SUMMARY_ANSWER_MODELS = {
+    'survey': SurveyAnswer,
+    'scenario': ScenarioAnswer,
+    'planning_unit': PlanningUnitAnswer,
+}
+
+QUESTION_SUMMARY_ANSWER_TYPES = {model: answer_type for answer_type, model in QUESTION_SUMMARY_ANSWER_MODELS.items()}
+
+def get_histogram_bins(low, high, counts):
+    if low == high:
+        return [{'min': low, 'max': high, 'count': sum(counts.values())}]
+    width = (high - low) / QUESTION_HISTOGRAM_BINS
+    return [
+        {'min': low + width * bucket, 'max': low + width * (bucket + 1), 'count': counts.get(bucket + 1, 0)}
+        for bucket in range(QUESTION_HISTOGRAM_BINS)
+    ]
+
+def get_histogram_bucket(value, low, high):
+    # The width_bucket in summarise_answers, in Python
+    if low == high:
+        return 1
+    bucket = int((value - low) / (high - low) * QUESTION_HISTOGRAM_BINS) + 1
+    return max(1, min(bucket, QUESTION_HISTOGRAM_BINS))
+
+def summarise_answers(answer_model, question_ids, number_question_ids, unit_ids=None, by_unit=False):
+    """
+    Aggregate answers to the given questions, per question or per (question,
+    planning unit) when by_unit is set, with one grouped query each for the
+    counts, the options and the histograms. Returns {(question_id,
+    planning_unit_id): summary fields}, with the option and bin counters under
+    'option_counts' and 'bin_counts'.
+    """
+    answers = answer_model.objects.filter(question_id__in=question_ids)
+    key_columns = ['question_id']
+    where = 'answer.question_id = ANY(%s)'
+    params = [list(question_ids)]
+    if by_unit:
+        key_columns.append('planning_unit_id')
+        if unit_ids is not None:
+            answers = answers.filter(planning_unit_id__in=unit_ids)
+            where += ' AND answer.planning_unit_id = ANY(%s)'
+            params.append(list(unit_ids))
+    keys = ', '.join('answer.{}'.format(column) for column in key_columns)
+
+    summaries = {}
+    totals = answers.values_list(*key_columns).annotate(
+        response_count=Count('response_id', distinct=True),
+        numeric_count=Count('numeric_answer'),
+        numeric_sum=Coalesce(Sum('numeric_answer'), 0.0),
+        numeric_min=Min('numeric_answer'),
+        numeric_max=Max('numeric_answer')
+    ).order_by()
+    for row in totals:
+        key = tuple(row[:len(key_columns)]) + (None,) * (2 - len(key_columns))
+        summaries[key] = dict(
+            zip(['response_count', 'numeric_count', 'numeric_sum', 'numeric_min', 'numeric_max'], row[len(key_columns):]),
+            histogram_low=None,
+            histogram_high=None,
+            option_counts={},
+            bin_counts={}
+        )
+    if not summaries:
+        return summaries
+
+    answer_table = connection.ops.quote_name(answer_model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT {keys}, option_id, COUNT(DISTINCT answer.response_id)
+            FROM {answer_table} answer
+            CROSS JOIN LATERAL unnest(answer.selected_option_ids) AS option_id
+            WHERE {where}
+            GROUP BY {keys}, option_id
+        """.format(keys=keys, answer_table=answer_table, where=where), params)
+        for *key, option_id, respondents in cursor.fetchall():
+            key = tuple(key) + (None,) * (2 - len(key))
+            summaries[key]['option_counts'][option_id] = respondents
+
+        if number_question_ids:
+            # Bucket 1..N between each key's own min and max; the max itself lands in bucket N
+            cursor.execute("""
+                SELECT {keys}, bucket, COUNT(*) FROM (
+                    SELECT {keys},
+                        CASE WHEN MIN(answer.numeric_answer) OVER w = MAX(answer.numeric_answer) OVER w THEN 1
+                        ELSE LEAST(width_bucket(
+                            answer.numeric_answer, MIN(answer.numeric_answer) OVER w,
+                            MAX(answer.numeric_answer) OVER w, %s
+                        ), %s) END AS bucket
+                    FROM {answer_table} answer
+                    WHERE {where} AND answer.numeric_answer IS NOT NULL AND answer.question_id = ANY(%s)
+                    WINDOW w AS (PARTITION BY {keys})
+                ) answer
+                GROUP BY {keys}, bucket
+            """.format(keys=keys, answer_table=answer_table, where=where), [
+                QUESTION_HISTOGRAM_BINS, QUESTION_HISTOGRAM_BINS, *params, list(number_question_ids)
+            ])
+            for *key, bucket, count in cursor.fetchall():
+                key = tuple(key) + (None,) * (2 - len(key))
+                summary = summaries[key]
+                summary['histogram_low'] = summary['numeric_min']
+                summary['histogram_high'] = summary['numeric_max']
+                summary['bin_counts'][bucket] = count
+    return summaries
+
+def refresh_question_summaries(answer_type, question_ids):
+    """
+    Rebuild the summaries of the given questions from their answers, and for
+    planning unit questions those of every planning unit as well. Answer
+    writes move the counters themselves (see update_question_summaries); this
+    is for the rebuild command. Returns the number of summaries written.
+    """
+    answer_model = QUESTION_SUMMARY_ANSWER_MODELS[answer_type]
+    question_model = answer_model._meta.get_field('question').related_model
+    question_ids = list(question_ids)
+    if not question_ids:
+        return 0
+    survey_field = 'survey_id' if answer_type == 'survey' else 'scenario__survey_id'
+    questions = {
+        question_id: (question_type, survey_id)
+        for question_id, question_type, survey_id in question_model.objects.filter(
+            pk__in=question_ids
+        ).values_list('pk', 'question_type', survey_field)
+    }
+    number_question_ids = [
+        question_id for question_id, (question_type, survey_id) in questions.items() if question_type == 'number'
+    ]
+
+    with transaction.atomic():
+        # Deleting first waits for writers holding the old rows, so the aggregates below include their answers
+        QuestionSummary.objects.filter(answer_type=answer_type, question_id__in=question_ids).delete()
+        summaries = {}
+        if questions:
+            summaries = summarise_answers(answer_model, list(questions), number_question_ids)
+            if answer_type == 'planning_unit':
+                summaries.update(summarise_answers(answer_model, list(questions), number_question_ids, by_unit=True))
+        counters = []
+        rows = []
+        for (question_id, planning_unit_id), fields in summaries.items():
+            counters.append([
+                ('option', fields.pop('option_counts')),
+                ('bin', fields.pop('bin_counts')),
+            ])
+            rows.append(QuestionSummary(
+                survey_id=questions[question_id][1],
+                answer_type=answer_type,
+                question_id=question_id,
+                planning_unit_id=planning_unit_id,
+                **fields
+            ))
+        created = QuestionSummary.objects.bulk_create(rows, batch_size=2000)
+        QuestionSummaryCount.objects.bulk_create([
+            QuestionSummaryCount(summary_id=summary.pk, kind=kind, key=key, count=count)
+            for summary, summary_counters in zip(created, counters)
+            for kind, counts in summary_counters
+            for key, count in counts.items()
+        ], batch_size=2000)
+    return len(created)
+
+def refresh_survey_question_summaries(survey):
+    """Rebuild every question summary of a survey. Returns the number of rows written."""
+    with transaction.atomic():
+        QuestionSummary.objects.filter(survey=survey).delete()
+        return sum([
+            refresh_question_summaries('survey', SurveyQuestion.objects.filter(survey=survey).values_list('pk', flat=True)),
+            refresh_question_summaries('scenario', ScenarioQuestion.objects.filter(scenario__survey=survey).values_list('pk', flat=True)),
+            refresh_question_summaries('planning_unit', PlanningUnitQuestion.objects.filter(scenario__survey=survey).values_list('pk', flat=True)),
+        ])
+
+def get_answer_summary_state(answer):
+    """Return the parts of an answer the question summaries count."""
+    numeric_answer = float(answer.numeric_answer) if answer.numeric_answer is not None else None
+    return (getattr(answer, 'planning_unit_id', None), tuple(answer.selected_option_ids), numeric_answer)
+
+def get_answer_summary_states(answer_model, response_id, question_id, lock=False):
+    """
+    Return a response's answers to a question as {answer ID: (planning unit
+    ID, option IDs, numeric answer)}, locking the rows when lock is set.
+    """
+    answers = answer_model.objects.filter(response_id=response_id, question_id=question_id).order_by('pk')
+    if lock:
+        answers = answers.select_for_update()
+    if answer_model is not PlanningUnitAnswer:
+        answers = answers.annotate(planning_unit_id=Value(None, output_field=models.IntegerField()))
+    return {
+        pk: (planning_unit_id, tuple(option_ids), numeric_answer)
+        for pk, planning_unit_id, option_ids, numeric_answer in answers.values_list(
+            'pk', 'planning_unit_id', 'selected_option_ids', 'numeric_answer'
+        )
+    }
+
+def add_question_summary_counts(summary_id, kind, deltas):
+    """Add {key: change} to a summary's counters of one kind, removing those that reach zero."""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    counts = QuestionSummaryCount.objects.filter(summary_id=summary_id, kind=kind)
+    QuestionSummaryCount.objects.bulk_create([
+        QuestionSummaryCount(summary_id=summary_id, kind=kind, key=key)
+        for key, delta in deltas.items() if delta > 0
+    ], ignore_conflicts=True)
+    for delta in set(deltas.values()):
+        counts.filter(key__in=[key for key in deltas if deltas[key] == delta]).update(count=F('count') + delta)
+    counts.filter(key__in=list(deltas), count__lte=0).delete()
+
+def update_question_summary(answer_model, question_id, planning_unit_id, survey_id, before, after):
+    """
+    Move one summary's counters from the (planning unit ID, option IDs,
+    numeric answer) states of a response's answers in before to those in
+    after. Only a removed extreme or a number outside the histogram reads
+    the question's answers again.
+    """
+    answer_type = QUESTION_SUMMARY_ANSWER_TYPES[answer_model]
+    response_delta = bool(after) - bool(before)
+    before_options = {option_id for state in before for option_id in state[1]}
+    after_options = {option_id for state in after for option_id in state[1]}
+    before_numbers = Counter(state[2] for state in before if state[2] is not None)
+    after_numbers = Counter(state[2] for state in after if state[2] is not None)
+    added = list((after_numbers - before_numbers).elements())
+    removed = list((before_numbers - after_numbers).elements())
+    if not (response_delta or added or removed or before_options != after_options):
+        return
+
+    summaries = QuestionSummary.objects.filter(
+        answer_type=answer_type,
+        question_id=question_id,
+        planning_unit_id=planning_unit_id
+    )
+    if added or after_options or response_delta > 0:
+        # Removals never create rows, so a cascading survey delete cannot leave summaries behind
+        QuestionSummary.objects.bulk_create([
+            QuestionSummary(
+                survey_id=survey_id,
+                answer_type=answer_type,
+                question_id=question_id,
+                planning_unit_id=planning_unit_id
+            )
+        ], ignore_conflicts=True)
+    updates = {
+        'response_count': F('response_count') + response_delta,
+        'numeric_count': F('numeric_count') + (len(added) - len(removed)),
+        'numeric_sum': F('numeric_sum') + float(sum(added) - sum(removed)),
+        'updated_at': timezone.now(),
+    }
+    if added:
+        # LEAST and GREATEST skip NULLs, so the first number sets both
+        updates['numeric_min'] = Least('numeric_min', Value(min(added)))
+        updates['numeric_max'] = Greatest('numeric_max', Value(max(added)))
+    # The UPDATE locks the row until the answers commit, so writers of the same question queue up here
+    if not summaries.update(**updates):
+        return
+    summary = summaries.values(
+        'pk', 'numeric_count', 'numeric_min', 'numeric_max', 'histogram_low', 'histogram_high'
+    ).get()
+    add_question_summary_counts(summary['pk'], 'option', dict(
+        [(option_id, 1) for option_id in after_options - before_options]
+        + [(option_id, -1) for option_id in before_options - after_options]
+    ))
+    if not (added or removed):
+        return
+
+    if not summary['numeric_count']:
+        summaries.update(numeric_sum=0, numeric_min=None, numeric_max=None, histogram_low=None, histogram_high=None)
+        QuestionSummaryCount.objects.filter(summary_id=summary['pk'], kind='bin').delete()
+        return
+    if removed and (
+        summary['numeric_min'] is None
+        or min(removed) <= summary['numeric_min']
+        or max(removed) >= summary['numeric_max']
+    ):
+        answers = answer_model.objects.filter(question_id=question_id)
+        if planning_unit_id is not None:
+            answers = answers.filter(planning_unit_id=planning_unit_id)
+        summaries.update(**answers.aggregate(numeric_min=Min('numeric_answer'), numeric_max=Max('numeric_answer')))
+
+    low, high = summary['histogram_low'], summary['histogram_high']
+    if added and (low is None or min(added) < low or max(added) > high):
+        # The bins only widen, so after the first few answers this is rare
+        key = (question_id, planning_unit_id)
+        fields = summarise_answers(
+            answer_model, [question_id], [question_id],
+            unit_ids=[planning_unit_id] if planning_unit_id is not None else None,
+            by_unit=planning_unit_id is not None
+        )[key]
+        summaries.update(histogram_low=fields['histogram_low'], histogram_high=fields['histogram_high'])
+        QuestionSummaryCount.objects.filter(summary_id=summary['pk'], kind='bin').delete()
+        QuestionSummaryCount.objects.bulk_create([
+            QuestionSummaryCount(summary_id=summary['pk'], kind='bin', key=bucket, count=count)
+            for bucket, count in fields['bin_counts'].items()
+        ])
+    elif low is not None:
+        bins = Counter(get_histogram_bucket(value, low, high) for value in added)
+        bins.subtract(get_histogram_bucket(value, low, high) for value in removed)
+        add_question_summary_counts(summary['pk'], 'bin', bins)
+
+def update_question_summaries(answer_model, question_id, before, after):
+    """
+    Apply a change to one response's answers to a question, given as its
+    answers before and after in the form get_answer_summary_states returns,
+    to the summary of the question and of each planning unit whose answer
+    changed. Call it in the transaction that writes the answers.
+    """
+    changed_states = [
+        state for key, state in list(before.items()) + list(after.items())
+        if before.get(key) != after.get(key)
+    ]
+    if not changed_states:
+        return
+    survey_id = None
+    if after:
+        question_model = answer_model._meta.get_field('question').related_model
+        survey_field = 'survey_id' if answer_model is SurveyAnswer else 'scenario__survey_id'
+        survey_id = question_model.objects.filter(pk=question_id).values_list(survey_field, flat=True).first()
+        if survey_id is None:
+            return
+    # The question as a whole, then each planning unit answered differently
+    for planning_unit_id in [None] + sorted({state[0] for state in changed_states if state[0] is not None}):
+        update_question_summary(
+            answer_model,
+            question_id,
+            planning_unit_id,
+            survey_id,
+            [state for state in before.values() if planning_unit_id in (None, state[0])],
+            [state for state in after.values() if planning_unit_id in (None, state[0])]
+        )
+
+def get_survey_question_summaries(survey):
+    """
+    Return the stored summaries of a survey's questions as
+    {'survey'|'scenario'|'planning_unit': {question_id: summary}}, where a
+    planning unit question's summary has its per-unit summaries under 'units'.
+    """
+    summaries = {answer_type: {} for answer_type in QUESTION_SUMMARY_ANSWER_MODELS}
+    counts = {}
+    for summary_id, kind, key, count in QuestionSummaryCount.objects.filter(
+        summary__survey=survey
+    ).order_by('summary_id', 'kind', 'key').values_list('summary_id', 'kind', 'key', 'count'):
+        counts.setdefault((summary_id, kind), {})[key] = count
+    rows = QuestionSummary.objects.filter(survey=survey).order_by('answer_type', 'question_id', 'planning_unit_id')
+    units = {}
+    for row in rows.values(
+        'pk', 'answer_type', 'question_id', 'planning_unit_id', 'response_count', 'numeric_count', 'numeric_sum',
+        'numeric_min', 'numeric_max', 'histogram_low', 'histogram_high'
+    ):
+        summary = {
+            'response_count': row['response_count'],
+            'option_counts': {str(key): count for key, count in counts.get((row['pk'], 'option'), {}).items()},
+            'numeric_count': row['numeric_count'],
+            'numeric_mean': row['numeric_sum'] / row['numeric_count'] if row['numeric_count'] else None,
+            'numeric_min': row['numeric_min'],
+            'numeric_max': row['numeric_max'],
+            'numeric_histogram': get_histogram_bins(
+                row['histogram_low'], row['histogram_high'], counts.get((row['pk'], 'bin'), {})
+            ) if row['histogram_low'] is not None else [],
+        }
+        if row['planning_unit_id'] is None:
+            summaries[row['answer_type']][row['question_id']] = summary
+        else:
+            units.setdefault(row['question_id'], {})[row['planning_unit_id']] = summary
+    for question_id, summary in summaries['planning_unit'].items():
+        summary['units'] = units.get(question_id, {})
+    return summaries
+
+def bulk_create_rows(model, rows, remap=None, values=None):
+    """
+    Bulk-insert a copy of each row (a dict of attnames plus the original
+    'pk'), pointing each foreign key in remap (attname -> {old ID: new ID})
+    at the copied parents and setting the fields in values. Returns {old ID:
+    new ID}.
+    """
+    remap = remap or {}
+    values = values or {}
+    copies = model.objects.bulk_create([
+        model(**{
+            name: remap[name][value] if name in remap and value is not None else values.get(name, value)
+            for name, value in row.items() if name != 'pk'
+        })
+        for row in rows
+    ], batch_size=1000)
+    return {row['pk']: copy.pk for row, copy in zip(rows, copies)}
+
+def clone_rows(model, queryset, remap=None, values=None):
+    """Bulk-copy the rows of a queryset with bulk_create_rows. Returns {old ID: new ID}."""
+    field_names = [field.attname for field in model._meta.concrete_fields if not field.primary_key]
+    return bulk_create_rows(model, list(queryset.order_by('pk').values('pk', *field_names)), remap, values)
+
+def clone_survey(survey, title=None):
+    """
+    Copy a survey with its scenarios, questions, options, layer groups and
+    layer orders in one transaction, with one bulk INSERT per table.
+    Responses are not copied. Returns the new survey.
+    """
+    with transaction.atomic():
+        survey_ids = clone_rows(
+            Survey, Survey.objects.filter(pk=survey.pk),
+            values={'title': title if title is not None else f"{survey.title} (copy)"}
+        )
+        new_survey = Survey.objects.get(pk=survey_ids[survey.pk])
+        new_survey.groups.set(survey.groups.all())
+
+        scenario_ids = clone_rows(Scenario, Scenario.objects.filter(survey=survey), {'survey_id': survey_ids})
+        question_ids = clone_rows(SurveyQuestion, SurveyQuestion.objects.filter(survey=survey), {'survey_id': survey_ids})
+        scenario_question_ids = clone_rows(
+            ScenarioQuestion, ScenarioQuestion.objects.filter(scenario__survey=survey), {'scenario_id': scenario_ids}
+        )
+        planning_unit_question_ids = clone_rows(
+            PlanningUnitQuestion, PlanningUnitQuestion.objects.filter(scenario__survey=survey), {'scenario_id': scenario_ids}
+        )
+        clone_rows(
+            SurveyQuestionOption, SurveyQuestionOption.objects.filter(question__survey=survey),
+            {'question_id': question_ids}
+        )
+        clone_rows(
+            ScenarioQuestionOption, ScenarioQuestionOption.objects.filter(question__scenario__survey=survey),
+            {'question_id': scenario_question_ids}
+        )
+        clone_rows(
+            PlanningUnitQuestionOption, PlanningUnitQuestionOption.objects.filter(question__scenario__survey=survey),
+            {'question_id': planning_unit_question_ids}
+        )
+
+        layer_group_ids = clone_rows(
+            SurveyLayerGroup, SurveyLayerGroup.objects.filter(survey=survey), {'survey_id': survey_ids}
+        )
+        clone_rows(
+            SurveyLayerOrder, SurveyLayerOrder.objects.filter(layer_group__survey=survey),
+            {'layer_group_id': layer_group_ids}
+        )
+    return new_survey
@@ -0,0 +1,160 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from layers.models import Layer
+
+from .cache import (
+    clear_response_access_cache, clear_survey_access_cache, clear_survey_layer_groups_cache,
+    clear_user_access_cache,
+)
+from .models import (
+    CoinAssignment, PlanningUnitAnswer, PlanningUnitQuestion, PlanningUnitQuestionOption, QuestionSummary,
+    Scenario, ScenarioAnswer, ScenarioQuestion, ScenarioQuestionOption, Survey, SurveyAnswer, SurveyLayerGroup,
+    SurveyLayerOrder, SurveyQuestion, SurveyQuestionOption, SurveyResponse, get_answer_summary_state,
+    get_answer_summary_states, refresh_coin_density, update_question_summaries,
+)
+
+@receiver([post_save, post_delete], sender=SurveyLayerGroup)
+def survey_layer_group_changed(sender, instance, **kwargs):
+    clear_survey_layer_groups_cache([instance.survey_id])
+
+@receiver([post_save, post_delete], sender=SurveyLayerOrder)
+def survey_layer_order_changed(sender, instance, **kwargs):
+    # During a cascading delete the group may already be gone; its own signal clears the cache
+    survey_ids = SurveyLayerGroup.objects.filter(
+        pk=instance.layer_group_id
+    ).values_list('survey_id', flat=True)
+    clear_survey_layer_groups_cache(survey_ids)
+
+@receiver(post_save, sender=Layer)
+def layer_changed(sender, instance, **kwargs):
+    # Layer names and slugs are part of the cached layer picker
+    survey_ids = SurveyLayerOrder.objects.filter(
+        layer=instance
+    ).values_list('layer_group__survey_id', flat=True).distinct()
+    clear_survey_layer_groups_cache(survey_ids)
+
+@receiver([post_save, post_delete], sender=Survey)
+def survey_access_changed(sender, instance, **kwargs):
+    clear_survey_access_cache([instance.pk])
+
+@receiver(post_delete, sender=SurveyResponse)
+def survey_response_access_changed(sender, instance, **kwargs):
+    clear_response_access_cache(instance.user_id, instance.pk)
+
+@receiver([post_save, post_delete], sender='mapgroups.MapGroupMember')
+def map_group_member_changed(sender, instance, **kwargs):
+    clear_user_access_cache([instance.user_id])
+
+# Lookup from Survey to the changed row, and the row's field holding that ID
+SURVEY_SCHEMA_LOOKUPS = {
+    Scenario: ('pk', 'survey_id'),
+    SurveyQuestion: ('pk', 'survey_id'),
+    ScenarioQuestion: ('scenarios_survey', 'scenario_id'),
+    PlanningUnitQuestion: ('scenarios_survey', 'scenario_id'),
+    SurveyQuestionOption: ('survey_questions_survey', 'question_id'),
+    ScenarioQuestionOption: ('scenarios_survey__scenario_questions_scenario', 'question_id'),
+    PlanningUnitQuestionOption: ('scenarios_survey__planning_unit_questions_scenario', 'question_id'),
+}
+
+@receiver([post_save, post_delete], sender=Scenario)
+@receiver([post_save, post_delete], sender=SurveyQuestion)
+@receiver([post_save, post_delete], sender=ScenarioQuestion)
+@receiver([post_save, post_delete], sender=PlanningUnitQuestion)
+@receiver([post_save, post_delete], sender=SurveyQuestionOption)
+@receiver([post_save, post_delete], sender=ScenarioQuestionOption)
+@receiver([post_save, post_delete], sender=PlanningUnitQuestionOption)
+def survey_schema_changed(sender, instance, **kwargs):
+    # Only the survey has a timestamp, so bump it to move the schema version on.
+    # An UPDATE sends no post_save, leaving the survey's other receivers alone.
+    # Access records hold the survey and its scenarios, so they are dropped too.
+    lookup, field_name = SURVEY_SCHEMA_LOOKUPS[sender]
+    survey_ids = list(Survey.objects.filter(**{lookup: getattr(instance, field_name)}).values_list('pk', flat=True))
+    Survey.objects.filter(pk__in=survey_ids).update(updated_at=timezone.now())
+    clear_survey_access_cache(survey_ids)
+
+@receiver(m2m_changed, sender=Survey.groups.through)
+def survey_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # From the group side, instance is the group and pk_set holds survey IDs
+    if reverse and action == 'pre_clear':
+        # post_clear is not told which surveys were removed
+        instance._cleared_survey_ids = list(instance.surveys_groups.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        clear_survey_access_cache(pk_set if reverse else [instance.pk])
+    elif action == 'post_clear':
+        clear_survey_access_cache(getattr(instance, '_cleared_survey_ids', []) if reverse else [instance.pk])
+
+# Bulk coin writes refresh the density themselves; these cover single saves and deleted responses
+@receiver(post_save, sender=CoinAssignment)
+def coin_assignment_saved(sender, instance, **kwargs):
+    refresh_coin_density(instance.scenario_id, [instance.planning_unit_id])
+
+@receiver(pre_delete, sender=SurveyResponse)
+def survey_response_deleting(sender, instance, **kwargs):
+    instance._coin_density_units = list(
+        instance.coin_assignments_response.values_list('scenario_id', 'planning_unit_id')
+    )
+
+@receiver(post_delete, sender=SurveyResponse)
+def survey_response_deleted(sender, instance, **kwargs):
+    units = {}
+    for scenario_id, planning_unit_id in getattr(instance, '_coin_density_units', []):
+        units.setdefault(scenario_id, []).append(planning_unit_id)
+    for scenario_id, unit_ids in units.items():
+        refresh_coin_density(scenario_id, unit_ids)
+
+# Answer saves run in a transaction (see Answer.save), which the summary updates join
+@receiver(pre_save, sender=SurveyAnswer)
+@receiver(pre_save, sender=ScenarioAnswer)
+@receiver(pre_save, sender=PlanningUnitAnswer)
+def answer_saving(sender, instance, **kwargs):
+    instance._summary_states = get_answer_summary_states(
+        sender, instance.response_id, instance.question_id, lock=True
+    )
+
+@receiver(post_save, sender=SurveyAnswer)
+@receiver(post_save, sender=ScenarioAnswer)
+@receiver(post_save, sender=PlanningUnitAnswer)
+def answer_saved(sender, instance, **kwargs):
+    before = getattr(instance, '_summary_states', {})
+    after = dict(before)
+    after[instance.pk] = get_answer_summary_state(instance)
+    update_question_summaries(sender, instance.question_id, before, after)
+
+# One delete can remove several answers of a response to the same question (a
+# response, or a set of planning units), and each post_delete only sees its own
+# answer. The pre_delete signals, all sent before anything is deleted, collect
+# the answers on the object the delete started from, and the first post_delete
+# of each answer model applies them together.
+@receiver(pre_delete, sender=SurveyAnswer)
+@receiver(pre_delete, sender=ScenarioAnswer)
+@receiver(pre_delete, sender=PlanningUnitAnswer)
+def answer_deleting(sender, instance, origin, **kwargs):
+    deleted_answers = origin.__dict__.setdefault('_deleted_answers', {})
+    deleted_answers.setdefault(sender, []).append(instance)
+
+@receiver(post_delete, sender=SurveyAnswer)
+@receiver(post_delete, sender=ScenarioAnswer)
+@receiver(post_delete, sender=PlanningUnitAnswer)
+def answer_deleted(sender, instance, origin, **kwargs):
+    answers = {}
+    for answer in getattr(origin, '_deleted_answers', {}).pop(sender, []):
+        answers.setdefault((answer.response_id, answer.question_id), {})[answer.pk] = get_answer_summary_state(answer)
+    for (response_id, question_id), deleted_states in answers.items():
+        after = {
+            answer_id: state
+            for answer_id, state in get_answer_summary_states(sender, response_id, question_id).items()
+            if answer_id not in deleted_states
+        }
+        update_question_summaries(sender, question_id, {**after, **deleted_states}, after)
+
+@receiver(post_delete, sender=SurveyQuestion)
+@receiver(post_delete, sender=ScenarioQuestion)
+@receiver(post_delete, sender=PlanningUnitQuestion)
+def question_deleted(sender, instance, **kwargs):
+    answer_type = {
+        SurveyQuestion: 'survey',
+        ScenarioQuestion: 'scenario',
+        PlanningUnitQuestion: 'planning_unit',
+    }[sender]
+    QuestionSummary.objects.filter(answer_type=answer_type, question_id=instance.pk).delete()
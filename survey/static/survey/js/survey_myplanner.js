@@ -587,6 +587,35 @@ app.survey.removePlanningUnit = function(planning_unit_id) {
     });
 }
 
+app.survey.removeAllPlanningUnitsRUS = function() {
+    if (window.confirm("Do you want to delete all areas in this scenario and all of their data?")) {
+        app.survey.removePlanningUnits(null);
+    }
+}
+
+app.survey.removePlanningUnits = function(planning_unit_ids) {
+    // planning_unit_ids: array of IDs, or null to remove every area in the scenario
+    let url = '/survey/area/delete/'+app.survey.response_id+'/'+app.survey.scenario.id+'/';
+    let csrftoken = document.querySelector('[name=csrfmiddlewaretoken]').value;
+    let data = planning_unit_ids ? {unit_ids: planning_unit_ids.join(',')} : {all: 'true'};
+    $.ajax({
+        url: url,
+        type: 'POST',
+        headers: { 'X-CSRFToken': csrftoken },
+        data: data,
+        success: function(data) {
+            if (data.status === 'success') {
+                loadSurveyScenario(app.survey.survey_id, app.survey.response_id, app.survey.scenario.id, app.survey.next_scenario_id);
+            } else {
+                window.alert('Error removing planning units. Please try again.');
+            }
+        },
+        error: function() {
+            window.alert('Error removing planning units. Please try again.');
+        }
+    });
+}
+
 app.survey.pu_assign_next_clicked = function() {
     // Logic for 'next' button click
     // console.log('PU Assign Next Clicked');
@@ -812,3 +841,65 @@ function enableSurveyLayerControls(layerGroups) {
 
 }
 
+
+////////////////////////////////////////////////
+// Offline Operation Queue
+////////////////////////////////////////////////
+
+app.survey.pendingOperations = [];
+// Operations the server rejected, kept aside so they no longer block the queue
+app.survey.rejectedOperations = [];
+
+app.survey.queueOperation = function(operation) {
+    // operation: {op: 'select_units'|'set_coins'|'save_answers'|'delete_areas', scenario_id, unit_ids, coins, answers}
+    operation.key = operation.key || (Date.now().toString(36) + '-' + Math.random().toString(36).slice(2));
+    // Coins only mean something in weighted scenarios
+    if (app.survey.scenario && app.survey.scenario.id == operation.scenario_id && !app.survey.scenario.is_weighted) {
+        delete operation.coins;
+    }
+    app.survey.pendingOperations.push(operation);
+    return operation.key;
+}
+
+app.survey.flushOperations = function(successCallback) {
+    if (app.survey.pendingOperations.length == 0 || !app.survey.response_id) {
+        return;
+    }
+    let csrftoken = document.querySelector('[name=csrfmiddlewaretoken]').value;
+    // Keep the batch queued until the server confirms it; keys make retries safe
+    let batch = app.survey.pendingOperations.slice();
+    $.ajax({
+        type: 'POST',
+        url: '/survey/sync/' + app.survey.response_id + '/',
+        headers: { 'X-CSRFToken': csrftoken },
+        contentType: 'application/json',
+        data: JSON.stringify({operations: batch}),
+        success: function(data) {
+            app.survey.pendingOperations = app.survey.pendingOperations.slice(batch.length);
+            if (successCallback) {
+                successCallback(data);
+            }
+        },
+        error: function(xhr) {
+            // Network errors and 5xx leave the batch queued for the next flush
+            if (xhr.status < 400 || xhr.status >= 500) {
+                return;
+            }
+            // The server rolls back the whole batch; set aside the operation it rejected, or the
+            // whole batch when the error is not tied to one, and send the rest again
+            let data = xhr.responseJSON || {};
+            let rejected = batch;
+            if (data.operation_index !== null && data.operation_index !== undefined) {
+                rejected = [batch[data.operation_index]];
+            }
+            app.survey.rejectedOperations = app.survey.rejectedOperations.concat(rejected);
+            app.survey.pendingOperations = app.survey.pendingOperations.filter(function(operation) {
+                return rejected.indexOf(operation) == -1;
+            });
+            window.alert('Some changes could not be saved and were discarded: ' + (data.message || 'the server rejected them.'));
+            if (rejected.length < batch.length) {
+                app.survey.flushOperations(successCallback);
+            }
+        }
+    });
+}
@@ -0,0 +1,175 @@
+"""
+Vectorised results statistics for weighted scenarios, computed with NumPy
+over the sparse coin matrix (see survey.matrix) instead of per-unit ORM
+aggregations. Respondents are the rows of the matrix; a respondent who did
+not select a unit counts as assigning it 0 coins.
+"""
+from django.db import transaction
+
+from .matrix import build_coin_matrix, np, require_numpy
+from .models import PlanningUnitStatistic, ScenarioStatistic
+
+DEFAULT_PERCENTILE = 90
+DEFAULT_BOOTSTRAP_SAMPLES = 200
+DEFAULT_CONFIDENCE = 0.95
+BOOTSTRAP_BATCH_SIZE = 16
+
+def get_segments(keys, count):
+    """Return the size and start offset of each key's run in sorted keys."""
+    counts = np.bincount(keys, minlength=count)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return counts, starts
+
+def get_column_order(matrix):
+    """
+    Return the matrix entries as (columns, rows, data) sorted by column and,
+    within a column, by coins, i.e. the sorted non-zero part of each column.
+    """
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    order = np.lexsort((matrix.data, matrix.indices))
+    return np.asarray(matrix.indices)[order], rows[order], np.asarray(matrix.data, dtype=np.float64)[order]
+
+def get_column_quantile(sorted_data, starts, counts, n, q):
+    """
+    Quantile q of every column with n values, of which only the sorted
+    explicit entries are stored; the rest are zeros that sort first. Uses
+    NumPy's default linear interpolation.
+    """
+    zeros = n - counts
+    position = q * (n - 1)
+    low = int(np.floor(position))
+    fraction = position - low
+
+    def value_at(rank):
+        explicit = rank - zeros
+        if not len(sorted_data):
+            return np.zeros(len(counts))
+        index = np.clip(starts + explicit, 0, len(sorted_data) - 1)
+        return np.where(explicit >= 0, sorted_data[index], 0.0)
+
+    return value_at(low) * (1 - fraction) + value_at(min(low + 1, n - 1)) * fraction
+
+def get_column_gini(columns, sorted_data, starts, counts, n):
+    """Gini coefficient of every column over all n respondents."""
+    totals = np.bincount(columns, weights=sorted_data, minlength=len(counts))
+    # 1-based rank of each entry in its full column, after the zeros
+    ranks = (n - counts)[columns] + (np.arange(len(columns)) - starts[columns]) + 1
+    weighted = np.bincount(columns, weights=ranks * sorted_data, minlength=len(counts))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gini = 2 * weighted / (n * totals) - (n + 1) / n
+    return np.where(totals > 0, gini, 0.0)
+
+def get_gini(values):
+    values = np.sort(np.asarray(values, dtype=np.float64))
+    n = len(values)
+    if n == 0 or values.sum() <= 0:
+        return None
+    return float(2 * np.sum(np.arange(1, n + 1) * values) / (n * values.sum()) - (n + 1) / n)
+
+def get_mean_respondent_gini(matrix):
+    """Mean Gini coefficient of each respondent's coins across the units they selected."""
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    order = np.lexsort((matrix.data, rows))
+    rows = rows[order]
+    data = np.asarray(matrix.data, dtype=np.float64)[order]
+    counts, starts = get_segments(rows, matrix.shape[0])
+    totals = np.bincount(rows, weights=data, minlength=matrix.shape[0])
+    ranks = np.arange(len(rows)) - starts[rows] + 1
+    weighted = np.bincount(rows, weights=ranks * data, minlength=matrix.shape[0])
+    valid = totals > 0
+    if not valid.any():
+        return None
+    gini = 2 * weighted[valid] / (counts[valid] * totals[valid]) - (counts[valid] + 1) / counts[valid]
+    return float(gini.mean())
+
+def get_bootstrap_mean_ci(rows, sorted_data, starts, counts, n, samples, confidence, rng):
+    """
+    Percentile bootstrap interval of every column's mean, resampling
+    respondents with replacement. Resamples are drawn in batches so memory
+    stays at (entries x batch) rather than (entries x samples).
+    """
+    means = np.zeros((len(counts), samples), dtype=np.float32)
+    non_empty = counts > 0
+    for batch_start in range(0, samples, BOOTSTRAP_BATCH_SIZE):
+        size = min(BOOTSTRAP_BATCH_SIZE, samples - batch_start)
+        # How often each respondent is drawn in each resample
+        weights = rng.multinomial(n, np.full(n, 1.0 / n), size=size).T
+        if non_empty.any():
+            sums = np.add.reduceat(sorted_data[:, None] * weights[rows], starts[non_empty], axis=0)
+            means[non_empty, batch_start:batch_start + size] = sums / n
+    alpha = (1 - confidence) / 2
+    return np.quantile(means, alpha, axis=1), np.quantile(means, 1 - alpha, axis=1)
+
+def compute_coin_statistics(matrix, percentile=DEFAULT_PERCENTILE, bootstrap_samples=DEFAULT_BOOTSTRAP_SAMPLES,
+                            confidence=DEFAULT_CONFIDENCE, seed=0):
+    """
+    Compute per-unit and scenario-wide statistics of a CoinMatrix. Returns a
+    dict of scenario values plus 'units', a dict of arrays aligned with
+    matrix.planning_unit_ids. The bootstrap is seeded, so results repeat.
+    """
+    require_numpy()
+    n, unit_count = matrix.shape
+    statistics = {
+        'respondent_count': n,
+        'planning_unit_count': unit_count,
+        'unit_gini': None,
+        'mean_respondent_gini': None,
+        'units': None,
+    }
+    if n == 0 or unit_count == 0:
+        return statistics
+
+    columns, rows, sorted_data = get_column_order(matrix)
+    counts, starts = get_segments(columns, unit_count)
+    totals = np.bincount(columns, weights=sorted_data, minlength=unit_count)
+    ci_low, ci_high = get_bootstrap_mean_ci(
+        rows, sorted_data, starts, counts, n, bootstrap_samples, confidence, np.random.default_rng(seed)
+    )
+    statistics.update({
+        'unit_gini': get_gini(totals),
+        'mean_respondent_gini': get_mean_respondent_gini(matrix),
+        'units': {
+            'planning_unit_id': matrix.planning_unit_ids,
+            'selection_share': counts / n,
+            'mean_coins': totals / n,
+            'median_coins': get_column_quantile(sorted_data, starts, counts, n, 0.5),
+            'percentile_coins': get_column_quantile(sorted_data, starts, counts, n, percentile / 100),
+            'gini': get_column_gini(columns, sorted_data, starts, counts, n),
+            'mean_coins_ci_low': ci_low,
+            'mean_coins_ci_high': ci_high,
+        },
+    })
+    return statistics
+
+def refresh_scenario_statistics(scenario, percentile=DEFAULT_PERCENTILE, bootstrap_samples=DEFAULT_BOOTSTRAP_SAMPLES,
+                                confidence=DEFAULT_CONFIDENCE, seed=0):
+    """
+    Compute a scenario's statistics from its coin matrix and replace its rows
+    in the ScenarioStatistic and PlanningUnitStatistic cache tables.
+    """
+    statistics = compute_coin_statistics(
+        build_coin_matrix(scenario), percentile, bootstrap_samples, confidence, seed
+    )
+    units = statistics.pop('units')
+    with transaction.atomic():
+        ScenarioStatistic.objects.update_or_create(
+            scenario=scenario,
+            defaults=dict(
+                statistics,
+                percentile=percentile,
+                bootstrap_samples=bootstrap_samples,
+                confidence=confidence
+            )
+        )
+        PlanningUnitStatistic.objects.filter(scenario=scenario).delete()
+        if units is not None:
+            fields = [name for name in units if name != 'planning_unit_id']
+            PlanningUnitStatistic.objects.bulk_create([
+                PlanningUnitStatistic(
+                    scenario=scenario,
+                    planning_unit_id=int(planning_unit_id),
+                    **{name: float(value) for name, value in zip(fields, values)}
+                )
+                for planning_unit_id, *values in zip(units['planning_unit_id'], *(units[name] for name in fields))
+            ], batch_size=2000)
+    return statistics
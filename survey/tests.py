@@ -1,21 +1,47 @@
+from asgiref.sync import async_to_sync
 from datetime import timedelta
-from django.contrib.auth.models import User, Group
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser, User, Group
+from django.contrib.messages.storage.cookie import CookieStorage
 from django.contrib.gis.geos import MultiPolygon, Polygon
 from django.core.management import call_command
 from django.core.management.base import CommandError
-from django.test import TestCase, Client
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, IntegrityError, transaction
+from django.test import TestCase, TransactionTestCase, Client, RequestFactory
 from django.urls import reverse
 from django.utils import timezone
+import csv
+import gzip
+import importlib.util
+import io
 import json
 import os
+import tempfile
+import unittest
+from unittest import mock
 
 from mapgroups.models import MapGroup
+from survey.admin import SurveyAdmin, SurveyResponseAdmin, clone_surveys
+from survey.bundles import BundleError, export_survey_bundle, import_survey_bundle
+from survey.cache import get_survey_schema
+from survey.exports import export_survey_responses
+from survey.forms import PlanningUnitForm, SurveyLayerOrderForm
+from survey.matrix import build_coin_matrix, load_coin_matrix, save_coin_matrix
+from survey.views import (
+    get_myplanner_surveys, get_response_access, get_survey_layer_groups,
+    get_scenario_pu_by_coordinates_async,
+)
 from survey.models import (
     Survey, Scenario, SurveyResponse, SurveyQuestion, ScenarioQuestion,
     PlanningUnitQuestion, SurveyQuestionOption, ScenarioQuestionOption,
     PlanningUnitQuestionOption, SurveyAnswer, ScenarioAnswer,
     PlanningUnitAnswer, PlanningUnitFamily, PlanningUnit, CoinAssignment,
-    SurveyLayerGroup, SurveyLayerOrder
+    SurveyLayerGroup, SurveyLayerOrder, CoinDensity, PlanningUnitStatistic,
+    ScenarioStatistic, PlanningUnitHotspot, PlanningUnitNeighbourGraph, QuestionSummary,
+    upsert_coin_assignments, upsert_planning_unit_answers, delete_selected_planning_units,
+    get_survey_option_counts, get_survey_question_summaries, annotate_response_progress,
+    clone_rows, clone_survey
 )
 
 class ImportPlanningUnitsTest(TestCase):
@@ -58,6 +84,19 @@ class ImportPlanningUnitsTest(TestCase):
         family = PlanningUnitFamily.objects.first()
         self.assertEqual(family.name, 'test_family')
 
+    def test_import_refreshes_family_stats(self):
+        """Test the import stores the family's unit count, extent and vertices."""
+        call_command('import_planning_units', self.test_file_path, '--family-name=test_family')
+        call_command('import_planning_units', self.test_file_path, '--family-name=test_family')
+
+        family = PlanningUnitFamily.objects.get(name='test_family')
+        self.assertEqual(family.planning_unit_count, 10)
+        self.assertEqual(family.import_version, 2)
+        self.assertIsNotNone(family.last_import_duration)
+        self.assertGreaterEqual(family.vertex_count, 10 * 4)
+        for unit in PlanningUnit.objects.all():
+            self.assertTrue(family.extent.covers(unit.geometry))
+
     def test_geometry_conversion_polygon_to_multipolygon(self):
         """Test that Polygon geometries are converted to MultiPolygon."""
         # Run the import command
@@ -274,6 +313,112 @@ class SurveyModelTests(TestCase):
         last_scenario = survey.get_next_scenario(scenario2.id)
         self.assertIsNone(last_scenario)
 
+    def test_clone_survey(self):
+        """Test cloning copies the survey's configuration but not its responses"""
+        survey = Survey.objects.create(title='Template Survey')
+        survey.groups.add(self.map_group)
+        question = SurveyQuestion.objects.create(
+            text='Which gear do you use?', survey=survey, order=1, question_type='single_choice'
+        )
+        SurveyQuestionOption.objects.create(question=question, text='Nets', order=1)
+        scenario = Scenario.objects.create(name='Scenario 1', survey=survey, order=1)
+        pu_question = PlanningUnitQuestion.objects.create(
+            text='Why is this area important?', scenario=scenario, order=1, question_type='multiple_choice'
+        )
+        PlanningUnitQuestionOption.objects.create(question=pu_question, text='Spawning', order=1)
+        ScenarioQuestion.objects.create(text='Any comments?', scenario=scenario, order=1, question_type='text')
+        SurveyLayerGroup.objects.create(name='Reference Layers', order=1, survey=survey)
+        SurveyResponse.objects.create(survey=survey, user=self.user)
+
+        clone = clone_survey(survey)
+        self.assertEqual(clone.title, 'Template Survey (copy)')
+        self.assertEqual(list(clone.groups.all()), [self.map_group])
+        self.assertEqual(clone.survey_responses_survey.count(), 0)
+        schema = clone.get_schema()
+        original_schema = survey.get_schema()
+        self.assertEqual(schema['questions'][0]['text'], 'Which gear do you use?')
+        self.assertEqual([text for option_id, text in schema['questions'][0]['choices']], ['Nets'])
+        self.assertNotEqual(schema['questions'][0]['id'], original_schema['questions'][0]['id'])
+        cloned_scenario = schema['scenarios'][0]
+        self.assertNotEqual(cloned_scenario['id'], scenario.id)
+        self.assertEqual(
+            [text for option_id, text in cloned_scenario['planning_unit_questions'][0]['choices']], ['Spawning']
+        )
+        self.assertEqual(len(cloned_scenario['questions']), 1)
+        self.assertEqual(clone.survey_layer_groups_survey.get().name, 'Reference Layers')
+
+    def test_clone_surveys_action(self):
+        """Test the admin action clones each survey in its own transaction"""
+        first = Survey.objects.create(title='First Survey')
+        second = Survey.objects.create(title='Second Survey')
+        for survey in (first, second):
+            SurveyQuestion.objects.create(text='Any comments?', survey=survey, order=1, question_type='text')
+            Scenario.objects.create(name='Scenario 1', survey=survey, order=1)
+        model_admin = SurveyAdmin(Survey, admin.site)
+        surveys = Survey.objects.filter(pk__in=[first.pk, second.pk]).order_by('pk')
+
+        request = RequestFactory().post('/')
+        request._messages = CookieStorage(request)
+        clone_surveys(model_admin, request, surveys)
+        self.assertEqual([str(message) for message in request._messages], ['Cloned 2 survey(s).'])
+        self.assertEqual(Survey.objects.filter(title__endswith='(copy)').count(), 2)
+
+        # Fail on the last table of the second survey: its earlier inserts must roll back with it
+        layer_order_calls = []
+        def failing_clone_rows(model, *args, **kwargs):
+            if model is SurveyLayerOrder:
+                layer_order_calls.append(model)
+                if len(layer_order_calls) == 2:
+                    raise DatabaseError('Connection lost')
+            return clone_rows(model, *args, **kwargs)
+
+        request = RequestFactory().post('/')
+        request._messages = CookieStorage(request)
+        with mock.patch('survey.models.clone_rows', side_effect=failing_clone_rows):
+            with self.assertRaises(DatabaseError):
+                clone_surveys(model_admin, request, surveys)
+        self.assertEqual(Survey.objects.filter(title='First Survey (copy)').count(), 2)
+        self.assertEqual(Survey.objects.filter(title='Second Survey (copy)').count(), 1)
+        self.assertEqual(SurveyQuestion.objects.filter(survey__title='Second Survey (copy)').count(), 1)
+        self.assertEqual(Scenario.objects.filter(survey__title='Second Survey (copy)').count(), 1)
+
+    def test_survey_bundle_round_trip(self):
+        """Test a survey bundle recreates the survey and, with geometries, its planning units"""
+        family = PlanningUnitFamily.objects.create(name='Staging Family')
+        unit = PlanningUnit.objects.create(
+            geometry=MultiPolygon(Polygon(((0, 0), (0, 1), (1, 1), (1, 0), (0, 0))))
+        )
+        unit.family.add(family)
+        survey = Survey.objects.create(title='Staging Survey', start_date=timezone.now().replace(microsecond=0))
+        question = SurveyQuestion.objects.create(
+            text='Which gear do you use?', survey=survey, order=1, question_type='single_choice'
+        )
+        SurveyQuestionOption.objects.create(question=question, text='Nets', order=1)
+        Scenario.objects.create(name='Scenario 1', survey=survey, order=1, pu_family=family)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            path = os.path.join(output_dir, 'survey.json.gz')
+            call_command('export_survey_bundle', str(survey.id), path)
+            call_command('import_survey_bundle', path, '--title', 'Production Survey')
+        imported = Survey.objects.get(title='Production Survey')
+        self.assertEqual(imported.start_date, survey.start_date)
+        schema = imported.get_schema()
+        self.assertEqual([text for option_id, text in schema['questions'][0]['choices']], ['Nets'])
+        # Families are matched by name
+        self.assertEqual(imported.scenarios_survey.get().pu_family, family)
+
+        bundle = json.loads(json.dumps(export_survey_bundle(survey, include_geometries=True), cls=DjangoJSONEncoder))
+        bundle['planning_unit_families'][0]['name'] = 'Production Family'
+        new_family = import_survey_bundle(bundle).scenarios_survey.get().pu_family
+        self.assertEqual(new_family.name, 'Production Family')
+        self.assertEqual(new_family.planning_unit_count, 1)
+        self.assertTrue(new_family.planning_units_family.get().geometry.equals(unit.geometry))
+
+        bundle['planning_unit_families'][0]['name'] = 'Missing Family'
+        del bundle['planning_unit_families'][0]['planning_units']
+        with self.assertRaises(BundleError):
+            import_survey_bundle(bundle)
+
 class ScenarioModelTests(TestCase):
     """Test cases for Scenario model"""
     
@@ -590,6 +735,25 @@ class SurveyViewTests(TestCase):
         data = json.loads(response.content)
         self.assertIn('html', data)
         
+    def test_get_myplanner_survey_content_cache_refresh(self):
+        """Test the cached survey list is refreshed when a response is created"""
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('survey:get_myplanner_survey_content')
+        data = json.loads(self.client.get(url).content)
+        self.assertIn('Take', data['html'])
+
+        survey_response = SurveyResponse.objects.create(survey=self.survey, user=self.user)
+        data = json.loads(self.client.get(url).content)
+        self.assertIn(f'takeSurvey({self.survey.id}, {survey_response.id})', data['html'])
+
+    def test_get_myplanner_survey_content_reads_surveys_once(self):
+        """Test the ETag and the page share one read of the survey list"""
+        self.client.login(username='testuser', password='testpass123')
+        with mock.patch('survey.views.get_myplanner_surveys', wraps=get_myplanner_surveys) as read_surveys:
+            response = self.client.get(reverse('survey:get_myplanner_survey_content'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(read_surveys.call_count, 1)
+
     def test_survey_start_unauthenticated(self):
         """Test starting survey when not authenticated"""
         response = self.client.get(
@@ -608,6 +772,38 @@ class SurveyViewTests(TestCase):
         self.assertEqual(data['status'], 'success')
         self.assertIn('response_id', data)
         
+    def test_survey_start_conditional_get(self):
+        """Test survey_start answers 304 until the response changes"""
+        question = SurveyQuestion.objects.create(
+            text='Test question',
+            survey=self.survey,
+            order=1,
+            question_type='text'
+        )
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('survey:survey_start', kwargs={'surveypk': self.survey.pk})
+        # The first request creates the response, the second one is versioned
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.post(url, data={f'question_{question.id}': 'Test answer'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # The page embeds the layer picker, so editing it moves the ETag too
+        etag = response['ETag']
+        SurveyLayerGroup.objects.create(name='Reference Layers', order=1, survey=self.survey)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)['layer_groups']), 1)
+
     def test_survey_start_nonexistent_survey(self):
         """Test starting non-existent survey"""
         self.client.login(username='testuser', password='testpass123')
@@ -722,10 +918,73 @@ class SurveyViewTests(TestCase):
             })
         )
         self.assertEqual(response.status_code, 200)
-        data = json.loads(response.content)
+        data = json.loads(b''.join(response.streaming_content))
         self.assertEqual(data['status'], 'success')
         self.assertIn('html', data)
-        
+
+    def test_survey_scenario_planning_units_geojson(self):
+        """Test scenario reloads only include units selected in that scenario"""
+        pu_family = PlanningUnitFamily.objects.create(name='Test Family')
+        scenario = Scenario.objects.create(
+            name='Test Scenario', survey=self.survey, order=1, pu_family=pu_family
+        )
+        other_scenario = Scenario.objects.create(
+            name='Other Scenario', survey=self.survey, order=2, pu_family=pu_family
+        )
+        other_question = PlanningUnitQuestion.objects.create(
+            text='Why?', scenario=other_scenario, order=1, question_type='text'
+        )
+        selected_unit = PlanningUnit.objects.create(
+            geometry=MultiPolygon(Polygon(((0, 0), (0, 1), (1, 1), (1, 0), (0, 0))))
+        )
+        other_unit = PlanningUnit.objects.create(
+            geometry=MultiPolygon(Polygon(((1, 0), (1, 1), (2, 1), (2, 0), (1, 0))))
+        )
+        survey_response = SurveyResponse.objects.create(survey=self.survey, user=self.user)
+        CoinAssignment.objects.create(
+            response=survey_response, scenario=scenario, planning_unit=selected_unit, coins_assigned=40
+        )
+        PlanningUnitAnswer.objects.create(
+            response=survey_response, question=other_question, planning_unit=other_unit, text_answer='Elsewhere'
+        )
+
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(
+            reverse('survey:survey_scenario', kwargs={
+                'response_id': survey_response.id,
+                'scenario_id': scenario.id
+            })
+        )
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(b''.join(response.streaming_content))
+        features = data['planning_units_geojson']['features']
+        self.assertEqual(len(features), 1)
+        self.assertEqual(features[0]['properties']['id'], selected_unit.id)
+        self.assertEqual(features[0]['properties']['coins'], 40)
+        self.assertEqual(features[0]['geometry']['type'], 'MultiPolygon')
+        
+    def test_survey_scenario_gzip(self):
+        """Test scenario payloads are compressed when the client accepts gzip"""
+        scenario = Scenario.objects.create(
+            name='Test Scenario',
+            survey=self.survey,
+            order=1
+        )
+        survey_response = SurveyResponse.objects.create(survey=self.survey, user=self.user)
+
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(
+            reverse('survey:survey_scenario', kwargs={
+                'response_id': survey_response.id,
+                'scenario_id': scenario.id
+            }),
+            HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(b''.join(response.streaming_content)))
+        self.assertEqual(data['planning_units_geojson']['type'], 'FeatureCollection')
+
     def test_survey_scenario_nonexistent_response(self):
         """Test getting scenario form with non-existent response"""
         scenario = Scenario.objects.create(
@@ -914,6 +1173,77 @@ class CoinAssignmentTests(TestCase):
         self.assertEqual(current_scenario_status['coins_available'], 0)
         self.assertEqual(current_scenario_status['areas_selected'], 2)
 
+    def test_response_progress_annotations(self):
+        """Test the annotated completion matches SurveyResponse.completed"""
+        CoinAssignment.objects.create(
+            response=self.response, scenario=self.scenario, planning_unit=self.planning_unit, coins_assigned=25
+        )
+        response = annotate_response_progress(SurveyResponse.objects.filter(pk=self.response.pk)).get()
+        self.assertEqual((response.coins_used, response.areas_selected, response.is_complete), (25, 1, False))
+
+        CoinAssignment.objects.create(
+            response=self.response, scenario=self.scenario, planning_unit=self.planning_unit2, coins_assigned=75
+        )
+        response = annotate_response_progress(SurveyResponse.objects.filter(pk=self.response.pk)).get()
+        self.assertEqual((response.coins_used, response.areas_selected, response.is_complete), (100, 2, True))
+        self.assertTrue(self.response.completed)
+
+        PlanningUnitQuestion.objects.create(
+            text='Why is this area important?',
+            scenario=self.scenario,
+            order=1,
+            question_type='text',
+            is_required=True
+        )
+        response = annotate_response_progress(SurveyResponse.objects.filter(pk=self.response.pk)).get()
+        self.assertFalse(response.is_complete)
+        self.assertFalse(self.response.completed)
+
+    def test_response_progress_per_scenario(self):
+        """Test the progress annotations can be narrowed to one scenario"""
+        other_scenario = Scenario.objects.create(
+            name='Other Scenario',
+            survey=self.survey,
+            order=2,
+            pu_family=self.pu_family,
+            is_weighted=True,
+            total_coins=100
+        )
+        CoinAssignment.objects.create(
+            response=self.response, scenario=self.scenario, planning_unit=self.planning_unit, coins_assigned=100
+        )
+        CoinAssignment.objects.create(
+            response=self.response, scenario=other_scenario, planning_unit=self.planning_unit, coins_assigned=40
+        )
+        responses = SurveyResponse.objects.filter(pk=self.response.pk)
+        response = annotate_response_progress(responses).get()
+        self.assertEqual((response.coins_used, response.areas_selected, response.is_complete), (140, 2, False))
+        response = annotate_response_progress(responses, self.scenario.pk).get()
+        self.assertEqual((response.coins_used, response.areas_selected, response.is_complete), (100, 1, True))
+        response = annotate_response_progress(responses, other_scenario.pk).get()
+        self.assertEqual((response.coins_used, response.areas_selected, response.is_complete), (40, 1, False))
+
+    def test_response_admin_changelist(self):
+        """Test the response changelist filters and sorts on the annotations"""
+        admin_user = User.objects.create_superuser(
+            username='admin',
+            password='testpass123'
+        )
+        model_admin = SurveyResponseAdmin(SurveyResponse, admin.site)
+        for params, expected in [({'completed': 'no', 'o': '-8'}, [self.response]), ({'completed': 'yes'}, [])]:
+            request = RequestFactory().get('/', params)
+            request.user = admin_user
+            changelist = model_admin.get_changelist_instance(request)
+            self.assertEqual(list(changelist.get_queryset(request)), expected)
+
+        CoinAssignment.objects.create(
+            response=self.response, scenario=self.scenario, planning_unit=self.planning_unit, coins_assigned=100
+        )
+        request = RequestFactory().get('/', {'scenario': str(self.scenario.pk), 'completed': 'yes'})
+        request.user = admin_user
+        changelist = model_admin.get_changelist_instance(request)
+        self.assertEqual([response.coins_used for response in changelist.get_queryset(request)], [100])
+
     def test_coin_assignment_unique_constraint(self):
         """Test unique constraint on coin assignments"""
         CoinAssignment.objects.create(
@@ -932,3 +1262,997 @@ class CoinAssignmentTests(TestCase):
                 coins_assigned=50
             )
 
+
+class PlanningUnitFormTests(TestCase):
+    """Test cases for saving planning unit answers and coins in bulk"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.survey = Survey.objects.create(title='Test Survey')
+        self.pu_family = PlanningUnitFamily.objects.create(
+            name='Test Family'
+        )
+        self.other_family = PlanningUnitFamily.objects.create(
+            name='Other Family'
+        )
+        self.scenario = Scenario.objects.create(
+            name='Test Scenario',
+            survey=self.survey,
+            order=1,
+            pu_family=self.pu_family,
+            is_weighted=True,
+            total_coins=100
+        )
+        self.response = SurveyResponse.objects.create(
+            survey=self.survey,
+            user=self.user
+        )
+        self.question = PlanningUnitQuestion.objects.create(
+            text='Why is this area important?',
+            scenario=self.scenario,
+            order=1,
+            question_type='text'
+        )
+        self.planning_units = []
+        for x in range(3):
+            pu = PlanningUnit.objects.create(
+                geometry=MultiPolygon(Polygon(((x, 0), (x, 1), (x+1, 1), (x+1, 0), (x, 0))))
+            )
+            pu.family.add(self.pu_family)
+            self.planning_units.append(pu)
+        self.outside_unit = PlanningUnit.objects.create(
+            geometry=MultiPolygon(Polygon(((5, 0), (5, 1), (6, 1), (6, 0), (5, 0))))
+        )
+        self.outside_unit.family.add(self.other_family)
+
+    def get_form(self, unit_ids, coins=10, text='Fishing'):
+        return PlanningUnitForm({
+            f'scenario_{self.scenario.id}_planning_unit_ids': ','.join(str(x) for x in unit_ids),
+            f'scenario_{self.scenario.id}_coin_assignment': coins,
+            f'scenario_{self.scenario.id}_pu_question_{self.question.id}': text,
+        }, response=self.response, scenario=self.scenario)
+
+    def test_save_answers_for_multiple_units(self):
+        """Test answers and coins are written for every selected unit"""
+        unit_ids = [pu.id for pu in self.planning_units]
+        form = self.get_form(unit_ids)
+        self.assertTrue(form.is_valid())
+        form.save_answers(self.response, self.scenario)
+
+        self.assertEqual(PlanningUnitAnswer.objects.filter(response=self.response).count(), 3)
+        self.assertEqual(CoinAssignment.objects.filter(response=self.response, coins_assigned=10).count(), 3)
+
+        # Saving again updates the existing rows instead of adding new ones
+        form = self.get_form(unit_ids[:2], coins=20, text='Diving')
+        self.assertTrue(form.is_valid())
+        form.save_answers(self.response, self.scenario)
+
+        self.assertEqual(PlanningUnitAnswer.objects.filter(response=self.response).count(), 3)
+        self.assertEqual(PlanningUnitAnswer.objects.filter(response=self.response, text_answer='Diving').count(), 2)
+        self.assertEqual(self.response.scenario_status(self.scenario.pk)['coins_assigned'], 50)
+
+    def test_selected_planning_units(self):
+        """Test units selected by coins or by answers are listed once, with their coins"""
+        first, second = self.planning_units[:2]
+        CoinAssignment.objects.create(response=self.response, scenario=self.scenario, planning_unit=first, coins_assigned=30)
+        upsert_planning_unit_answers(self.response, self.question, [first.id, second.id], {'text_answer': 'Fishing'})
+        rows = list(self.response.get_selected_planning_units(self.scenario))
+        self.assertEqual([(unit_id, coins) for unit_id, geojson, coins in rows], [(first.id, 30), (second.id, 0)])
+        self.assertEqual(json.loads(rows[0][1])['type'], 'MultiPolygon')
+
+    def test_coins_limited_across_selected_units(self):
+        """Test the coin value times the number of selected units cannot exceed the coins available"""
+        unit_ids = [pu.id for pu in self.planning_units]
+        form = self.get_form(unit_ids, coins=40)
+        self.assertFalse(form.is_valid())
+        self.assertIn(f'scenario_{self.scenario.id}_coin_assignment', form.errors)
+        self.assertEqual(CoinAssignment.objects.filter(response=self.response).count(), 0)
+
+        form = self.get_form(unit_ids[:2], coins=50)
+        self.assertTrue(form.is_valid())
+        form.save_answers(self.response, self.scenario)
+
+        # Coins already held by the reselected units can be handed out again
+        form = self.get_form(unit_ids[:2], coins=40)
+        self.assertTrue(form.is_valid())
+        form = self.get_form(unit_ids, coins=34)
+        self.assertFalse(form.is_valid())
+
+    def test_planning_unit_answer_unique_constraint(self):
+        """Test a unit can only be answered once per question and response"""
+        PlanningUnitAnswer.objects.create(
+            response=self.response,
+            question=self.question,
+            planning_unit=self.planning_units[0],
+            text_answer='Fishing'
+        )
+
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                PlanningUnitAnswer.objects.create(
+                    response=self.response,
+                    question=self.question,
+                    planning_unit=self.planning_units[0],
+                    text_answer='Diving'
+                )
+
+    def test_save_answers_rejects_units_outside_family(self):
+        """Test units outside of the scenario's family are rejected"""
+        form = self.get_form([self.planning_units[0].id, self.outside_unit.id])
+        self.assertFalse(form.is_valid())
+        self.assertIn(f'scenario_{self.scenario.id}_planning_unit_ids', form.errors)
+
+        form = self.get_form(['abc'])
+        self.assertFalse(form.is_valid())
+
+class SurveySchemaAPITests(TestCase):
+    """Test cases for the JSON schema and answers API"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.map_group = MapGroup.objects.create(
+            name='Test Map Group',
+            owner=self.user
+        )[0]
+        self.survey = Survey.objects.create(
+            title='Test Survey',
+            start_date=timezone.now() - timedelta(days=1),
+            end_date=timezone.now() + timedelta(days=30)
+        )
+        self.survey.groups.add(self.map_group)
+        self.question = SurveyQuestion.objects.create(
+            text='Choose one',
+            survey=self.survey,
+            order=1,
+            question_type='single_choice'
+        )
+        self.option = SurveyQuestionOption.objects.create(
+            text='Option 1', question=self.question, order=1
+        )
+        self.scenario = Scenario.objects.create(
+            name='Test Scenario',
+            survey=self.survey,
+            order=1
+        )
+        self.scenario_question = ScenarioQuestion.objects.create(
+            text='Why?',
+            scenario=self.scenario,
+            order=1,
+            question_type='text'
+        )
+        self.client.login(username='testuser', password='testpass123')
+
+    def test_survey_schema(self):
+        """Test the compiled schema and its cache headers"""
+        url = reverse('survey:survey_schema', kwargs={'surveypk': self.survey.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        schema = json.loads(response.content)['schema']
+        self.assertEqual(schema['questions'][0]['field_name'], f'question_{self.question.id}')
+        self.assertEqual(schema['questions'][0]['choices'], [[self.option.id, 'Option 1']])
+        self.assertEqual(
+            schema['scenarios'][0]['questions'][0]['field_name'],
+            f'scenario_{self.scenario.id}_question_{self.scenario_question.id}'
+        )
+
+        # An option edited in the admin must reach clients that cached the old schema
+        self.option.text = 'Option A'
+        self.option.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['schema']['questions'][0]['choices'], [[self.option.id, 'Option A']])
+
+    def test_schema_version_follows_question_edits(self):
+        """Test editing a question or option outside the survey admin moves the schema version"""
+        schema = get_survey_schema(Survey.objects.get(pk=self.survey.pk))
+
+        self.scenario_question.text = 'Why not?'
+        self.scenario_question.save()
+        survey = Survey.objects.get(pk=self.survey.pk)
+        self.assertNotEqual(survey.get_schema_version(), schema['schema_version'])
+        self.assertEqual(get_survey_schema(survey)['scenarios'][0]['questions'][0]['text'], 'Why not?')
+
+        version = survey.get_schema_version()
+        self.option.delete()
+        survey = Survey.objects.get(pk=self.survey.pk)
+        self.assertNotEqual(survey.get_schema_version(), version)
+        self.assertEqual(get_survey_schema(survey)['questions'][0]['choices'], [])
+
+    def test_survey_response_bundle(self):
+        """Test the one-shot resume bundle"""
+        pu_family = PlanningUnitFamily.objects.create(name='Test Family')
+        self.scenario.pu_family = pu_family
+        self.scenario.save()
+        pu = PlanningUnit.objects.create(
+            geometry=MultiPolygon(Polygon(((0, 0), (0, 1), (1, 1), (1, 0), (0, 0))))
+        )
+        pu.family.add(pu_family)
+        survey_response = SurveyResponse.objects.create(survey=self.survey, user=self.user)
+        CoinAssignment.objects.create(
+            response=survey_response, scenario=self.scenario, planning_unit=pu, coins_assigned=100
+        )
+        response = self.client.get(
+            reverse('survey:survey_response_bundle', kwargs={
+                'surveypk': self.survey.pk,
+                'responsepk': survey_response.pk
+            })
+        )
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['response_id'], survey_response.pk)
+        self.assertEqual(data['schema']['scenarios'][0]['id'], self.scenario.id)
+        self.assertEqual(data['selected_unit_ids'][str(self.scenario.id)], [pu.id])
+        self.assertEqual(data['answers']['coins'][str(self.scenario.id)][str(pu.id)], 100)
+        self.assertTrue(data['scenarios_status'][str(self.scenario.id)]['coins_completed'])
+        self.assertEqual(data['layer_groups'], {})
+
+        # Layer picker edits show up even though the response is unchanged
+        layer_group = SurveyLayerGroup.objects.create(name='Reference Layers', order=1, survey=self.survey)
+        response = self.client.get(
+            reverse('survey:survey_response_bundle', kwargs={
+                'surveypk': self.survey.pk,
+                'responsepk': survey_response.pk
+            })
+        )
+        data = json.loads(response.content)
+        self.assertEqual(data['layer_groups'][str(layer_group.id)]['name'], 'Reference Layers')
+
+    def test_survey_response_answers(self):
+        """Test the compact answers payload"""
+        survey_response = SurveyResponse.objects.create(survey=self.survey, user=self.user)
+        SurveyAnswer.objects.create(
+            response=survey_response,
+            question=self.question,
+            selected_options=[{"option_id": self.option.id, "text": self.option.text}]
+        )
+        ScenarioAnswer.objects.create(
+            response=survey_response,
+            question=self.scenario_question,
+            text_answer='Because'
+        )
+        response = self.client.get(
+            reverse('survey:survey_response_answers', kwargs={'response_id': survey_response.pk})
+        )
+        self.assertEqual(response.status_code, 200)
+        answers = json.loads(response.content)['answers']
+        self.assertEqual(answers['survey'][str(self.question.id)], [self.option.id])
+        self.assertEqual(answers['scenarios'][str(self.scenario.id)][str(self.scenario_question.id)], 'Because')
+
+class SurveyLayerGroupCacheTests(TestCase):
+    """Test cases for the cached survey layer picker"""
+
+    def setUp(self):
+        self.survey = Survey.objects.create(title='Test Survey')
+        self.layer_group = SurveyLayerGroup.objects.create(
+            name='Reference Layers',
+            order=1,
+            survey=self.survey
+        )
+
+    def test_layer_groups_cache_invalidated_on_edit(self):
+        """Test editing a layer group refreshes the cached layer picker"""
+        layer_groups = get_survey_layer_groups(self.survey)
+        self.assertEqual(layer_groups['layer_groups'][self.layer_group.id]['name'], 'Reference Layers')
+        self.assertIn('Reference Layers', layer_groups['html'])
+
+        self.layer_group.name = 'Context Layers'
+        self.layer_group.save()
+        layer_groups = get_survey_layer_groups(self.survey)
+        self.assertIn('Context Layers', layer_groups['html'])
+
+        self.layer_group.delete()
+        layer_groups = get_survey_layer_groups(self.survey)
+        self.assertEqual(layer_groups['layer_groups'], {})
+        self.assertFalse(layer_groups['html'])
+
+    def test_layer_order_form_loads_only_selected_layer(self):
+        """Test the layer order form no longer loads every layer"""
+        form = SurveyLayerOrderForm()
+        self.assertTrue(form.fields['layer'].queryset.query.is_empty())
+        self.assertEqual(form.fields['layer'].widget.url, 'survey:layer_autocomplete')
+
+    def test_layer_autocomplete_requires_staff(self):
+        """Test the layer autocomplete only searches layers for staff"""
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        client = Client()
+        client.force_login(user)
+        response = client.get(reverse('survey:layer_autocomplete'), {'q': 'bathymetry'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+        user.is_staff = True
+        user.save()
+        response = client.get(reverse('survey:layer_autocomplete'), {'q': 'bathymetry'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('pagination', response.json())
+
+class SurveyAccessCacheTests(TestCase):
+    """Test cases for the cached per-response access record"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.map_group = MapGroup.objects.create(
+            name='Test Map Group',
+            owner=self.user
+        )[0]
+        self.survey = Survey.objects.create(title='Test Survey')
+        self.survey.groups.add(self.map_group)
+        self.scenario = Scenario.objects.create(
+            name='Test Scenario',
+            survey=self.survey,
+            order=1
+        )
+        self.response = SurveyResponse.objects.create(survey=self.survey, user=self.user)
+
+    def test_access_record(self):
+        """Test the access record is cached and skips the lookups on reuse"""
+        access = get_response_access(self.user, self.response.id)
+        self.assertEqual(access['survey_id'], self.survey.id)
+        self.assertEqual(access['scenario_ids'], [self.scenario.id])
+        self.assertTrue(access['is_member'])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_response_access(self.user, self.response.id), access)
+
+        other_user = User.objects.create_user(username='otheruser', password='testpass123')
+        self.assertIsNone(get_response_access(other_user, self.response.id))
+
+    def test_access_record_invalidated(self):
+        """Test membership and scenario edits refresh the access record"""
+        get_response_access(self.user, self.response.id)
+        new_scenario = Scenario.objects.create(name='New Scenario', survey=self.survey, order=2)
+        self.assertIn(new_scenario.id, get_response_access(self.user, self.response.id)['scenario_ids'])
+
+        self.survey.groups.remove(self.map_group)
+        self.assertFalse(get_response_access(self.user, self.response.id)['is_member'])
+
+        self.response.delete()
+        self.assertIsNone(get_response_access(self.user, self.response.id))
+
+    def test_access_record_kept_on_unrelated_edits(self):
+        """Test edits to other surveys keep the access record and its objects"""
+        get_response_access(self.user, self.response.id)
+        other_survey = Survey.objects.create(title='Other Survey')
+        Scenario.objects.create(name='Other Scenario', survey=other_survey, order=1)
+        with self.assertNumQueries(0):
+            access = get_response_access(self.user, self.response.id)
+        self.assertEqual(access['response'], self.response)
+        self.assertEqual(access['scenarios'][self.scenario.id].name, 'Test Scenario')
+
+class SurveySyncAPITests(TestCase):
+    """Test cases for the batched sync endpoint"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.map_group = MapGroup.objects.create(
+            name='Test Map Group',
+            owner=self.user
+        )[0]
+        self.survey = Survey.objects.create(title='Test Survey')
+        self.survey.groups.add(self.map_group)
+        self.pu_family = PlanningUnitFamily.objects.create(name='Test Family')
+        self.scenario = Scenario.objects.create(
+            name='Test Scenario',
+            survey=self.survey,
+            order=1,
+            pu_family=self.pu_family,
+            total_coins=100,
+            max_coins_per_pu=60
+        )
+        self.question = PlanningUnitQuestion.objects.create(
+            text='Why is this area important?',
+            scenario=self.scenario,
+            order=1,
+            question_type='text'
+        )
+        self.planning_units = []
+        for x in range(2):
+            pu = PlanningUnit.objects.create(
+                geometry=MultiPolygon(Polygon(((x, 0), (x, 1), (x+1, 1), (x+1, 0), (x, 0))))
+            )
+            pu.family.add(self.pu_family)
+            self.planning_units.append(pu)
+        self.response = SurveyResponse.objects.create(survey=self.survey, user=self.user)
+        self.url = reverse('survey:survey_response_sync', kwargs={'response_id': self.response.id})
+        self.client.login(username='testuser', password='testpass123')
+
+    def sync(self, operations):
+        return self.client.post(
+            self.url,
+            data=json.dumps({'operations': operations}),
+            content_type='application/json'
+        )
+
+    def test_sync_operations(self):
+        """Test a batch is applied in order and replays are skipped"""
+        unit_ids = [pu.id for pu in self.planning_units]
+        operations = [
+            {'key': 'a', 'op': 'select_units', 'scenario_id': self.scenario.id, 'unit_ids': unit_ids},
+            {'key': 'b', 'op': 'set_coins', 'scenario_id': self.scenario.id, 'unit_ids': unit_ids, 'coins': 40},
+            {'key': 'c', 'op': 'save_answers', 'scenario_id': self.scenario.id, 'unit_ids': unit_ids[:1],
+                'answers': {self.question.id: 'Fishing'}},
+            {'key': 'd', 'op': 'delete_areas', 'scenario_id': self.scenario.id, 'unit_ids': unit_ids[1:]},
+        ]
+        response = self.sync(operations)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual([x['status'] for x in data['results']], ['applied'] * 4)
+        self.assertEqual(data['scenarios_status'][str(self.scenario.id)]['coins_assigned'], 40)
+        self.assertEqual(PlanningUnitAnswer.objects.filter(response=self.response, text_answer='Fishing').count(), 1)
+
+        # Replaying the same batch does nothing
+        response = self.sync(operations)
+        data = json.loads(response.content)
+        self.assertEqual([x['status'] for x in data['results']], ['duplicate'] * 4)
+        self.assertEqual(CoinAssignment.objects.filter(response=self.response).count(), 1)
+
+    def test_sync_rolls_back_failed_batch(self):
+        """Test an invalid operation rolls back the whole batch"""
+        unit_ids = [pu.id for pu in self.planning_units]
+        response = self.sync([
+            {'key': 'a', 'op': 'set_coins', 'scenario_id': self.scenario.id, 'unit_ids': unit_ids[:1], 'coins': 50},
+            {'key': 'b', 'op': 'set_coins', 'scenario_id': self.scenario.id, 'unit_ids': unit_ids[1:], 'coins': 60},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(CoinAssignment.objects.filter(response=self.response).count(), 0)
+        self.assertEqual(self.response.sync_operations_response.count(), 0)
+
+    def test_sync_selected_units_start_at_minimum_coins(self):
+        """Test selected units get the minimum coins and the final state is checked against it"""
+        unit_ids = [pu.id for pu in self.planning_units]
+        response = self.sync([
+            {'key': 'a', 'op': 'select_units', 'scenario_id': self.scenario.id, 'unit_ids': unit_ids},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(CoinAssignment.objects.filter(response=self.response).values_list('coins_assigned', flat=True)),
+            [self.scenario.min_coins_per_pu] * 2
+        )
+
+        CoinAssignment.objects.filter(response=self.response).update(coins_assigned=0)
+        response = self.sync([
+            {'key': 'b', 'op': 'select_units', 'scenario_id': self.scenario.id, 'unit_ids': unit_ids},
+        ])
+        self.assertEqual(response.status_code, 400)
+
+    def test_sync_select_units_without_coins(self):
+        """Test unweighted scenarios do not get zero-coin assignments from select_units"""
+        self.scenario.is_weighted = False
+        self.scenario.save()
+        unit_ids = [pu.id for pu in self.planning_units]
+        response = self.sync([
+            {'key': 'a', 'op': 'select_units', 'scenario_id': self.scenario.id, 'unit_ids': unit_ids},
+            {'key': 'b', 'op': 'save_answers', 'scenario_id': self.scenario.id, 'unit_ids': unit_ids, 'coins': 0,
+                'answers': {self.question.id: 'Fishing'}},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content)['operation_index'], 0)
+
+        response = self.sync([
+            {'key': 'b', 'op': 'save_answers', 'scenario_id': self.scenario.id, 'unit_ids': unit_ids, 'coins': 0,
+                'answers': {self.question.id: 'Fishing'}},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(CoinAssignment.objects.filter(response=self.response).exists())
+        self.assertEqual(
+            sorted(unit_id for unit_id, geojson, coins in self.response.get_selected_planning_units(self.scenario)),
+            unit_ids
+        )
+
+    def test_sync_requires_active_survey_membership(self):
+        """Test the sync endpoint applies the same access checks as the survey views"""
+        self.survey.groups.remove(self.map_group)
+        response = self.sync([])
+        self.assertEqual(response.status_code, 403)
+
+        self.survey.groups.add(self.map_group)
+        self.survey.end_date = timezone.now() - timedelta(days=1)
+        self.survey.save()
+        response = self.sync([])
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(json.loads(response.content)['message'], 'Survey has ended.')
+
+class DeleteScenarioAreasTests(TestCase):
+    """Test cases for deleting selected areas from a scenario"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.survey = Survey.objects.create(title='Test Survey')
+        self.pu_family = PlanningUnitFamily.objects.create(name='Test Family')
+        self.scenario = Scenario.objects.create(
+            name='Test Scenario',
+            survey=self.survey,
+            order=1,
+            pu_family=self.pu_family
+        )
+        self.question = PlanningUnitQuestion.objects.create(
+            text='Why is this area important?',
+            scenario=self.scenario,
+            order=1,
+            question_type='text'
+        )
+        self.response = SurveyResponse.objects.create(survey=self.survey, user=self.user)
+        self.planning_units = []
+        for x in range(3):
+            pu = PlanningUnit.objects.create(
+                geometry=MultiPolygon(Polygon(((x, 0), (x, 1), (x+1, 1), (x+1, 0), (x, 0))))
+            )
+            pu.family.add(self.pu_family)
+            self.planning_units.append(pu)
+            PlanningUnitAnswer.objects.create(
+                response=self.response, question=self.question, planning_unit=pu, text_answer='Fishing'
+            )
+            CoinAssignment.objects.create(
+                response=self.response, scenario=self.scenario, planning_unit=pu, coins_assigned=10
+            )
+        self.client.login(username='testuser', password='testpass123')
+        self.url = reverse('survey:delete_survey_scenario_areas', kwargs={
+            'response_id': self.response.id,
+            'scenario_id': self.scenario.id
+        })
+
+    def test_delete_listed_areas(self):
+        """Test deleting a list of units"""
+        response = self.client.post(self.url, data={
+            'unit_ids': ','.join(str(pu.id) for pu in self.planning_units[:2])
+        })
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['scenario_status']['areas_selected'], 1)
+        self.assertEqual(PlanningUnitAnswer.objects.filter(response=self.response).count(), 1)
+
+    def test_delete_all_areas(self):
+        """Test deleting every unit in the scenario"""
+        response = self.client.post(self.url, data={'all': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(PlanningUnitAnswer.objects.filter(response=self.response).count(), 0)
+        self.assertEqual(CoinAssignment.objects.filter(response=self.response).count(), 0)
+
+    def test_delete_single_area_without_coins(self):
+        """Test deleting a single unit that has answers but no coin assignment"""
+        pu = self.planning_units[0]
+        CoinAssignment.objects.filter(planning_unit=pu).delete()
+        response = self.client.get(reverse('survey:delete_survey_scenario_area', kwargs={
+            'response_id': self.response.id,
+            'scenario_id': self.scenario.id,
+            'unit_id': pu.id
+        }))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(PlanningUnitAnswer.objects.filter(planning_unit=pu).exists())
+
+class CoinDensityTests(TestCase):
+    """Test cases for the materialised coin density"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            password='testpass123'
+        )
+        self.survey = Survey.objects.create(title='Test Survey')
+        self.scenario = Scenario.objects.create(
+            name='Test Scenario',
+            survey=self.survey,
+            order=1,
+            is_weighted=True
+        )
+        self.planning_units = [
+            PlanningUnit.objects.create(
+                geometry=MultiPolygon(Polygon(((x, 0), (x, 1), (x+1, 1), (x+1, 0), (x, 0))))
+            )
+            for x in range(2)
+        ]
+        self.response = SurveyResponse.objects.create(survey=self.survey, user=self.user)
+        self.other_response = SurveyResponse.objects.create(survey=self.survey, user=self.other_user)
+
+    def get_density(self, planning_unit):
+        return CoinDensity.objects.filter(scenario=self.scenario, planning_unit=planning_unit).first()
+
+    def test_density_maintained_incrementally(self):
+        """Test the density follows coin assignments as they change"""
+        pu = self.planning_units[0]
+        CoinAssignment.objects.create(
+            response=self.response, scenario=self.scenario, planning_unit=pu, coins_assigned=10
+        )
+        upsert_coin_assignments(self.other_response, self.scenario, [pu.id], 30)
+        density = self.get_density(pu)
+        self.assertEqual(density.total_coins, 40)
+        self.assertEqual(density.respondent_count, 2)
+        self.assertEqual(density.mean_coins, 20)
+
+        delete_selected_planning_units(self.other_response, self.scenario)
+        self.assertEqual(self.get_density(pu).total_coins, 10)
+
+        self.response.delete()
+        self.assertIsNone(self.get_density(pu))
+
+    def test_rebuild_command(self):
+        """Test the rebuild command recomputes densities from scratch"""
+        pu = self.planning_units[1]
+        CoinAssignment.objects.create(
+            response=self.response, scenario=self.scenario, planning_unit=pu, coins_assigned=5
+        )
+        CoinDensity.objects.all().delete()
+        call_command('rebuild_coin_density', '--scenario', str(self.scenario.id))
+        self.assertEqual(self.get_density(pu).total_coins, 5)
+
+    @unittest.skipUnless(importlib.util.find_spec('numpy'), 'numpy is not installed')
+    def test_coin_matrix_round_trip(self):
+        """Test the coin matrix is built in CSR form and reloads memory-mapped"""
+        for pu, coins in zip(self.planning_units, [10, 20]):
+            CoinAssignment.objects.create(
+                response=self.response, scenario=self.scenario, planning_unit=pu, coins_assigned=coins
+            )
+        CoinAssignment.objects.create(
+            response=self.other_response, scenario=self.scenario, planning_unit=self.planning_units[1], coins_assigned=5
+        )
+        matrix = build_coin_matrix(self.scenario)
+        self.assertEqual(matrix.shape, (2, 2))
+        self.assertEqual(list(matrix.indptr), [0, 2, 3])
+        self.assertEqual(list(matrix.data), [10, 20, 5])
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            save_coin_matrix(matrix, output_dir)
+            loaded = load_coin_matrix(output_dir)
+            self.assertEqual(list(loaded.response_ids), [self.response.id, self.other_response.id])
+            self.assertEqual(list(loaded.indices), [0, 1, 1])
+
+    @unittest.skipUnless(importlib.util.find_spec('numpy'), 'numpy is not installed')
+    def test_compute_scenario_statistics(self):
+        """Test the statistics command fills the cache tables"""
+        pu = self.planning_units[0]
+        CoinAssignment.objects.create(
+            response=self.response, scenario=self.scenario, planning_unit=pu, coins_assigned=10
+        )
+        CoinAssignment.objects.create(
+            response=self.other_response, scenario=self.scenario, planning_unit=self.planning_units[1], coins_assigned=30
+        )
+        call_command('compute_scenario_statistics', '--bootstrap-samples', '20')
+        self.assertEqual(ScenarioStatistic.objects.get(scenario=self.scenario).respondent_count, 2)
+        statistic = PlanningUnitStatistic.objects.get(scenario=self.scenario, planning_unit=pu)
+        self.assertEqual(statistic.selection_share, 0.5)
+        self.assertEqual(statistic.mean_coins, 5)
+        self.assertLessEqual(statistic.mean_coins_ci_low, statistic.mean_coins_ci_high)
+
+    @unittest.skipUnless(importlib.util.find_spec('scipy'), 'scipy is not installed')
+    def test_compute_hotspots(self):
+        """Test the hotspot command builds the neighbour graph and scores every unit"""
+        family = PlanningUnitFamily.objects.create(name='Grid Family')
+        self.scenario.pu_family = family
+        self.scenario.save()
+        for x in range(2, 4):
+            self.planning_units.append(PlanningUnit.objects.create(
+                geometry=MultiPolygon(Polygon(((x, 0), (x, 1), (x+1, 1), (x+1, 0), (x, 0))))
+            ))
+        for pu in self.planning_units:
+            pu.family.add(family)
+        for pu, coins in zip(self.planning_units, [40, 30, 5, 0]):
+            if coins:
+                CoinAssignment.objects.create(
+                    response=self.response, scenario=self.scenario, planning_unit=pu, coins_assigned=coins
+                )
+
+        call_command('compute_hotspots', '--scenario', str(self.scenario.id))
+        graph = PlanningUnitNeighbourGraph.objects.get(family=family)
+        self.assertEqual(graph.unit_count, 4)
+        self.assertEqual(graph.edge_count, 3)
+        hotspots = PlanningUnitHotspot.objects.filter(scenario=self.scenario).order_by('planning_unit_id')
+        self.assertEqual([hotspot.total_coins for hotspot in hotspots], [40, 30, 5, 0])
+        self.assertEqual(hotspots[0].moran_quadrant, 'HH')
+        self.assertGreater(hotspots[0].gi_z_score, hotspots[3].gi_z_score)
+
+    def test_density_endpoint_staff_only(self):
+        """Test only staff can read the aggregate coin density"""
+        pu = self.planning_units[0]
+        CoinAssignment.objects.create(
+            response=self.response, scenario=self.scenario, planning_unit=pu, coins_assigned=10
+        )
+        url = reverse('survey:scenario_coin_density', kwargs={'scenario_id': self.scenario.id})
+        self.client.login(username='testuser', password='testpass123')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['units'], [[pu.id, 10, 1, 10.0]])
+
+class SurveyExportTests(TestCase):
+    """Test cases for streaming response exports"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.survey = Survey.objects.create(title='Test Survey')
+        self.question = SurveyQuestion.objects.create(
+            text='Which gear do you use?',
+            survey=self.survey,
+            order=1,
+            question_type='multiple_choice'
+        )
+        self.option_a = SurveyQuestionOption.objects.create(question=self.question, text='Nets', order=1)
+        self.option_b = SurveyQuestionOption.objects.create(question=self.question, text='Traps', order=2)
+        self.scenario = Scenario.objects.create(
+            name='Test Scenario',
+            survey=self.survey,
+            order=1,
+            is_weighted=True
+        )
+        self.planning_unit = PlanningUnit.objects.create(
+            geometry=MultiPolygon(Polygon(((0, 0), (0, 1), (1, 1), (1, 0), (0, 0))))
+        )
+        self.response = SurveyResponse.objects.create(survey=self.survey, user=self.user)
+        SurveyAnswer.objects.create(
+            response=self.response,
+            question=self.question,
+            selected_options=[{'option_id': self.option_b.id, 'text': 'Traps'}]
+        )
+        CoinAssignment.objects.create(
+            response=self.response, scenario=self.scenario, planning_unit=self.planning_unit, coins_assigned=25
+        )
+
+    def test_export_long_jsonl(self):
+        """Test the long layout has one row per answer and coin assignment"""
+        rows = [json.loads(line) for line in export_survey_responses(self.survey, format='jsonl')]
+        self.assertEqual([row['answer_type'] for row in rows], ['survey', 'coins'])
+        self.assertEqual(rows[0]['selected_option_ids'], [self.option_b.id])
+        self.assertEqual(rows[1]['coins_assigned'], 25)
+
+    def test_option_counts(self):
+        """Test selected option IDs are stored for indexed per-option counts"""
+        self.assertEqual(SurveyAnswer.objects.get(response=self.response).selected_option_ids, [self.option_b.id])
+        self.assertEqual(
+            SurveyAnswer.objects.filter(selected_option_ids__contains=[self.option_b.id]).count(), 1
+        )
+        option_counts = get_survey_option_counts(self.survey)
+        self.assertEqual(option_counts['survey'], {self.question.id: {self.option_b.id: 1}})
+        option_counts = get_survey_option_counts(self.survey, option_ids=[self.option_a.id, self.option_b.id])
+        self.assertEqual(option_counts['survey'], {self.question.id: {self.option_b.id: 1}})
+        option_counts = get_survey_option_counts(self.survey, option_ids=[self.option_a.id])
+        self.assertEqual(option_counts['survey'], {})
+
+    def test_export_wide_csv(self):
+        """Test the wide layout flattens selected options into columns"""
+        content = ''.join(export_survey_responses(self.survey, format='csv', layout='wide'))
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 1)
+        field_name = 'question_{}'.format(self.question.id)
+        self.assertEqual(rows[0]['{}_option_{}'.format(field_name, self.option_a.id)], '0')
+        self.assertEqual(rows[0]['{}_option_{}'.format(field_name, self.option_b.id)], '1')
+        self.assertEqual(rows[0]['scenario_{}_coins_assigned'.format(self.scenario.id)], '25')
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_export_parquet(self):
+        """Test the Parquet export writes typed datasets partitioned by survey"""
+        import pyarrow.parquet as pq
+        with tempfile.TemporaryDirectory() as output_dir:
+            call_command('export_survey_parquet', output_dir, '--survey', str(self.survey.id))
+            table = pq.read_table(os.path.join(
+                output_dir, 'survey_answers', 'survey_id={}'.format(self.survey.id), 'part-0.parquet'
+            ))
+            self.assertEqual(table.column('selected_option_ids').to_pylist(), [[self.option_b.id]])
+            self.assertIn(b'survey_schema', table.schema.metadata)
+            coins = pq.read_table(os.path.join(output_dir, 'coin_assignments'))
+            self.assertEqual(coins.column('coins_assigned').to_pylist(), [25])
+
+class QuestionSummaryTests(TestCase):
+    """Test cases for the precomputed question summaries"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            password='testpass123'
+        )
+        self.survey = Survey.objects.create(title='Test Survey')
+        self.choice_question = SurveyQuestion.objects.create(
+            text='Which gear do you use?',
+            survey=self.survey,
+            order=1,
+            question_type='multiple_choice'
+        )
+        self.option = SurveyQuestionOption.objects.create(question=self.choice_question, text='Nets', order=1)
+        self.number_question = SurveyQuestion.objects.create(
+            text='How many days do you fish?',
+            survey=self.survey,
+            order=2,
+            question_type='number'
+        )
+        self.scenario = Scenario.objects.create(
+            name='Test Scenario',
+            survey=self.survey,
+            order=1
+        )
+        self.pu_question = PlanningUnitQuestion.objects.create(
+            text='Why is this area important?',
+            scenario=self.scenario,
+            order=1,
+            question_type='text'
+        )
+        self.planning_unit = PlanningUnit.objects.create(
+            geometry=MultiPolygon(Polygon(((0, 0), (0, 1), (1, 1), (1, 0), (0, 0))))
+        )
+        self.response = SurveyResponse.objects.create(survey=self.survey, user=self.user)
+        self.other_response = SurveyResponse.objects.create(survey=self.survey, user=self.other_user)
+
+    def test_summaries_maintained_incrementally(self):
+        """Test the summaries follow answers as they are saved and deleted"""
+        SurveyAnswer.objects.create(
+            response=self.response,
+            question=self.choice_question,
+            selected_options=[{'option_id': self.option.id, 'text': 'Nets'}]
+        )
+        SurveyAnswer.objects.create(response=self.response, question=self.number_question, numeric_answer=10)
+        SurveyAnswer.objects.create(response=self.other_response, question=self.number_question, numeric_answer=20)
+        upsert_planning_unit_answers(self.response, self.pu_question, [self.planning_unit.id], {'text_answer': 'Spawning'})
+
+        summaries = get_survey_question_summaries(self.survey)
+        self.assertEqual(summaries['survey'][self.choice_question.id]['option_counts'], {str(self.option.id): 1})
+        number_summary = summaries['survey'][self.number_question.id]
+        self.assertEqual(number_summary['response_count'], 2)
+        self.assertEqual(number_summary['numeric_mean'], 15)
+        self.assertEqual(len(number_summary['numeric_histogram']), 10)
+        self.assertEqual(number_summary['numeric_histogram'][0]['count'], 1)
+        self.assertEqual(number_summary['numeric_histogram'][-1]['count'], 1)
+        pu_summary = summaries['planning_unit'][self.pu_question.id]
+        self.assertEqual(pu_summary['response_count'], 1)
+        self.assertEqual(pu_summary['units'][self.planning_unit.id]['response_count'], 1)
+
+        delete_selected_planning_units(self.response, self.scenario)
+        self.other_response.delete()
+        summaries = get_survey_question_summaries(self.survey)
+        self.assertEqual(summaries['planning_unit'], {})
+        self.assertEqual(summaries['survey'][self.number_question.id]['response_count'], 1)
+        self.assertEqual(summaries['survey'][self.number_question.id]['numeric_histogram'][0]['count'], 1)
+
+    def test_rebuild_command(self):
+        """Test the rebuild command recomputes summaries from scratch"""
+        SurveyAnswer.objects.create(response=self.response, question=self.number_question, numeric_answer=3)
+        QuestionSummary.objects.all().delete()
+        call_command('rebuild_question_summaries', '--survey', str(self.survey.id))
+        summary = QuestionSummary.objects.get(answer_type='survey', question_id=self.number_question.id)
+        self.assertEqual(summary.numeric_max, 3)
+        self.assertEqual(
+            get_survey_question_summaries(self.survey)['survey'][self.number_question.id]['numeric_histogram'],
+            [{'min': 3, 'max': 3, 'count': 1}]
+        )
+
+    def test_answer_edits_and_deletes_move_counters(self):
+        """Test editing and deleting single answers moves the counters without a rebuild"""
+        second_option = SurveyQuestionOption.objects.create(question=self.choice_question, text='Traps', order=2)
+        answer = SurveyAnswer.objects.create(
+            response=self.response,
+            question=self.choice_question,
+            selected_options=[{'option_id': self.option.id, 'text': 'Nets'}]
+        )
+        SurveyAnswer.objects.create(
+            response=self.other_response,
+            question=self.choice_question,
+            selected_options=[{'option_id': self.option.id, 'text': 'Nets'}]
+        )
+        low = SurveyAnswer.objects.create(response=self.response, question=self.number_question, numeric_answer=1)
+        SurveyAnswer.objects.create(response=self.other_response, question=self.number_question, numeric_answer=5)
+
+        answer.selected_options = [{'option_id': second_option.id, 'text': 'Traps'}]
+        answer.save()
+        low.delete()
+        summaries = get_survey_question_summaries(self.survey)['survey']
+        self.assertEqual(summaries[self.choice_question.id]['response_count'], 2)
+        self.assertEqual(
+            summaries[self.choice_question.id]['option_counts'],
+            {str(self.option.id): 1, str(second_option.id): 1}
+        )
+        number_summary = summaries[self.number_question.id]
+        self.assertEqual(number_summary['response_count'], 1)
+        self.assertEqual(number_summary['numeric_mean'], 5)
+        self.assertEqual((number_summary['numeric_min'], number_summary['numeric_max']), (5, 5))
+        self.assertEqual(sum(histogram_bin['count'] for histogram_bin in number_summary['numeric_histogram']), 1)
+
+        call_command('rebuild_question_summaries', '--survey', str(self.survey.id))
+        rebuilt = get_survey_question_summaries(self.survey)['survey']
+        self.assertEqual(rebuilt[self.choice_question.id], summaries[self.choice_question.id])
+
+    def test_planning_unit_answers_count_responses_once(self):
+        """Test a response answering a question at several units counts once for the question"""
+        other_unit = PlanningUnit.objects.create(
+            geometry=MultiPolygon(Polygon(((1, 0), (1, 1), (2, 1), (2, 0), (1, 0))))
+        )
+        upsert_planning_unit_answers(
+            self.response, self.pu_question, [self.planning_unit.id, other_unit.id], {'text_answer': 'Spawning'}
+        )
+        self.assertEqual(
+            get_survey_question_summaries(self.survey)['planning_unit'][self.pu_question.id]['response_count'], 1
+        )
+        PlanningUnitAnswer.objects.get(planning_unit=other_unit).delete()
+        pu_summary = get_survey_question_summaries(self.survey)['planning_unit'][self.pu_question.id]
+        self.assertEqual(pu_summary['response_count'], 1)
+        self.assertEqual(list(pu_summary['units']), [self.planning_unit.id])
+        self.response.delete()
+        self.assertEqual(get_survey_question_summaries(self.survey)['planning_unit'], {})
+
+class AsyncViewTests(TransactionTestCase):
+    """Test cases for the async versions of the map-click views"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.survey = Survey.objects.create(title='Test Survey')
+        self.pu_family = PlanningUnitFamily.objects.create(name='Test Family')
+        self.scenario = Scenario.objects.create(
+            name='Test Scenario',
+            survey=self.survey,
+            order=1,
+            pu_family=self.pu_family
+        )
+        self.response = SurveyResponse.objects.create(survey=self.survey, user=self.user)
+        self.planning_unit = PlanningUnit.objects.create(
+            geometry=MultiPolygon(Polygon(((0, 0), (0, 1), (1, 1), (1, 0), (0, 0))))
+        )
+        self.planning_unit.family.add(self.pu_family)
+        CoinAssignment.objects.create(
+            response=self.response, scenario=self.scenario, planning_unit=self.planning_unit, coins_assigned=10
+        )
+
+    def test_async_lookup_non_spatial_scenario(self):
+        """Test the async lookup returns the same errors as the sync view"""
+        self.scenario.is_spatial = False
+        self.scenario.save()
+        request = self.factory.get('/survey/scenario/{}/get_area_by_point/?x=0&y=0'.format(self.scenario.id))
+        request.user = self.user
+        response = async_to_sync(get_scenario_pu_by_coordinates_async)(request, scenario_id=self.scenario.id)
+        self.assertEqual(response.status_code, 400)
+
+    def test_async_lookup_unknown_scenario(self):
+        """Test the async lookup returns 404 for a missing scenario"""
+        request = self.factory.get('/survey/scenario/0/get_area_by_point/?x=0&y=0')
+        request.user = self.user
+        response = async_to_sync(get_scenario_pu_by_coordinates_async)(request, scenario_id=0)
+        self.assertEqual(response.status_code, 404)
+
+    def test_async_lookup_finds_planning_unit(self):
+        """Test the async lookup returns the planning unit under the point like the sync view"""
+        request = self.factory.get('/survey/scenario/{}/get_area_by_point/?x=0.5&y=0.5'.format(self.scenario.id))
+        request.user = self.user
+        response = async_to_sync(get_scenario_pu_by_coordinates_async)(request, scenario_id=self.scenario.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['planning_unit_id'], self.planning_unit.id)
+
+    def test_async_lookup_requires_login(self):
+        """Test the async lookup redirects anonymous users to log in"""
+        request = self.factory.get('/survey/scenario/{}/get_area_by_point/?x=0.5&y=0.5'.format(self.scenario.id))
+        request.user = AnonymousUser()
+        response = async_to_sync(get_scenario_pu_by_coordinates_async)(request, scenario_id=self.scenario.id)
+        self.assertEqual(response.status_code, 302)
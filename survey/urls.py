@@ -1,17 +1,37 @@
+from django.conf import settings
 from django.urls import re_path
 from . import views
 
 app_name = 'survey'
 
+# Serve the map-click lookup from its async view when running under ASGI
+if getattr(settings, 'SURVEY_ASYNC_VIEWS', False):
+    area_by_point_view = views.get_scenario_pu_by_coordinates_async
+else:
+    area_by_point_view = views.get_scenario_pu_by_coordinates
+
 urlpatterns = [
     # path('', views.survey_list, name='survey_list'),
     re_path(r'start/(?P<surveypk>\d+)/?(?P<responsepk>\d+)?/?$', views.survey_start, name='survey_start'),
-    re_path(r'scenario/(?P<scenario_id>\d+)/get_area_by_point/(?P<x_coord>\d+)/(?P<y_coord>\d+)/?$', views.get_scenario_pu_by_coordinates, name='survey_scenario'),
-    re_path(r'scenario/(?P<scenario_id>\d+)/get_area_by_point/?', views.get_scenario_pu_by_coordinates, name='survey_scenario'),
+    re_path(r'scenario/(?P<scenario_id>\d+)/get_area_by_point/(?P<x_coord>\d+)/(?P<y_coord>\d+)/?$', area_by_point_view, name='survey_scenario'),
+    re_path(r'scenario/(?P<scenario_id>\d+)/get_area_by_point/?', area_by_point_view, name='survey_scenario'),
     re_path(r'scenario/(?P<response_id>\d+)/(?P<scenario_id>\d+)/?$', views.survey_scenario, name='survey_scenario'),
     re_path(r'area/delete/(?P<response_id>\d+)/(?P<scenario_id>\d+)/(?P<unit_id>\d+)/?$', views.delete_survey_scenario_area, name='delete_survey_scenario_area'),
+    re_path(r'area/delete/(?P<response_id>\d+)/(?P<scenario_id>\d+)/?$', views.delete_survey_scenario_areas, name='delete_survey_scenario_areas'),
     re_path(r'area/(?P<response_id>\d+)/(?P<scenario_id>\d+)/?(?P<unit_id>\d+)?/?$', views.survey_scenario_area, name='survey_scenario_area'),
 
+    re_path(r'schema/(?P<surveypk>\d+)/?$', views.survey_schema, name='survey_schema'),
+    re_path(r'answers/(?P<response_id>\d+)/?$', views.survey_response_answers, name='survey_response_answers'),
+    re_path(r'bundle/(?P<surveypk>\d+)/?(?P<responsepk>\d+)?/?$', views.survey_response_bundle, name='survey_response_bundle'),
+    re_path(r'sync/(?P<response_id>\d+)/?$', views.survey_response_sync, name='survey_response_sync'),
+
+    re_path(r'results/density/(?P<scenario_id>\d+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.pbf$', views.scenario_coin_density_tile, name='scenario_coin_density_tile'),
+    re_path(r'results/density/(?P<scenario_id>\d+)/?$', views.scenario_coin_density, name='scenario_coin_density'),
+    re_path(r'results/options/(?P<surveypk>\d+)/?$', views.survey_option_counts, name='survey_option_counts'),
+    re_path(r'results/summaries/(?P<surveypk>\d+)/?$', views.survey_question_summaries, name='survey_question_summaries'),
+
+    re_path(r'layers/autocomplete/?$', views.LayerAutocomplete.as_view(), name='layer_autocomplete'),
+
     re_path(r'myplanner/content/?$', views.get_myplanner_survey_content, name='get_myplanner_survey_content'),
     # re_path(r'continue/(?P<responsepk>\d+)/?$', views.survey_continue, name='survey_continue'),
     # path('<int:pk>/', views.survey_detail, name='survey_detail'),
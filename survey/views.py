@@ -1,56 +1,186 @@
+import hashlib
 import json
+from asgiref.sync import sync_to_async
+from dal import autocomplete
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
+from django.contrib.gis.db.models.functions import AsGeoJSON, Transform
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Min, Prefetch, Sum
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
 from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from urllib.parse import urlparse, parse_qs, unquote
+from layers.models import Layer
 
+from .cache import (
+    SURVEY_ACCESS_CACHE_TIMEOUT, SURVEY_LAYER_GROUPS_CACHE_TIMEOUT, SURVEY_SCHEMA_CACHE_TIMEOUT,
+    get_access_versions, get_response_access_cache_key, get_survey_layer_groups_cache_key, get_survey_layer_groups_version,
+    get_survey_schema,
+)
 from .forms import SurveyResponseForm, ScenarioForm, PlanningUnitForm
+from .geojson import feature_collection_response, get_feature
 from .models import (
-    CoinAssignment, Survey, SurveyLayerGroup, SurveyResponse, Scenario,  
-    PlanningUnitAnswer
+    CoinAssignment, Survey, SurveyLayerOrder, SurveyResponse, Scenario,  
+    SyncOperation, SURVEY_SCHEMA_VERSION, delete_selected_planning_units,
+    get_coin_density_tile, get_invalid_planning_unit_ids, parse_planning_unit_ids,
+    refresh_coin_density, upsert_coin_assignments, CoinDensity, get_survey_option_counts,
+    get_survey_question_summaries,
 )
 
+SURVEY_MYPLANNER_CACHE_TIMEOUT = getattr(settings, 'SURVEY_MYPLANNER_CACHE_TIMEOUT', 60*60)
+
 def get_myplanner_js(request):
     js_tag = '<script src="/static/survey/js/survey_myplanner.js"></script>'
     return js_tag
 
+def get_myplanner_surveys(user):
+    """
+    Active surveys visible to the user through their groups, with the user's
+    own responses prefetched onto `user_responses`.
+    """
+    now = timezone.now()
+    return Survey.objects.filter(
+        start_date__lte=now,
+        end_date__gte=now,
+        groups__mapgroupmember__user=user
+    ).distinct().prefetch_related(
+        Prefetch(
+            'survey_responses_survey',
+            queryset=SurveyResponse.objects.filter(user=user).select_related('survey'),
+            to_attr='user_responses'
+        )
+    )
+
+def get_request_myplanner_surveys(request):
+    # Memoised on the request, so the ETag and the page share one read
+    if '_myplanner_surveys' not in request.__dict__:
+        request._myplanner_surveys = list(get_myplanner_surveys(request.user))
+    return request._myplanner_surveys
+
+def get_myplanner_cache_key(user, template, surveys):
+    # Membership changes alter the survey list; answer saves bump the response's updated_at
+    version = [
+        (survey.pk, survey.updated_at.isoformat(), [
+            (response.pk, response.updated_at.isoformat()) for response in survey.user_responses
+        ]) for survey in surveys
+    ]
+    digest = hashlib.md5(repr((template, version)).encode('utf-8')).hexdigest()
+    return 'survey_myplanner_html_{}_{}'.format(user.pk, digest)
+
 def get_myplanner_html(request, template='survey/survey_myplanner.html'):
     context = {
         'GROUP_SURVEYS': [],
         'SURVEY_STATUS': []
     }
     user = request.user
-    if user.is_authenticated:
-        # get current date-time
-        now = timezone.now()
-        # get surveys that are active
-        surveys = Survey.objects.filter(start_date__lte=now, end_date__gte=now)
-        for survey in surveys:
-            if survey.groups.filter(mapgroupmember__user=user).exists() and not survey in context['GROUP_SURVEYS']:
-                context['GROUP_SURVEYS'].append(survey)
-                if SurveyResponse.objects.filter(survey=survey, user=user).exists():
-                    for response in SurveyResponse.objects.filter(survey=survey, user=user):
-                        context['SURVEY_STATUS'].append(
-                            {
-                                'survey': survey,
-                                'response': response
-                            }
-                        )
-                else:
-                    context['SURVEY_STATUS'].append(
-                        {
-                            'survey': survey,
-                            'response': None
-                        }
-                    )
-
-    if len(context['GROUP_SURVEYS']) == 0:
+    if not user.is_authenticated:
         return ''
+
+    surveys = get_request_myplanner_surveys(request)
+    if len(surveys) == 0:
+        return ''
+
+    cache_key = get_myplanner_cache_key(user, template, surveys)
+    rendered = cache.get(cache_key)
+    if rendered is not None:
+        return rendered
+
+    for survey in surveys:
+        context['GROUP_SURVEYS'].append(survey)
+        if len(survey.user_responses) > 0:
+            for response in survey.user_responses:
+                context['SURVEY_STATUS'].append(
+                    {
+                        'survey': survey,
+                        'response': response
+                    }
+                )
+        else:
+            context['SURVEY_STATUS'].append(
+                {
+                    'survey': survey,
+                    'response': None
+                }
+            )
+
     rendered = render_to_string(template, context=context, request=request)
+    cache.set(cache_key, rendered, SURVEY_MYPLANNER_CACHE_TIMEOUT)
     return rendered
 
+def get_version_etag(request, *parts):
+    # The CSRF cookie is included because the rendered forms embed a CSRF token
+    csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    version = repr((SURVEY_SCHEMA_VERSION, request.user.pk, request.path, csrf_cookie) + parts)
+    # Weak, since the same payload may be sent with different content encodings
+    return 'W/"{}"'.format(hashlib.md5(version.encode('utf-8')).hexdigest())
+
+def get_response_version(request, **response_filter):
+    """
+    Return a cheap (etag, last_modified) pair for one of the user's survey
+    responses, read in a single query and memoised on the request. Returns
+    (None, None) when there is no matching response in an active survey the
+    user can access, so the view runs and reports the problem itself.
+    """
+    memo_key = tuple(sorted(response_filter.items()))
+    versions = request.__dict__.setdefault('_survey_response_versions', {})
+    if memo_key in versions:
+        return versions[memo_key]
+
+    version = (None, None)
+    if request.user.is_authenticated:
+        row = SurveyResponse.objects.filter(
+            user=request.user,
+            survey__groups__mapgroupmember__user=request.user,
+            **response_filter
+        ).values_list(
+            'pk', 'updated_at', 'survey_id', 'survey__updated_at', 'survey__start_date', 'survey__end_date'
+        ).first()
+        now = timezone.now()
+        if row is not None and not (row[4] and row[4] > now) and not (row[5] and row[5] < now):
+            response_pk, response_updated_at, survey_id, survey_updated_at = row[:4]
+            # The survey pages embed the layer picker, which has its own cached version
+            layer_groups_updated_at = get_survey_layer_groups_version(survey_id)
+            version = (
+                get_version_etag(
+                    request, response_pk, response_updated_at.isoformat(), survey_updated_at.isoformat(),
+                    layer_groups_updated_at.isoformat()
+                ),
+                max(response_updated_at, survey_updated_at, layer_groups_updated_at)
+            )
+    versions[memo_key] = version
+    return version
+
+def survey_start_etag(request, surveypk, responsepk=None):
+    if responsepk is not None:
+        return get_response_version(request, pk=responsepk, survey_id=surveypk)[0]
+    return get_response_version(request, survey_id=surveypk)[0]
+
+def survey_start_last_modified(request, surveypk, responsepk=None):
+    if responsepk is not None:
+        return get_response_version(request, pk=responsepk, survey_id=surveypk)[1]
+    return get_response_version(request, survey_id=surveypk)[1]
+
+def scenario_etag(request, response_id, scenario_id, *args, **kwargs):
+    return get_response_version(request, pk=response_id, survey__scenarios_survey__pk=scenario_id)[0]
+
+def scenario_last_modified(request, response_id, scenario_id, *args, **kwargs):
+    return get_response_version(request, pk=response_id, survey__scenarios_survey__pk=scenario_id)[1]
+
+def myplanner_content_etag(request, template='survey/survey_myplanner_content.html'):
+    if not request.user.is_authenticated:
+        return get_version_etag(request, template)
+    surveys = get_request_myplanner_surveys(request)
+    return get_version_etag(request, get_myplanner_cache_key(request.user, template, surveys))
+
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=myplanner_content_etag)
 def get_myplanner_survey_content(request, template='survey/survey_myplanner_content.html'):
     return JsonResponse({
         'html': get_myplanner_html(request, template)
@@ -94,6 +224,59 @@ def save_survey_response(request, response):
         'errors': form.errors if form else error_message
     }
 
+def get_response_access(user, response_id):
+    """
+    Return the cached authorisation record for one of the user's responses:
+    the response with its survey, the survey's scenarios by ID, whether the
+    user is in one of the survey's groups and the survey's active window.
+    Returns None when the user has no such response. Records are dropped per
+    user on membership changes and per survey on survey or scenario edits.
+    """
+    cache_key = get_response_access_cache_key(user.pk, response_id)
+    access = cache.get(cache_key)
+    if access is not None and access['versions'] == get_access_versions(user.pk, access['survey_id']):
+        return access
+
+    response = SurveyResponse.objects.select_related('survey').filter(pk=response_id, user=user).first()
+    if response is None:
+        return None
+    survey = response.survey
+    # Read the versions before the rows they guard, so an edit made meanwhile is not cached
+    versions = get_access_versions(user.pk, survey.pk)
+    scenarios = {scenario.pk: scenario for scenario in Scenario.objects.filter(survey=survey)}
+    access = {
+        'versions': versions,
+        'response': response,
+        'survey_id': survey.pk,
+        'scenarios': scenarios,
+        'scenario_ids': list(scenarios),
+        'is_member': survey.groups.filter(mapgroupmember__user=user).exists(),
+        'start_date': survey.start_date,
+        'end_date': survey.end_date,
+    }
+    cache.set(cache_key, access, SURVEY_ACCESS_CACHE_TIMEOUT)
+    return access
+
+def get_response_access_error(access):
+    """
+    Return the error for an access record whose user is not in one of the
+    survey's groups or whose survey is not active, or None if it may be used.
+    """
+    now = timezone.now()
+    if not access['is_member']:
+        message = 'User does not have permission to take this survey.'
+    elif access['start_date'] and access['start_date'] > now:
+        message = 'Survey has not started yet.'
+    elif access['end_date'] and access['end_date'] < now:
+        message = 'Survey has ended.'
+    else:
+        return None
+    return {
+        'status': 'error',
+        'status_code': 403,
+        'message': message
+    }
+
 def get_survey_response(request, surveypk, responsepk=None):
     user = request.user
     response = None
@@ -108,21 +291,22 @@ def get_survey_response(request, surveypk, responsepk=None):
         }
     # Get survey and response if responsepk is provided
     if responsepk is not None:
-        try:
-            response = SurveyResponse.objects.get(pk=responsepk, user=user)
-            if response.survey.pk != int(surveypk):
-                return {
-                    'status': 'error',
-                    'status_code': 404,
-                    'message': 'Provided response ID does not match provided survey ID.'
-                }
-            survey = response.survey
-        except SurveyResponse.DoesNotExist:
+        access = get_response_access(user, responsepk)
+        if access is None:
             return {
                 'status': 'error',
                 'status_code': 404,
                 'message': 'No matching survey response found for this user.'
             }
+        if access['survey_id'] != int(surveypk):
+            return {
+                'status': 'error',
+                'status_code': 404,
+                'message': 'Provided response ID does not match provided survey ID.'
+            }
+        response = access['response']
+        survey = response.survey
+        is_member = access['is_member']
     else:
         # Get survey
         try:
@@ -133,9 +317,10 @@ def get_survey_response(request, surveypk, responsepk=None):
                 'status_code': 404,
                 'message': 'Survey does not exist.'
             }
+        is_member = survey.groups.filter(mapgroupmember__user=user).exists()
 
     # Check if user is in any of the groups for this survey
-    if not survey.groups.filter(mapgroupmember__user=user).exists():
+    if not is_member:
         return {
             'status': 'error',
             'status_code': 403,
@@ -203,6 +388,54 @@ def get_survey_response(request, surveypk, responsepk=None):
         # 'survey': survey
     }
 
+def get_survey_layer_groups(survey, template='survey/survey_myplanner_layerpicker.html'):
+    """
+    Return the survey's layer groups as a dict and as rendered layer picker
+    HTML. Both are cached per survey until a group or layer order changes.
+    """
+    cache_key = get_survey_layer_groups_cache_key(survey.pk)
+    survey_layer_groups = cache.get(cache_key)
+    if survey_layer_groups is not None:
+        return survey_layer_groups
+
+    layer_groups = {}
+    groups = survey.survey_layer_groups_survey.all().order_by('order').prefetch_related(
+        Prefetch(
+            'survey_layer_orders_layer_group',
+            queryset=SurveyLayerOrder.objects.select_related('layer').order_by('order')
+        )
+    )
+    for group in groups:
+        layer_groups[group.id] = {
+            'name': group.name,
+            'id': group.id,
+            'layers': []
+        }
+        for layer_order in group.survey_layer_orders_layer_group.all():
+            layer_groups[group.id]['layers'].append({
+                'name': layer_order.layer.name,
+                'id': layer_order.layer.id,
+                'slug_name': layer_order.layer.slug_name,
+                'order': layer_order.order,
+                'auto_show': layer_order.auto_show
+            })
+
+    if len(layer_groups) > 0:
+        layer_group_html = render_to_string(template, {
+            'layer_groups': layer_groups
+        })
+    else:
+        layer_group_html = False
+
+    survey_layer_groups = {
+        'layer_groups': layer_groups,
+        'html': layer_group_html
+    }
+    cache.set(cache_key, survey_layer_groups, SURVEY_LAYER_GROUPS_CACHE_TIMEOUT)
+    return survey_layer_groups
+
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=survey_start_etag, last_modified_func=survey_start_last_modified)
 def survey_start(request, surveypk, responsepk=None):
     survey_response = get_survey_response(request, surveypk, responsepk)
 
@@ -217,29 +450,9 @@ def survey_start(request, surveypk, responsepk=None):
     
     next_scenario = response.survey.get_scenarios().first()
 
-    layer_groups = {}
-    if SurveyLayerGroup.objects.filter(survey=response.survey).exists():
-        for group in response.survey.survey_layer_groups_survey.all().order_by('order'):
-            layer_groups[group.id] = {
-                'name': group.name,
-                'id': group.id,
-                'layers': []
-            }
-            for layer_order in group.survey_layer_orders_layer_group.all().order_by('order'):
-                layer_groups[group.id]['layers'].append({
-                    'name': layer_order.layer.name,
-                    'id': layer_order.layer.id,
-                    'slug_name': layer_order.layer.slug_name,
-                    'order': layer_order.order,
-                    'auto_show': layer_order.auto_show
-                })
-
-        layer_group_html = render_to_string('survey/survey_myplanner_layerpicker.html', {
-            'layer_groups': layer_groups
-        }, request=request)
-    else:
-        layer_group_html = False
-
+    survey_layer_groups = get_survey_layer_groups(response.survey)
+    layer_groups = survey_layer_groups['layer_groups']
+    layer_group_html = survey_layer_groups['html']
 
     return JsonResponse({
         'status': 'success',
@@ -256,25 +469,27 @@ def survey_start(request, surveypk, responsepk=None):
 def get_scenario_response(request, response_id, scenario_id):
     error = None
     status = 200
-    try:
-        response = SurveyResponse.objects.get(pk=response_id, user=request.user)
-        scenario = response.survey.get_scenarios().filter(id=scenario_id).first()
-        if scenario is None:
-            error = {
-                'status': 'error',
-                'status_code': 404,
-                'message': 'Scenario not found in this survey.'
-            }
-            status = 404
-    except SurveyResponse.DoesNotExist:
-        response = None
-        scenario = None
+    response = None
+    scenario = None
+    # The cached access record saves the ownership, response and scenario lookups
+    access = get_response_access(request.user, response_id)
+    if access is None:
         error = {
             'status': 'error',
             'status_code': 404,
             'message': 'Survey response not found.'
         }
         status = 404
+    elif int(scenario_id) not in access['scenario_ids']:
+        error = {
+            'status': 'error',
+            'status_code': 404,
+            'message': 'Scenario not found in this survey.'
+        }
+        status = 404
+    else:
+        response = access['response']
+        scenario = access['scenarios'][int(scenario_id)]
 
     return {
         'response': response,
@@ -284,6 +499,8 @@ def get_scenario_response(request, response_id, scenario_id):
     }
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=scenario_etag, last_modified_func=scenario_last_modified)
 def survey_scenario(request, response_id, scenario_id, template='survey/survey_myplanner_scenario_form.html'):
     scenario_dict = get_scenario_response(request, response_id, scenario_id)
     if scenario_dict['error'] is not None:
@@ -337,50 +554,16 @@ def survey_scenario(request, response_id, scenario_id, template='survey/survey_m
 
         jump_to_area_selection = False
 
-        feature_collection = {
-            "type": "FeatureCollection",
-            "features": []
-        }
+        selected_planning_units = []
 
         if scenario.is_spatial:
-            planning_unit_answers = PlanningUnitAnswer.objects.filter(response=response)
-
-            selected_planning_units = {}
-            for pua in planning_unit_answers:
-                pu_id = pua.planning_unit.id
-                if pu_id not in selected_planning_units.keys():
-                    selected_planning_units[pu_id] = {}
-                    selected_planning_units[pu_id]['geometry'] = json.loads(pua.planning_unit.geometry.geojson)
-                    selected_planning_units[pu_id]['properties'] = {
-                        'id': pua.planning_unit.id,
-                        'coins': 0,
-                        'existing': 'yes'
-                    }
-                if scenario.is_weighted:
-                    try:
-                        coin_assignment = CoinAssignment.objects.get(
-                            response=response,
-                            scenario=scenario,
-                            planning_unit=pua.planning_unit
-                        )
-                        selected_planning_units[pu_id]['properties']['coins'] = coin_assignment.coins_assigned
-                    except CoinAssignment.DoesNotExist:
-                        # in this case we do not need to add 'coins' to the unit's properties
-                        pass
-
-            if len(form.fields) == 0 and len(selected_planning_units) == 0:
+            selected_planning_units = response.get_selected_planning_units(scenario)
+
+            if len(form.fields) == 0 and not selected_planning_units.exists():
                 # No planning unit selected yet, redirect to area selection
                 jump_to_area_selection = True
                 # return survey_scenario_area(request, response_id, scenario_id)
 
-            for pu in selected_planning_units.values():
-                feature = {
-                    "type": "Feature",
-                    "geometry": pu['geometry'],
-                    "properties": pu['properties']
-                }
-                feature_collection['features'].append(feature)
-
         context = {
             'response': response,
             'survey': response.survey,
@@ -393,7 +576,7 @@ def survey_scenario(request, response_id, scenario_id, template='survey/survey_m
 
         # TODO: Get Scenario Response, answers and summary
         rendered = render(request, template, context)
-        return JsonResponse({
+        payload = {
             'status': 'success',
             'status_code': 200,
             'message': 'Scenario form loaded.',
@@ -406,12 +589,21 @@ def survey_scenario(request, response_id, scenario_id, template='survey/survey_m
             'jump_to_area_selection': jump_to_area_selection,
             'is_spatial': scenario.is_spatial,
             'is_weighted': scenario.is_weighted,
-            'planning_units_geojson': feature_collection,
             'minimum_coins': scenario.min_coins_per_pu,
             'maximum_coins': scenario.max_coins_per_pu,
             'total_coins': scenario.total_coins,
             'require_all_coins': scenario.require_all_coins_used,
-        })
+        }
+        features = (
+            get_feature(geojson, {
+                'id': pu_id,
+                'coins': coins if scenario.is_weighted else 0,
+                'existing': 'yes'
+            }) for pu_id, geojson, coins in (
+                selected_planning_units.iterator(chunk_size=500) if scenario.is_spatial else []
+            )
+        )
+        return feature_collection_response(request, payload, 'planning_units_geojson', features)
     
 @login_required
 def delete_survey_scenario_area(request, response_id, scenario_id, unit_id):
@@ -422,37 +614,80 @@ def delete_survey_scenario_area(request, response_id, scenario_id, unit_id):
         response = scenario_dict['response']
         scenario = scenario_dict['scenario']
 
-    try:
-        pu_answers = PlanningUnitAnswer.objects.filter(
-            response=response,
-            question__scenario=scenario,
-            planning_unit__id=unit_id
-        )
-        for pu_answer in pu_answers:
-            pu_answer.delete()
+    with transaction.atomic():
+        deleted = delete_selected_planning_units(response, scenario, [unit_id])
+        if deleted == 0:
+            return JsonResponse({
+                'status': 'error',
+                'status_code': 404,
+                'message': 'Planning unit answer not found.'
+            }, status=404)
 
-        # Also delete any coin assignments for this planning unit
-        CoinAssignment.objects.get(
-            response=response,
-            scenario=scenario,
-            planning_unit__id=unit_id
-        ).delete()
+        # Bump updated_at so cached status fragments are refreshed
+        response.save()
 
-        return JsonResponse({
-            'status': 'success',
-            'status_code': 200,
-            'message': 'Planning unit answer deleted successfully.',
-            'response_id': response.id,
-            'survey_id': response.survey.id
-        })
-    except PlanningUnitAnswer.DoesNotExist:
+    return JsonResponse({
+        'status': 'success',
+        'status_code': 200,
+        'message': 'Planning unit answer deleted successfully.',
+        'response_id': response.id,
+        'survey_id': response.survey.id,
+        'scenario_id': scenario.id,
+        'scenario_status': response.scenario_status(scenario.pk)
+    })
+
+@login_required
+def delete_survey_scenario_areas(request, response_id, scenario_id):
+    """
+    Remove many planning units from a scenario in one request: either the
+    comma-separated `unit_ids`, or every selected unit when `all` is set.
+    """
+    if request.method != 'POST':
         return JsonResponse({
             'status': 'error',
-            'status_code': 404,
-            'message': 'Planning unit answer not found.'
-        }, status=404)
+            'status_code': 405,
+            'message': 'Invalid request method. Only POST requests are allowed.'
+        }, status=405)
+    scenario_dict = get_scenario_response(request, response_id, scenario_id)
+    if scenario_dict['error'] is not None:
+        return JsonResponse(scenario_dict['error'], status=scenario_dict['status'])
+    else:
+        response = scenario_dict['response']
+        scenario = scenario_dict['scenario']
+
+    if request.POST.get('all') in ['true', 'True', '1']:
+        unit_ids = None
+    else:
+        try:
+            unit_ids = parse_planning_unit_ids(request.POST.get('unit_ids', ''))
+        except ValueError:
+            unit_ids = []
+        if len(unit_ids) == 0:
+            return JsonResponse({
+                'status': 'error',
+                'status_code': 400,
+                'message': 'Provide a comma-separated list of unit_ids, or all=true.'
+            }, status=400)
+
+    with transaction.atomic():
+        deleted = delete_selected_planning_units(response, scenario, unit_ids)
+        # Bump updated_at so cached status fragments are refreshed
+        response.save()
+
+    return JsonResponse({
+        'status': 'success',
+        'status_code': 200,
+        'message': 'Planning units removed successfully.',
+        'response_id': response.id,
+        'survey_id': response.survey.id,
+        'scenario_id': scenario.id,
+        'deleted': deleted,
+        'scenario_status': response.scenario_status(scenario.pk)
+    })
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=scenario_etag, last_modified_func=scenario_last_modified)
 def survey_scenario_area(request, response_id, scenario_id, unit_id=None, template='survey/survey_myplanner_unit_form.html'):
     scenario_dict = get_scenario_response(request, response_id, scenario_id)
     if scenario_dict['error'] is not None:
@@ -474,7 +709,9 @@ def survey_scenario_area(request, response_id, scenario_id, unit_id=None, templa
                         'status_code': 200,
                         'message': 'Planning unit answers saved successfully.',
                         'response_id': response.id,
-                        'survey_id': response.survey.id
+                        'survey_id': response.survey.id,
+                        'scenario_id': scenario.id,
+                        'scenario_status': response.scenario_status(scenario.pk)
                     })
 
                 except Exception as e:
@@ -532,24 +769,22 @@ def survey_scenario_area(request, response_id, scenario_id, unit_id=None, templa
             'pu_id': unit_id
         })
 
-@login_required
-def get_scenario_pu_by_coordinates(request, scenario_id, x_coord=None, y_coord=None):
-    try:
-        scenario = Scenario.objects.get(id=scenario_id)
-        if scenario.is_spatial is False:
-            return JsonResponse({
-                'status': 'error',
-                'status_code': 400,
-                'message': 'Scenario is not spatial.'
-            }, status=400)
-        
-    except Scenario.DoesNotExist:
+def get_scenario_lookup_error(scenario):
+    if scenario is None:
         return JsonResponse({
             'status': 'error',
             'status_code': 404,
             'message': 'Scenario not found.'
         }, status=404)
-    
+    if scenario.is_spatial is False:
+        return JsonResponse({
+            'status': 'error',
+            'status_code': 400,
+            'message': 'Scenario is not spatial.'
+        }, status=400)
+    return None
+
+def get_planning_unit_lookup(request, scenario, x_coord=None, y_coord=None):
     querydict = parse_qs(urlparse(unquote(request.get_full_path())).query)
 
     if x_coord is None:
@@ -557,24 +792,56 @@ def get_scenario_pu_by_coordinates(request, scenario_id, x_coord=None, y_coord=N
     if y_coord is None:
         y_coord = querydict.get('y', [None])[0]
 
-    planning_unit = scenario.get_planning_unit_by_coordinates(x_coord, y_coord)
+    # Transform to web mercator and serialise in the database
+    return scenario.get_planning_units_by_coordinates(x_coord, y_coord).annotate(
+        geojson=AsGeoJSON(Transform('geometry', 3857))
+    ).values_list('pk', 'geojson')
+
+def get_planning_unit_lookup_response(planning_unit):
     if planning_unit is None:
         return JsonResponse({
             'status': 'error',
             'status_code': 404,
             'message': 'No planning unit found at the provided coordinates.'
         }, status=404)
-    
-    planning_unit.geometry.transform(3857)  # Transform to web mercator
 
     return JsonResponse({
         'status': 'success',
         'status_code': 200,
         'message': 'Planning unit retrieved successfully.',
-        'planning_unit_id': planning_unit.id,
-        'planning_unit_geometry': planning_unit.geometry.geojson
+        'planning_unit_id': planning_unit[0],
+        'planning_unit_geometry': planning_unit[1]
     })
 
+@login_required
+def get_scenario_pu_by_coordinates(request, scenario_id, x_coord=None, y_coord=None):
+    scenario = Scenario.objects.filter(id=scenario_id).first()
+    error = get_scenario_lookup_error(scenario)
+    if error is not None:
+        return error
+
+    planning_unit = get_planning_unit_lookup(request, scenario, x_coord, y_coord).first()
+    return get_planning_unit_lookup_response(planning_unit)
+
+async def get_scenario_pu_by_coordinates_async(request, scenario_id, x_coord=None, y_coord=None):
+    """
+    Async version of get_scenario_pu_by_coordinates for ASGI servers. Both
+    queries are awaited with the async ORM, so one worker keeps serving other
+    clicks while the database looks up the planning unit. The responses are
+    the same as the sync view's.
+    """
+    # login_required does not wrap async views before Django 5.1; the lazy user loads in the sync thread
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        return redirect_to_login(request.get_full_path())
+
+    scenario = await Scenario.objects.filter(id=scenario_id).afirst()
+    error = get_scenario_lookup_error(scenario)
+    if error is not None:
+        return error
+
+    planning_unit = await get_planning_unit_lookup(request, scenario, x_coord, y_coord).afirst()
+    return get_planning_unit_lookup_response(planning_unit)
+
 def get_response_form(response, request, template='survey/survey_response_form.html'):
     if response is None or request is None:
         return None
@@ -586,4 +853,463 @@ def get_response_form(response, request, template='survey/survey_response_form.h
         'form': SurveyResponseForm(survey=response.survey, instance=response)
     }
     return render(request, template, context)
-    
\ No newline at end of file
+    
+
+def get_schema_survey(request, surveypk):
+    """
+    Return the survey whose schema is requested if the user may take it,
+    else None, read in one query and memoised on the request so the ETag
+    and the view share it.
+    """
+    surveys = request.__dict__.setdefault('_schema_surveys', {})
+    if surveypk not in surveys:
+        surveys[surveypk] = Survey.objects.filter(
+            pk=surveypk,
+            groups__mapgroupmember__user=request.user
+        ).first() if request.user.is_authenticated else None
+    return surveys[surveypk]
+
+def survey_schema_etag(request, surveypk):
+    # The URL carries no version, so clients revalidate against the schema version on every load
+    survey = get_schema_survey(request, surveypk)
+    if survey is None:
+        return None
+    return get_version_etag(request, survey.get_schema_version())
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=survey_schema_etag)
+def survey_schema(request, surveypk):
+    survey = get_schema_survey(request, surveypk)
+    if survey is None:
+        if not Survey.objects.filter(pk=surveypk).exists():
+            return JsonResponse({
+                'status': 'error',
+                'status_code': 404,
+                'message': 'Survey does not exist.'
+            }, status=404)
+        return JsonResponse({
+            'status': 'error',
+            'status_code': 403,
+            'message': 'User does not have permission to take this survey.'
+        }, status=403)
+
+    return JsonResponse({
+        'status': 'success',
+        'status_code': 200,
+        'message': 'Survey schema loaded.',
+        'survey_id': survey.id,
+        'schema': get_survey_schema(survey)
+    })
+
+@login_required
+def survey_response_answers(request, response_id):
+    try:
+        response = SurveyResponse.objects.select_related('survey').get(pk=response_id, user=request.user)
+    except SurveyResponse.DoesNotExist:
+        return JsonResponse({
+            'status': 'error',
+            'status_code': 404,
+            'message': 'Survey response not found.'
+        }, status=404)
+
+    answers_response = JsonResponse({
+        'status': 'success',
+        'status_code': 200,
+        'message': 'Survey answers loaded.',
+        'survey_id': response.survey.id,
+        'response_id': response.id,
+        'schema_version': response.survey.get_schema_version(),
+        'answers': response.get_answers()
+    })
+    patch_cache_control(answers_response, private=True, no_cache=True)
+    return answers_response
+
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=survey_start_etag, last_modified_func=survey_start_last_modified)
+def survey_response_bundle(request, surveypk, responsepk=None):
+    """
+    Everything needed to resume a survey in one request: the schema, each
+    scenario's status, the selected units with their coins, and all answers.
+    """
+    survey_response = get_survey_response(request, surveypk, responsepk)
+    if survey_response.get('status') == 'error':
+        return JsonResponse(survey_response, status=survey_response.get('status_code', 400))
+    response = survey_response.get('response')
+
+    def get_bundle():
+        survey = response.survey
+        schema = get_survey_schema(survey)
+        answers = response.get_answers()
+        return {
+            'status': 'success',
+            'status_code': 200,
+            'message': 'Survey response bundle loaded.',
+            'survey_id': survey.id,
+            'response_id': response.id,
+            'schema_version': schema['schema_version'],
+            'schema': schema,
+            'scenarios_status': response.scenarios_status(schema=schema, answers=answers),
+            'selected_unit_ids': response.get_selected_unit_ids(answers=answers),
+            'answers': answers,
+            'next_scenario_id': schema['scenarios'][0]['id'] if schema['scenarios'] else False,
+        }
+
+    # Keyed by the response version, so any saved change moves to a new entry
+    version = get_response_version(request, pk=response.pk)[0]
+    if version is None:
+        bundle = get_bundle()
+    else:
+        cache_key = 'survey_bundle_{}'.format(hashlib.md5(version.encode('utf-8')).hexdigest())
+        bundle = cache.get_or_set(cache_key, get_bundle, SURVEY_SCHEMA_CACHE_TIMEOUT)
+    # The layer picker has its own cache and version, so it is added after the bundle is cached
+    bundle['layer_groups'] = get_survey_layer_groups(response.survey)['layer_groups']
+    return JsonResponse(bundle)
+
+class SyncOperationError(Exception):
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors
+
+def get_sync_form(form, data):
+    # Only validate and save the fields the operation actually supplies
+    for field_name in list(form.fields.keys()):
+        if field_name not in data:
+            form.fields.pop(field_name)
+    if not form.is_valid():
+        raise SyncOperationError('There were errors in the form.', form.errors)
+    return form
+
+def apply_sync_operation(response, scenario, operation):
+    """
+    Apply a single queued client operation to a response's scenario. Raises
+    SyncOperationError if the operation is invalid.
+    """
+    op = operation.get('op')
+    unit_ids = operation.get('unit_ids')
+    if unit_ids is not None:
+        try:
+            unit_ids = parse_planning_unit_ids(unit_ids)
+        except (TypeError, ValueError):
+            raise SyncOperationError('Planning unit IDs must be a list of integers.')
+        missing_ids = get_invalid_planning_unit_ids(scenario, unit_ids)
+        if missing_ids:
+            raise SyncOperationError('Planning units not found in this scenario: {}'.format(
+                ', '.join(str(unit_id) for unit_id in missing_ids)
+            ))
+    if op in ['select_units', 'set_coins'] and not unit_ids:
+        raise SyncOperationError('At least one planning unit must be provided.')
+
+    if op == 'select_units':
+        if not scenario.is_spatial:
+            raise SyncOperationError('Scenario is not spatial.')
+        # Without coins, as in the planning unit form, a unit is selected by saving its answers
+        if not scenario.is_weighted:
+            raise SyncOperationError('Scenario is not weighted; select areas with save_answers.')
+        # A coin assignment is what marks a unit as selected; new ones start at the minimum
+        CoinAssignment.objects.bulk_create([
+            CoinAssignment(
+                response=response, scenario=scenario, planning_unit_id=unit_id,
+                coins_assigned=scenario.min_coins_per_pu
+            )
+            for unit_id in unit_ids
+        ], batch_size=500, ignore_conflicts=True)
+        refresh_coin_density(scenario.pk, unit_ids)
+    elif op == 'set_coins':
+        if not scenario.is_weighted:
+            raise SyncOperationError('Scenario is not weighted.')
+        try:
+            coins = int(operation.get('coins'))
+        except (TypeError, ValueError):
+            raise SyncOperationError('Coins must be an integer.')
+        if coins < scenario.min_coins_per_pu or coins > scenario.max_coins_per_pu:
+            raise SyncOperationError('Coins per area must be between {} and {}.'.format(
+                scenario.min_coins_per_pu, scenario.max_coins_per_pu
+            ))
+        upsert_coin_assignments(response, scenario, unit_ids, coins)
+    elif op == 'save_answers':
+        answers = operation.get('answers') or {}
+        if unit_ids is None:
+            data = {
+                f'scenario_{scenario.id}_question_{question_id}': value
+                for question_id, value in answers.items()
+            }
+            form = get_sync_form(ScenarioForm(data, response=response, scenario=scenario), data)
+        else:
+            data = {
+                f'scenario_{scenario.id}_pu_question_{question_id}': value
+                for question_id, value in answers.items()
+            }
+            data[f'scenario_{scenario.id}_planning_unit_ids'] = ','.join(str(unit_id) for unit_id in unit_ids)
+            if 'coins' in operation:
+                data[f'scenario_{scenario.id}_coin_assignment'] = operation['coins']
+            form = get_sync_form(PlanningUnitForm(data, response=response, scenario=scenario), data)
+        form.save_answers(response, scenario)
+    elif op == 'delete_areas':
+        delete_selected_planning_units(response, scenario, unit_ids)
+    else:
+        raise SyncOperationError('Unknown operation: {}'.format(op))
+
+@login_required
+def survey_response_sync(request, response_id):
+    if request.method != 'POST':
+        return JsonResponse({
+            'status': 'error',
+            'status_code': 405,
+            'message': 'Invalid request method. Only POST requests are allowed.'
+        }, status=405)
+    access = get_response_access(request.user, response_id)
+    if access is None:
+        return JsonResponse({
+            'status': 'error',
+            'status_code': 404,
+            'message': 'Survey response not found.'
+        }, status=404)
+    error = get_response_access_error(access)
+    if error is not None:
+        return JsonResponse(error, status=error['status_code'])
+    response = access['response']
+    try:
+        operations = json.loads(request.body)['operations']
+        if not isinstance(operations, list) or not all(isinstance(x, dict) for x in operations):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({
+            'status': 'error',
+            'status_code': 400,
+            'message': 'Request body must be a JSON object with a list of operations.'
+        }, status=400)
+
+    scenarios = access['scenarios']
+    keys = [str(operation.get('key') or '') for operation in operations]
+    results = []
+    touched_scenario_ids = []
+    index = None
+    try:
+        with transaction.atomic():
+            applied_keys = set(SyncOperation.objects.filter(
+                response=response, key__in=keys
+            ).values_list('key', flat=True))
+            new_operations = []
+            for index, operation in enumerate(operations):
+                key = keys[index]
+                if not key:
+                    raise SyncOperationError('Every operation needs an idempotency key.')
+                if key in applied_keys:
+                    results.append({'key': key, 'status': 'duplicate'})
+                    continue
+                try:
+                    scenario = scenarios.get(int(operation.get('scenario_id')))
+                except (TypeError, ValueError):
+                    scenario = None
+                if scenario is None:
+                    raise SyncOperationError('Scenario not found in this survey.')
+
+                apply_sync_operation(response, scenario, operation)
+
+                applied_keys.add(key)
+                new_operations.append(SyncOperation(response=response, key=key, operation=operation.get('op')))
+                results.append({'key': key, 'status': 'applied'})
+                if scenario.id not in touched_scenario_ids:
+                    touched_scenario_ids.append(scenario.id)
+
+            # Enforce the coin limits on the final state rather than per operation
+            for scenario_id in touched_scenario_ids:
+                scenario = scenarios[scenario_id]
+                if not scenario.is_weighted:
+                    continue
+                coins = CoinAssignment.objects.filter(
+                    response=response, scenario=scenario
+                ).aggregate(total=Sum('coins_assigned'), lowest=Min('coins_assigned'), highest=Max('coins_assigned'))
+                index = None
+                if (coins['total'] or 0) > scenario.total_coins:
+                    raise SyncOperationError('More coins assigned than available in scenario {}.'.format(scenario.name))
+                if coins['lowest'] is not None and (
+                    coins['lowest'] < scenario.min_coins_per_pu or coins['highest'] > scenario.max_coins_per_pu
+                ):
+                    raise SyncOperationError('Coins per area must be between {} and {} in scenario {}.'.format(
+                        scenario.min_coins_per_pu, scenario.max_coins_per_pu, scenario.name
+                    ))
+
+            SyncOperation.objects.bulk_create(new_operations)
+            if len(new_operations) > 0:
+                response.save()
+    except SyncOperationError as e:
+        return JsonResponse({
+            'status': 'error',
+            'status_code': 400,
+            'message': str(e),
+            'errors': e.errors,
+            'operation_index': index,
+            'operation_key': keys[index] if index is not None else None
+        }, status=400)
+    except IntegrityError:
+        # Another request applied some of these keys concurrently; retrying will skip them
+        return JsonResponse({
+            'status': 'error',
+            'status_code': 409,
+            'message': 'Operations were applied concurrently. Please retry.'
+        }, status=409)
+
+    return JsonResponse({
+        'status': 'success',
+        'status_code': 200,
+        'message': 'Operations applied successfully.',
+        'response_id': response.id,
+        'survey_id': response.survey.id,
+        'results': results,
+        'scenarios_status': {
+            scenario_id: response.scenario_status(scenario_id) for scenario_id in touched_scenario_ids
+        }
+    })
+
+def get_coin_density_scenario(request, scenario_id):
+    """
+    Return (scenario, error response) for the results map endpoints, which
+    expose aggregates across all respondents and so are limited to staff.
+    """
+    if not request.user.is_staff:
+        return None, JsonResponse({
+            'status': 'error',
+            'status_code': 403,
+            'message': 'Only staff can view survey results.'
+        }, status=403)
+    try:
+        return Scenario.objects.get(pk=scenario_id), None
+    except Scenario.DoesNotExist:
+        return None, JsonResponse({
+            'status': 'error',
+            'status_code': 404,
+            'message': 'Scenario not found.'
+        }, status=404)
+
+@login_required
+def scenario_coin_density(request, scenario_id):
+    """
+    Return the materialised coin density of every selected planning unit in
+    a scenario as compact rows.
+    """
+    scenario, error = get_coin_density_scenario(request, scenario_id)
+    if error is not None:
+        return error
+
+    fields = ['planning_unit_id', 'total_coins', 'respondent_count', 'mean_coins']
+    rows = CoinDensity.objects.filter(scenario=scenario).order_by('planning_unit_id').values_list(*fields)
+    response = JsonResponse({
+        'status': 'success',
+        'status_code': 200,
+        'scenario_id': scenario.pk,
+        'fields': fields,
+        'units': [list(row) for row in rows]
+    })
+    patch_cache_control(response, private=True, max_age=60)
+    return response
+
+@login_required
+def scenario_coin_density_tile(request, scenario_id, z, x, y):
+    """Serve a scenario's coin density as a vector tile for the results map."""
+    scenario, error = get_coin_density_scenario(request, scenario_id)
+    if error is not None:
+        return error
+
+    z, x, y = int(z), int(x), int(y)
+    if z > 24 or x >= 2 ** z or y >= 2 ** z:
+        return JsonResponse({
+            'status': 'error',
+            'status_code': 400,
+            'message': 'Invalid tile coordinates.'
+        }, status=400)
+
+    response = HttpResponse(
+        get_coin_density_tile(scenario.pk, z, x, y),
+        content_type='application/vnd.mapbox-vector-tile'
+    )
+    patch_cache_control(response, private=True, max_age=60)
+    return response
+
+@login_required
+def survey_option_counts(request, surveypk):
+    """
+    Return how many respondents chose each option of the survey's choice
+    questions, for the results dashboards.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({
+            'status': 'error',
+            'status_code': 403,
+            'message': 'Only staff can view survey results.'
+        }, status=403)
+    try:
+        survey = Survey.objects.get(pk=surveypk)
+    except Survey.DoesNotExist:
+        return JsonResponse({
+            'status': 'error',
+            'status_code': 404,
+            'message': 'Survey does not exist.'
+        }, status=404)
+
+    # ?options=1,2 counts only those options, for dashboards following a few of them
+    option_ids = None
+    if request.GET.get('options'):
+        try:
+            option_ids = parse_planning_unit_ids(request.GET['options'])
+        except ValueError:
+            return JsonResponse({
+                'status': 'error',
+                'status_code': 400,
+                'message': 'Invalid option IDs.'
+            }, status=400)
+
+    response = JsonResponse({
+        'status': 'success',
+        'status_code': 200,
+        'survey_id': survey.pk,
+        'option_counts': get_survey_option_counts(survey, option_ids)
+    })
+    patch_cache_control(response, private=True, max_age=60)
+    return response
+
+@login_required
+def survey_question_summaries(request, surveypk):
+    """
+    Return the precomputed answer summaries of the survey's questions: response
+    and option counts, and numeric statistics and histograms.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({
+            'status': 'error',
+            'status_code': 403,
+            'message': 'Only staff can view survey results.'
+        }, status=403)
+    try:
+        survey = Survey.objects.get(pk=surveypk)
+    except Survey.DoesNotExist:
+        return JsonResponse({
+            'status': 'error',
+            'status_code': 404,
+            'message': 'Survey does not exist.'
+        }, status=404)
+
+    response = JsonResponse({
+        'status': 'success',
+        'status_code': 200,
+        'survey_id': survey.pk,
+        'summaries': get_survey_question_summaries(survey)
+    })
+    patch_cache_control(response, private=True, max_age=60)
+    return response
+
+class LayerAutocomplete(autocomplete.Select2QuerySetView):
+    """
+    Paginated layer search for the layer picker of the survey admin, so the
+    inline forms only load the layer they have selected.
+    """
+    paginate_by = 20
+
+    def get_queryset(self):
+        if not self.request.user.is_staff:
+            return Layer.all_objects.none()
+        layers = Layer.all_objects.order_by('name', 'pk')
+        if self.q:
+            layers = layers.filter(name__icontains=self.q)
+        return layers